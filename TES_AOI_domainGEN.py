@@ -2,14 +2,16 @@
 
 import netCDF4 as nc
 import numpy as np
-from pyproj import Transformer
 #import matplotlib.pyplot as plt
-from scipy.spatial import cKDTree
 import pandas as pd
 import sys, os
 
 from datetime import datetime
 
+from aoi_gather import create_variable_like, gather_chunk
+from aoi_gridindex import load_grid_index, report_missing
+from aoi_kdtree import load_point_index, write_rejected_points
+
 # Get current date
 current_date = datetime.now()
 # Format date to mmddyyyy
@@ -29,10 +31,29 @@ def read_gridcells(file_name):
         df = pd.read_csv(file_name, sep=" ")
     return df
 
-def find_nearest_points(listA, listB):
-    tree = cKDTree(np.array(listB))
-    _, indices = tree.query(listA, k=1)
-    return indices
+def _filter_points(point_index, AOI_points_arr, names, output_path, AOI, domain_name, limit=10):
+    """Nearest-cell rows of the points inside the domain; rejected points go to <AOI>_rejected_points.csv.
+
+    env AOI_POINT_TOLERANCE (in the units of the coordinates) also rejects points whose
+    nearest cell centre is farther away than that.
+    """
+    tolerance = os.environ.get('AOI_POINT_TOLERANCE')
+    tolerance = float(tolerance) if tolerance else None
+    kept, reasons, dist, rows = point_index.filter(AOI_points_arr, tolerance)
+    rejected = np.flatnonzero(~kept)
+    for i in rejected[:limit]:
+        pt_x, pt_y = AOI_points_arr[i]
+        if reasons[i] == 'outside_domain':
+            print(f"point {i} ({pt_x},{pt_y}) is out of {domain_name} domain and is removed")
+        else:
+            print(f"point {i} ({pt_x},{pt_y}) is {dist[i]} from the nearest cell (> {tolerance}) and is removed")
+    if rejected.size:
+        csv_path = output_path + '/' + str(AOI) + '_rejected_points.csv'
+        write_rejected_points(csv_path, AOI_points_arr, kept, reasons, dist, names)
+        print(f"{rejected.size} of {len(AOI_points_arr)} points removed; listed in {csv_path}")
+
+    print("AOI_points_arr", AOI_points_arr[kept][0:5], "shape", AOI_points_arr[kept].shape)
+    return rows[kept]
 
 def main():
 
@@ -77,7 +98,6 @@ def main():
         os.remove(AOIdomain)
 
     source_file = './domain.lnd.TES_SE.4km.1d.nc'
-    dst = nc.Dataset(AOIdomain, 'w', format='NETCDF3_64BIT')
 
     # open the 1D domain data
     src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
@@ -98,94 +118,59 @@ def main():
 
         # read gridIDs
         TES_gridIDs = src.variables['gridID'][:]
-        TES_gridcell_list = list(TES_gridIDs)
-        print(TES_gridcell_list[0:5])
-
-        domain_idx = np.where(np.in1d(TES_gridcell_list, AOI_points))[0]
+        print(np.ravel(TES_gridIDs)[0:5])
 
-        TES_gridcell_arr = np.array(TES_gridIDs)
-        AOI_points_arr = np.array(AOI_points)
+        # sorted gridID index of the base domain, kept as a .npy sidecar next to it
+        grid_index = load_grid_index(TES_gridIDs, source_file)
+        domain_idx = grid_index.rows(AOI_points)
+        report_missing(grid_index.missing(AOI_points), AOI,
+                       output_path + '/' + str(AOI) + '_missing_gridIDs.csv')
 
     if user_option == 2: # use lat lon coordinates
         #AOI_gridcell_file = AOI+'_xcyc.csv'  # user provided gridcell csv file  (xc, yc) (lon, lat)
         df = pd.read_csv(AOI_gridcell_file, sep=",", skiprows=1, names = ['xc', 'yc'], engine='python')
 
         #read in x, y coordinate (lon, lat)
-        AOI_points = list(zip(df['xc'], df['yc']))
-        #AOI_points = list(zip(myxc, myyc))
-        
-        # read yc, xc (y, x)
-        TES_yc = src.variables['yc'][:]
-        TES_xc = src.variables['xc'][:]
-        # create list for all land gridcell (lat, lon)
-        TES_gridcell_list = list(zip(TES_xc, TES_yc))
- 
-        # find the xc, yc boundary
-        TES_xc_max, TES_xc_min = np.max(TES_xc), np.min(TES_xc)
-        TES_yc_max, TES_yc_min = np.max(TES_yc), np.min(TES_yc)
-
-        #check the boundaries
-        for i, pt in enumerate(AOI_points):
-            pt_x, pt_y = pt
-            #print (pt_x, TE_xc_min, TES_xc_min.shape)
-            if pt_x > TES_xc_max or pt_x < TES_xc_min or pt_y > TES_yc_max or pt_y < TES_yc_min:
-                AOI_points.remove(pt)
-                print(f"point {i} ({pt_x},{pt_y}) is out of Daymet domain and is removed")
-
-
-        AOI_points_arr = np.array(AOI_points)
-        print("AOI_points_arr", AOI_points_arr[0:5], "shape", AOI_points_arr.shape)
-        TES_gridcell_arr = np.squeeze(np.array(TES_gridcell_list)).transpose()    
-        print("TES_gridcell_arr", TES_gridcell_arr[0:5], "shape", TES_gridcell_arr.shape)
-
-        tree = cKDTree(TES_gridcell_arr)
-        _, domain_idx = tree.query(AOI_points_arr, k=1)
+        AOI_points_arr = np.column_stack([df['xc'], df['yc']]).astype(np.float64)
+
+        # KD-tree over all land gridcell (lon, lat), cached next to the base domain
+        point_index = load_point_index(source_file, 'xc', 'yc')
+
+        # drop points out of the Daymet domain (or farther than AOI_POINT_TOLERANCE from a cell)
+        domain_idx = _filter_points(point_index, AOI_points_arr, ('xc', 'yc'), output_path, AOI, 'Daymet')
 
     if user_option == 3: # xc_LCC and yc_LCC is used directly
         #AOI_gridcell_file = AOI+'_XYLCC.csv'  # user provided gridcell csv file  (xc_LCC, yc_LCC) 
         df = pd.read_csv(AOI_gridcell_file, sep=",", skiprows=1, names = ['xc_LCC', 'yc_LCC'], engine='python')
 
         #read in x, y coordinate (in LCC projection)
-        AOI_points = list(zip(df['xc_LCC'], df['yc_LCC']))
-        #AOI_points = list(zip(myxc_lcc, myyc_lcc))
-
-        # read yc_LCC, xc_LCC (y, x in LCC)
-        TES_yc_LCC = src.variables['yc_LCC'][:]
-        TES_xc_LCC = src.variables['xc_LCC'][:]
+        AOI_points_arr = np.column_stack([df['xc_LCC'], df['yc_LCC']]).astype(np.float64)
 
-        # create list for all land gridcell (lat, lon)
-        TES_gridcell_list = list(zip(TES_xc_LCC, TES_yc_LCC))
+        # KD-tree over all land gridcell (x, y in LCC), cached next to the base domain
+        point_index = load_point_index(source_file, 'xc_LCC', 'yc_LCC')
 
-
-        # find the xc, yc boundary
-        TES_xc_LCC_max, TES_xc_LCC_min = np.max(TES_xc_LCC), np.min(TES_xc_LCC)
-        TES_yc_LCC_max, TES_yc_LCC_min = np.max(TES_yc_LCC), np.min(TES_yc_LCC)
-
-        #check the boundaries
-        for i, pt in enumerate(AOI_points):
-            pt_x, pt_y = pt
-            #print (pt_x, TES_xc_LCC_min, TES_xc_LCC_min.shape)
-            if pt_x > TES_xc_LCC_max or pt_x < TES_xc_LCC_min or pt_y > TES_yc_LCC_max or pt_y < TES_yc_LCC_min:
-                AOI_points.remove(pt)
-                print(f"point {i} ({pt_x},{pt_y}) is out of TES domain and is removed")
-
-        AOI_points_arr = np.array(AOI_points)
-        print("AOI_points_arr", AOI_points_arr[0:5], "shape", AOI_points_arr.shape)
-        TES_gridcell_arr = np.squeeze(np.array(TES_gridcell_list)).transpose()    
-        print("TES_gridcell_arr", TES_gridcell_arr[0:5], "shape", TES_gridcell_arr.shape)
-
-        tree = cKDTree(TES_gridcell_arr)
-        _, domain_idx = tree.query(AOI_points_arr, k=1)
-
-    AOI_mask = np.isin(TES_gridcell_arr, AOI_points_arr)
+        # drop points out of the TES domain (or farther than AOI_POINT_TOLERANCE from a cell)
+        domain_idx = _filter_points(point_index, AOI_points_arr, ('xc_LCC', 'yc_LCC'), output_path, AOI, 'TES')
 
     domain_idx = np.sort(domain_idx)
 
     print("gridID_idx", domain_idx.shape, domain_idx[0:20])
+    if domain_idx.size == 0:
+        # a zero-length ni would be created as an unlimited dimension; nothing to write anyway
+        src.close()
+        sys.exit(f"Error: no {AOI} cell is in the TES domain, so no domain file is written; "
+                 f"the rejected points or missing gridIDs are listed in {output_path}")
+
+    dst = nc.Dataset(AOIdomain, 'w', format='NETCDF3_64BIT')
     
     #if not user_option==1:
     #    np.savetxt("AOI_gridId.csv", src['gridID'][...,domain_idx], delimiter=",", fmt='%d\n')
 
+    # AOI_RAW_IO=1: copy values in their on-disk dtype without auto mask/scale
+    raw = os.environ.get('AOI_RAW_IO', '0') == '1'
+    if raw:
+        src.set_auto_maskandscale(False)
+
     # Copy the global attributes from the source to the target
     for name in src.ncattrs():
         dst.setncattr(name, src.getncattr(name))
@@ -198,13 +183,13 @@ def main():
         else:
             # Update the 'ni' dimension with the length of the list
             #dst.dimensions['ni'].set_length(len(AOI_points))
-            ni = dst.createDimension("ni", len(AOI_points))
+            ni = dst.createDimension("ni", domain_idx.size)
 
     # Copy the variables from the source to the target
     for name, variable in src.variables.items():
         if (name == 'lon' or name == 'lat'): continue
 
-        x = dst.createVariable(name, variable.datatype, variable.dimensions)   
+        x = create_variable_like(dst, name, variable, raw=raw)
         print(name, variable.dimensions)
         
         if (name != 'lambert_conformal_conic'):
@@ -227,14 +212,8 @@ def main():
                 print("subsetting source data"+str(source_data.shape))                
                 #data_arr = np.copy(source_data[...,AOI_mask]).reshape(d0,d1,ni)   
 
-                source_data = np.reshape(source_data, (d0, d2))  # reshape source_data into (4,ni)
-                #AOI_data = np.copy(source_data[..., AOI_mask])  # mask out the source data with AOI_mask
-    
-                # put the masked result into an array of (m,1, AOI_points)
-                data_arr = np.empty((d0, d1, len(AOI_points)))
-                for i in range(d0):
-                    AOI_data = np.copy(source_data[i, domain_idx])  # mask out the source data with AOI_mask  
-                    data_arr[i, 0, :] = AOI_data[:]
+                # gather all layers at once into an array of (m,1, AOI_points) in the source dtype
+                data_arr = gather_chunk(source_data, domain_idx)
 
                 print("putting back data into netcdf"+ str(data_arr.shape))
                 dst[name][...] = data_arr
@@ -242,6 +221,7 @@ def main():
 
 # Copy the variable attributes
         for attr_name in variable.ncattrs():
+            if raw and attr_name == '_FillValue': continue  # already set at creation
             dst[name].setncattr(attr_name, variable.getncattr(attr_name))
 
     dst.title = '1D domain for '+ AOI +', generated on ' +formatted_date + ' with ' + source_file
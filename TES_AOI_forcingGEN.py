@@ -8,26 +8,38 @@ import pandas as pd
 from time import process_time
 from datetime import datetime
 
+from aoi_chunking import DEFAULT_CHUNK_SIZE, chunk_size_for_budget, parse_size, read_dtype
+from aoi_gather import create_variable_like, gather_chunk
+from aoi_gridindex import load_grid_index, report_missing
+
 # Get current date
 current_date = datetime.now()
 # Format date to mmddyyyy
 formatted_date = current_date.strftime('%y%m%d')
 
-def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path):
+def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path, stream=True, raw=False):
+    # stream=True writes every subsetted time chunk to its hyperslab right away (memory bounded
+    # by chunk_size); stream=False stages the whole variable and writes it once at the end
+    # raw=True disables auto mask/scale so values are copied in their on-disk dtype unchanged
     # Open a new NetCDF file to write the data to. For format, you can choose from
     # 'NETCDF3_CLASSIC', 'NETCDF3_64BIT', 'NETCDF4_CLASSIC', and 'NETCDF4'
     source_file = input_path + '/'+ file
     print ("Opening source file: ", source_file)
     src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
+    if raw:
+        src.set_auto_maskandscale(False)
     
     #read gridIDs
     grid_ids = src['gridID'][...]    # gridID for all TES
  
-    #  
-    AOI_idx = np.where(np.in1d(grid_ids, AOI_points))[0]
-    
-    AOI_mask = np.isin(grid_ids, AOI_points)
-    #print(grid_ids.shape,AOI_points.shape, AOI_mask.shape)
+    # sorted AOI positions along ni/gridcell, reused by every variable and chunk
+    grid_index = load_grid_index(grid_ids)
+    AOI_idx = grid_index.rows(AOI_points)
+    report_missing(grid_index.missing(AOI_points), AOI)
+    if AOI_idx.size == 0:
+        # a zero-length ni/gridcell would be created as an unlimited dimension
+        src.close()
+        sys.exit(f"Error: no {AOI} gridID is in {source_file}")
     
     # create the new_filename
     dst_name = output_path + '/'+ AOI + '_'+file
@@ -55,11 +67,11 @@ def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path):
             # Update the 'ni' dimension with the length of the list
             #dst.dimensions['ni'].set_length(len(AOI_points))
             if name == 'ni' or name == 'gridcell': 
-                ni = dst.createDimension(name, AOI_points.size)
+                ni = dst.createDimension(name, AOI_idx.size)
 
     # Copy the variables from the source to the target
     for name, variable in src.variables.items():
-        x = dst.createVariable(name, variable.datatype, variable.dimensions)   
+        x = create_variable_like(dst, name, variable, raw=raw)
         print(name, variable.dimensions)
         
         if (name != 'lambert_conformal_conic'):
@@ -75,13 +87,16 @@ def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path):
                 d1 = variable.shape[1]
                 d2 = variable.shape[2]
 
-                chunk_size = 16  # Adjust this value based on your system's memory capacity and performance
-                                 #  4  320 second, 8: 205 seconds, 16: 
+                # time steps per chunk: derived from FORCING_MEM_BUDGET (e.g. 2G) when set
+                chunk_size = DEFAULT_CHUNK_SIZE
+                if os.environ.get('FORCING_MEM_BUDGET'):
+                    chunk_size = chunk_size_for_budget(variable.shape, read_dtype(variable, raw),
+                                                       AOI_idx.size, parse_size(os.environ['FORCING_MEM_BUDGET']),
+                                                       stream=stream, masked=not raw)
                 num_chunks = d0 // chunk_size + (d0 % chunk_size > 0)
                 
-                data_arr = np.empty((d0, d1, AOI_points.shape[1]))
-                
-                #print('data_arr.shape:' + str(data_arr.shape))
+                data_arr = None
+                chunk_arr = None
                 
                 for chunk in range(num_chunks):
                     start = chunk * chunk_size
@@ -93,13 +108,21 @@ def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path):
 
                 
                     print(f"Subsetting source data for chunk {chunk + 1} of {num_chunks}")
-                    for i in range(start, end):
-                        AOI_data = np.copy(source_data[i - start, AOI_mask])  # mask out the source data with AOI_mask  
-                        #print('data_arr[i,0,:].shape:' + str(data_arr[i, 0, :].shape) + str(AOI_data.shape))
-                        data_arr[i, :, :] = AOI_data[:]
+                    dtype = np.ma.getdata(source_data).dtype
+                    if stream:
+                        if chunk_arr is None:
+                            chunk_arr = np.empty((chunk_size, d1, AOI_idx.size), dtype=dtype)
+                        gather_chunk(source_data, AOI_idx, out=chunk_arr[:end - start])
+                        dst[name][start:end, :, :] = chunk_arr[:end - start]
+                    else:
+                        if data_arr is None:
+                            data_arr = np.empty((d0, d1, AOI_idx.size), dtype=dtype)
+                        # gather the whole time chunk with one indexed take, straight into data_arr
+                        gather_chunk(source_data, AOI_idx, out=data_arr[start:end])
                 
-                print("Putting back data into netcdf")
-                dst[name][...] = data_arr
+                if not stream:
+                    print("Putting back data into netcdf")
+                    dst[name][...] = data_arr
            
         # Copy the variable attributes
         for attr_name in variable.ncattrs():
@@ -153,6 +176,7 @@ def main():
     '''
 
     AOI_gridID_file = AOI_gridID_path + AOI_gridID_file
+    raw = os.environ.get('AOI_RAW_IO', '0') == '1'  # copy values in their on-disk dtype
     
     if (AOI_gridID_file.endswith('.csv')):
         #AOI_gridcell_file = AOI+'_gridID.csv'  # user provided gridcell IDs
@@ -198,7 +222,7 @@ def main():
                 #forcing_save_1dTES(root, file, var_name, period, time, new_dir)
 
                 start = process_time() 
-                AOI_forcing_save_1d(root, file, AOI, AOI_points, new_dir)
+                AOI_forcing_save_1d(root, file, AOI, AOI_points, new_dir, raw=raw)
                 end = process_time()
                 print("Generating 1D forcing data for "+AOI+ " domain takes {}".format(end-start))
 
@@ -1,13 +1,35 @@
 
 # TES_AOI_forcingGEN_mpi: MPI-parallel (with local multiprocessing fallback) forcing subsetting
 
+import argparse
+import fnmatch
+import multiprocessing
 import os, sys
+import queue
+import threading
+from functools import reduce
 import netCDF4 as nc
 import numpy as np
 import pandas as pd
-from time import process_time
+import socket
+from time import perf_counter, sleep
 from datetime import datetime
 
+from aoi_catalog import ForcingCatalog, archive_files
+from aoi_cdf import MappedVariable, open_mapped
+from aoi_cellstore import CellStore, is_cell_major
+from aoi_chunking import (DEFAULT_CHUNK_SIZE, calibrate_chunk_size, chunk_size_for_budget, parse_size,
+                          read_dtype)
+from aoi_failures import failed_keys, failure_record, write_report
+from aoi_gather import create_variable_like, gather_chunk, plan_slabs, read_slabs, slab_positions
+from aoi_gridindex import load_grid_index, report_missing
+from aoi_index_cache import AOIIndexCache
+from aoi_manifest import ForcingManifest
+from aoi_output import OUTPUT_FORMATS, OutputLayout, output_shape
+from aoi_staging import StagingArea
+from aoi_telemetry import FileTelemetry, TelemetryLog
+from aoi_tiles import TileArchive
+
 # Try MPI first
 try:
     from mpi4py import MPI  # type: ignore
@@ -23,100 +45,648 @@ except Exception:
 
 # Local CPU fallback
 try:
-    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 except Exception:
     ProcessPoolExecutor = None
-    as_completed = None
 
 
 # Get current date
 current_date = datetime.now()
 formatted_date = current_date.strftime('%y%m%d')
 
+# netCDF-C is not thread-safe: every library call made while a prefetch thread is alive
+# goes through this lock (netCDF4-python still releases the GIL inside the C read)
+_NC_LOCK = threading.Lock()
 
-def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path):
-    os.makedirs(output_path, exist_ok=True)
 
-    source_file = input_path + '/' + file
-    print("Opening source file: ", source_file)
-    src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
+class AOITarget:
+    """One AOI cut from every source file: its name, gridIDs, output tree, index cache and manifest.
 
-    grid_ids = src['gridID'][...]  # global gridID array
+    final_path is the output tree the files are published to when output_path is a staging directory.
+    """
 
-    AOI_idx = np.where(np.in1d(grid_ids, AOI_points))[0]
-    AOI_mask = np.isin(grid_ids, AOI_points)
+    def __init__(self, AOI, AOI_points, output_path, index_cache=None, manifest=None, final_path=None):
+        self.AOI = AOI
+        self.AOI_points = AOI_points
+        self.output_path = output_path
+        self.index_cache = index_cache
+        self.manifest = manifest
+        self.final_path = final_path
 
-    dst_name = output_path + '/' + AOI + '_' + file
-    print("Generating AOI file: ", dst_name)
+    def dst_name(self, subdir, file):
+        return os.path.join(self.output_path, subdir) + '/' + self.AOI + '_' + file
 
-    if os.path.exists(dst_name):
-        os.remove(dst_name)
+    def final_name(self, subdir, file):
+        if self.final_path is None:
+            return self.dst_name(subdir, file)
+        return os.path.join(self.final_path, subdir) + '/' + self.AOI + '_' + file
 
-    dst = nc.Dataset(dst_name, 'w', format='NETCDF3_64BIT')
-    dst.title = dst_name + ' created from ' + source_file + ' on ' + formatted_date
+    def indices(self, grid_ids):
+        """Return (AOI_idx, gridID layout fingerprint or None without an index cache)."""
+        if self.index_cache is not None:
+            return self.index_cache.lookup(grid_ids)
+        grid_index = load_grid_index(grid_ids)
+        report_missing(grid_index.missing(self.AOI_points), self.AOI)
+        return grid_index.rows(self.AOI_points), None
 
-    # Copy global attrs
-    for name in src.ncattrs():
-        dst.setncattr(name, src.getncattr(name))
 
-    # Copy dimensions (override ni/gridcell to AOI size)
-    for name, dimension in src.dimensions.items():
-        if name != 'ni' and name != 'gridcell':
-            dst.createDimension(name, (len(dimension) if not dimension.isunlimited() else None))
-        else:
-            dst.createDimension(name, AOI_points.size)
+def _read_chunks(variable, chunk_size, prefetch=0, slabs=None):
+    """Yield (start, end, data) time chunks of a 3D source variable.
+
+    With slabs (see aoi_gather.plan_slabs) only those cell ranges are read and data holds
+    their concatenation; otherwise each chunk spans the full cell dimension.
+
+    With prefetch > 0 a background thread reads ahead into a queue of at most `prefetch`
+    chunks, so the next chunk is read while the current one is subset and written; at most
+    prefetch + 2 chunks are in memory. prefetch=0 reads each chunk when it is needed.
+    """
+    d0 = variable.shape[0]
+    bounds = [(start, min(start + chunk_size, d0)) for start in range(0, d0, chunk_size)]
+
+    def read(start, end):
+        if slabs is None:
+            return variable[start:end, :, :]
+        return read_slabs(variable, start, end, slabs)
+
+    if prefetch <= 0:
+        for start, end in bounds:
+            yield start, end, read(start, end)
+        return
+
+    chunks = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for start, end in bounds:
+                if stop.is_set():
+                    return
+                with _NC_LOCK:
+                    data = read(start, end)
+                chunks.put((start, end, data))  # blocks while the queue is full
+        except BaseException as e:
+            chunks.put(e)
+            return
+        chunks.put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # unblock a reader that is waiting on a full queue, then let it finish
+        stop.set()
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _close_quietly(handles):
+    """Close the datasets, memory maps and chunk readers a failed attempt left open."""
+    for handle in handles:
+        if handle is None:
+            continue
+        try:
+            handle.close()
+        except Exception:
+            pass  # already closed, or failing to close: the original exception is the one to report
+
+
+def _plan_reads(variable, outputs, slab_gap, raw):
+    """Return (slabs, per-target AOI positions in the data read) for one 3D variable.
+
+    slabs is None (full-width reads) when slab_gap is None; otherwise it covers the AOI cells
+    of every target and the positions are remapped into the concatenated slabs.
+    """
+    AOI_idx_list = [AOI_idx for AOI_idx, _ in outputs]
+    union = AOI_idx_list[0] if len(AOI_idx_list) == 1 else reduce(np.union1d, AOI_idx_list)
+    if slab_gap is None or union.size == 0:
+        return None, AOI_idx_list
+    slabs = plan_slabs(union, read_dtype(variable, raw).itemsize, slab_gap)
+    return slabs, [slab_positions(AOI_idx, slabs) for AOI_idx in AOI_idx_list]
+
+
+def _variable_chunk_size(variable, outputs, chunk_size, mem_budget, prefetch, stream, raw, width=None,
+                         default=DEFAULT_CHUNK_SIZE):
+    """Time-chunk length for one 3D variable reading `width` cells per step (see AOI_forcing_save_multi).
+
+    default is the length used without chunk_size and mem_budget.
+    """
+    if mem_budget is None:
+        return chunk_size or default
+    d0, d1, d2 = variable.shape
+    n_aoi = max(AOI_idx.size for AOI_idx, _ in outputs)
+    budget_size = chunk_size_for_budget((d0, d1, width or d2), read_dtype(variable, raw), n_aoi, mem_budget,
+                                        prefetch, len(outputs), stream, masked=not raw)
+    return min(chunk_size, budget_size) if chunk_size else budget_size
+
+
+def AOI_forcing_save_1d(input_path, file, AOI, AOI_points, output_path, stream=True, raw=False,
+                        index_cache=None, reader='netcdf4'):
+    """Subset one source forcing file to the AOI cells.
+
+    stream=True writes each subsetted time chunk of a 3D variable to its hyperslab in the
+    output as soon as it is ready, so peak memory is bounded by chunk_size rather than by
+    the file length. stream=False stages the whole variable and writes it once at the end.
+
+    raw=True turns off netCDF4 auto mask/scale on both files: values are gathered in the
+    on-disk dtype (e.g. packed int16) and written back unchanged, with _FillValue kept.
+
+    index_cache (an AOIIndexCache) resolves the AOI indices by gridID-layout fingerprint
+    instead of testing set membership against the full gridID vector for every file.
+
+    reader='mmap' reads 3D variables from a memory map of the file (see AOI_forcing_save_multi).
+    """
+    AOI_forcing_save_multi(input_path, file, [AOITarget(AOI, AOI_points, output_path, index_cache)],
+                           stream=stream, raw=raw, reader=reader)
+
+
+def AOI_forcing_save_multi(input_path, file, targets, subdir='', stream=True, raw=False, prefetch=0,
+                           chunk_size=None, mem_budget=None, telemetry=None, slab_gap=None, tiles=None,
+                           cell_store=None, output=None, reader='netcdf4', source_stat=None):
+    """Subset one source forcing file to several AOIs from a single read of the source.
 
-    # Copy variables with subsetting on last dim
-    for name, variable in src.variables.items():
-        x = dst.createVariable(name, variable.datatype, variable.dimensions)
-        print(name, variable.dimensions)
+    Every variable, and every time chunk of a 3D variable, is read once and the gathered
+    subset is written to <target.output_path>/<subdir>/<target.AOI>_<file> for each
+    AOITarget in `targets`. stream and raw behave as in AOI_forcing_save_1d; prefetch is
+    the read-ahead queue depth for 3D variables (see _read_chunks).
 
-        if name != 'lambert_conformal_conic':
-            if (variable.dimensions[-1] != 'ni') and (variable.dimensions[-1] != 'gridcell'):
-                dst[name][...] = src[name][...]
+    chunk_size fixes the time-chunk length of 3D variables; mem_budget (bytes per rank)
+    derives it per variable from shape, dtype and AOI size, and caps an explicit chunk_size.
+    With neither, DEFAULT_CHUNK_SIZE is used.
 
-            elif len(variable.dimensions) == 2:
-                dst[name][...] = src[name][:, AOI_idx]
+    slab_gap (bytes) turns on slab reads for 3D variables: only the cell ranges covering the
+    AOI cells are read, with gaps up to slab_gap bytes read through (see aoi_gather.plan_slabs).
+    None reads the full cell dimension.
 
-            elif len(variable.dimensions) == 3:
-                d0, d1, d2 = variable.shape
-                chunk_size = 16
-                num_chunks = d0 // chunk_size + (d0 % chunk_size > 0)
-                data_arr = np.empty((d0, d1, AOI_points.shape[1]))
+    tiles (an aoi_tiles.TileArchive with selected tiles) replaces the source file by a view
+    over the tiles holding AOI cells, when the file was tiled and has not changed since.
 
-                for chunk in range(num_chunks):
-                    start = chunk * chunk_size
-                    end = min((chunk + 1) * chunk_size, d0)
-                    print(f"Reading source data for chunk {chunk + 1} of {num_chunks}")
-                    source_data = src[name][start:end, :, :]
+    cell_store (an aoi_cellstore.CellStore) is used first, for files it holds unchanged: its
+    3D variables are read cell-major, only the chunks holding AOI cells. Each HDF5 chunk holds
+    whole time series, so they are read over the whole time axis unless chunk_size or
+    mem_budget asks for less.
 
-                    print(f"Subsetting source data for chunk {chunk + 1} of {num_chunks}")
-                    for i in range(start, end):
-                        AOI_data = np.copy(source_data[i - start, AOI_mask])
-                        data_arr[i, :, :] = AOI_data[:]
+    output (an aoi_output.OutputLayout) selects the output format and, for NETCDF4_CLASSIC,
+    chunking and compression; the default writes NETCDF3_64BIT (CDF-2) files.
 
-                print("Putting back data into netcdf")
-                dst[name][...] = data_arr
+    reader='mmap' reads the 3D variables of a classic (CDF-1/2/5) source file straight from a
+    memory map of it (see aoi_cdf), AOI columns included, with the same values as the netCDF4
+    reads; other variables, and tiled, cell-store or non-classic sources, use netCDF4.
 
-        # Copy variable attributes (skip _FillValue to avoid redef warnings)
-        for attr_name in variable.ncattrs():
-            if attr_name != '_FillValue':
-                dst[name].setncattr(attr_name, variable.getncattr(attr_name))
+    telemetry (a TelemetryLog) receives the wall-time/byte breakdown of the file and of
+    each variable (see aoi_telemetry.FileTelemetry).
 
-    src.close()
-    dst.close()
+    Outputs are written under a hidden .part name and renamed into place only when
+    complete, then recorded in the target's manifest (if any), so an interrupted job
+    never leaves a truncated file behind under the final name.
+
+    A target none of whose gridIDs is in the file is skipped with a warning; the file fails
+    only when that holds for every target.
+
+    Returns the (output file, gridID layout) of each target, in target order (None for a
+    skipped target).
+    """
+    source_file = input_path + '/' + file
+    if output is None:
+        output = OutputLayout()
+    stats = FileTelemetry(source_file)
+    src = mapped = chunks = None
+    outputs = []  # (AOI_idx, dst) per written target
+    finished = []  # (target number, part_name, dst_name, layout) per written target
+    try:
+        with stats.phase('open'):
+            if cell_store is not None and cell_store.covers(os.path.join(subdir, file), source_file):
+                print("Opening cell-major store copy of source file: ", source_file)
+                src = cell_store.open(os.path.join(subdir, file))
+            elif tiles is not None and tiles.tiles and tiles.covers(os.path.join(subdir, file), source_file):
+                print(f"Opening {len(tiles.tiles)} tiles of source file: ", source_file)
+                src = tiles.open(os.path.join(subdir, file))
+            else:
+                print("Opening source file: ", source_file)
+                src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
+                if reader == 'mmap':
+                    mapped = open_mapped(source_file)
+                    if mapped is None:
+                        print("Not a classic netCDF file, reading with netCDF4: ", source_file)
+            if raw:
+                src.set_auto_maskandscale(False)
+
+            grid_ids = src['gridID'][...]  # global gridID array
+
+            for k, target in enumerate(targets):
+                output_path = os.path.join(target.output_path, subdir)
+                os.makedirs(output_path, exist_ok=True)
+                AOI_idx, layout = target.indices(grid_ids)
+                if AOI_idx.size == 0:
+                    # a zero-length ni/gridcell would be created as an unlimited dimension; the
+                    # other AOIs of the run still get this file
+                    print(f"Warning: no {target.AOI} gridID is in {source_file}; no {target.AOI} output for it")
+                    continue
+
+                dst_name = target.dst_name(subdir, file)
+                print("Generating AOI file: ", dst_name)
+
+                # hidden temporary name: not matched by the 'clmforc' link globs, renamed when complete
+                part_name = output_path + '/.' + target.AOI + '_' + file + '.part'
+                if os.path.exists(part_name):
+                    os.remove(part_name)
+
+                dst = nc.Dataset(part_name, 'w', format=output.dataset_format)
+                outputs.append((AOI_idx, dst))
+                finished.append((k, part_name, dst_name, layout))
+                dst.title = target.final_name(subdir, file) + ' created from ' + source_file + ' on ' + formatted_date
+
+                # Copy global attrs
+                for name in src.ncattrs():
+                    dst.setncattr(name, src.getncattr(name))
+
+                # Copy dimensions (override ni/gridcell to AOI size)
+                for name, dimension in src.dimensions.items():
+                    if name != 'ni' and name != 'gridcell':
+                        dst.createDimension(name, (len(dimension) if not dimension.isunlimited() else None))
+                    else:
+                        # only the AOI cells found in the source, as in the domain and surfdata files
+                        dst.createDimension(name, AOI_idx.size)
+            if not outputs:
+                raise ValueError(f"no {', '.join(t.AOI for t in targets)} gridID is in {source_file}")
+
+        # Copy variables with subsetting on last dim
+        for name, variable in src.variables.items():
+            with stats.phase('open'):
+                for AOI_idx, dst in outputs:
+                    kwargs = output.variable_kwargs(variable.dimensions, output_shape(variable, AOI_idx.size))
+                    create_variable_like(dst, name, variable, raw=raw, **kwargs)
+            print(name, variable.dimensions)
+            stats.variable(name)
+
+            if name != 'lambert_conformal_conic':
+                if (variable.dimensions[-1] != 'ni') and (variable.dimensions[-1] != 'gridcell'):
+                    with stats.phase('read'):
+                        source_data = src[name][...]
+                    stats.read(np.ma.getdata(source_data).nbytes)
+                    with stats.phase('write'):
+                        for _, dst in outputs:
+                            dst[name][...] = source_data
+                            stats.wrote(np.ma.getdata(source_data).nbytes)
+
+                elif len(variable.dimensions) == 2:
+                    with stats.phase('read'):
+                        source_data = src[name][...]
+                    stats.read(np.ma.getdata(source_data).nbytes)
+                    for AOI_idx, dst in outputs:
+                        with stats.phase('subset'):
+                            subset = source_data[:, AOI_idx]
+                        with stats.phase('write'):
+                            dst[name][...] = subset
+                        stats.wrote(np.ma.getdata(subset).nbytes)
+
+                elif len(variable.dimensions) == 3:
+                    d0, d1, d2 = variable.shape
+                    variable_gap, default_chunk = slab_gap, DEFAULT_CHUNK_SIZE
+                    if is_cell_major(variable):
+                        # every HDF5 chunk holds whole time series: read AOI cells sharing a chunk together,
+                        # over the whole time axis so each chunk is decompressed once (unless capped)
+                        variable_gap = (variable.chunking()[-1] - 1) * read_dtype(variable, raw).itemsize
+                        default_chunk = d0
+                    slabs, positions = _plan_reads(variable, outputs, variable_gap, raw)
+                    width = d2 if slabs is None else int((slabs[:, 1] - slabs[:, 0]).sum())
+                    var_chunk_size = _variable_chunk_size(variable, outputs, chunk_size, mem_budget,
+                                                          prefetch, stream, raw, width, default_chunk)
+                    num_chunks = d0 // var_chunk_size + (d0 % var_chunk_size > 0)
+                    # per target: one reused chunk buffer (stream) or the whole-variable staging buffer
+                    buffers = [None] * len(outputs)
+
+                    print(f"Reading source data in {num_chunks} chunks of {var_chunk_size} (prefetch {prefetch}), "
+                          f"{width} of {d2} cells in {1 if slabs is None else len(slabs)} slab(s)")
+                    source_variable = src[name] if mapped is None else MappedVariable(mapped, src[name], not raw)
+                    chunks = _read_chunks(source_variable, var_chunk_size, prefetch, slabs)
+                    for chunk in range(num_chunks):
+                        with stats.phase('read'):
+                            start, end, source_data = next(chunks)
+                        stats.read(np.ma.getdata(source_data).nbytes)
+                        stats.chunk()
+                        print(f"Subsetting source data for chunk {chunk + 1} of {num_chunks}")
+                        dtype = np.ma.getdata(source_data).dtype
+                        for k, (_, dst) in enumerate(outputs):
+                            AOI_idx = positions[k]
+                            if stream:
+                                # reuse one chunk-sized buffer and write it to its hyperslab right away
+                                if buffers[k] is None:
+                                    buffers[k] = np.empty((var_chunk_size, d1, AOI_idx.size), dtype=dtype)
+                                with stats.phase('subset'):
+                                    gather_chunk(source_data, AOI_idx, out=buffers[k][:end - start])
+                                with stats.phase('write'), _NC_LOCK:
+                                    dst[name][start:end, :, :] = buffers[k][:end - start]
+                                stats.wrote(buffers[k][:end - start].nbytes)
+                            else:
+                                if buffers[k] is None:
+                                    buffers[k] = np.empty((d0, d1, AOI_idx.size), dtype=dtype)
+                                # one indexed take over the whole time chunk, straight into the staging buffer
+                                with stats.phase('subset'):
+                                    gather_chunk(source_data, AOI_idx, out=buffers[k][start:end])
+                    chunks.close()
+                    chunks = None
+
+                    if not stream:
+                        print("Putting back data into netcdf")
+                        with stats.phase('write'):
+                            for k, (_, dst) in enumerate(outputs):
+                                dst[name][...] = buffers[k]
+                                stats.wrote(buffers[k].nbytes)
+
+            # Copy variable attributes (skip _FillValue to avoid redef warnings; raw mode set it at creation)
+            with stats.phase('write'):
+                for _, dst in outputs:
+                    for attr_name in variable.ncattrs():
+                        if attr_name != '_FillValue':
+                            dst[name].setncattr(attr_name, variable.getncattr(attr_name))
+        stats.variable(None)
+
+        with stats.phase('close'):
+            src.close()
+            src = None
+            if mapped is not None:
+                mapped.close()
+                mapped = None
+            while outputs:
+                outputs.pop()[1].close()
+            results = [None] * len(targets)
+            for k, part_name, dst_name, layout in finished:
+                os.replace(part_name, dst_name)
+                if targets[k].manifest is not None:
+                    targets[k].manifest.record(source_file, dst_name, layout, source_stat)
+                results[k] = (dst_name, layout)
+    finally:
+        # after an exception: close what is still open, the prefetch reader included
+        _close_quietly([chunks, mapped, src] + [dst for _, dst in outputs])
+    if telemetry is not None:
+        telemetry.write(stats)
+    return results
 
 
 def _discover_tasks(input_path, output_path):
+    """(root, file, new_dir) of every source file, found as aoi_catalog.archive_files finds them."""
     tasks = []
-    for root, dirs, files in os.walk(input_path):
-        for file in files:
-            if file.endswith('.nc'):
-                new_dir = os.path.join(output_path, os.path.relpath(root, input_path))
-                tasks.append((root, file, new_dir))
+    for root, file in archive_files(input_path):
+        new_dir = os.path.join(output_path, os.path.relpath(root, input_path))
+        tasks.append((root, file, new_dir))
     return tasks
 
 
+def _parse_years(text):
+    """'1980-1999,2005' -> {1980, ..., 1999, 2005}."""
+    years = set()
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        years.update(range(int(first), int(last or first) + 1))
+    return years
+
+
+def _split_list(text):
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+
+def _select_tasks(tasks, years=None, periods=None, variables=None):
+    """Keep the tasks whose file name matches the --years/--periods/--vars selectors.
+
+    Uses the variable (parts[4]) and period (parts[5], e.g. '1980-01') fields of
+    clmforc.<...>.<var>.<period>.nc names; files without the field a selector needs are dropped.
+    """
+    if not (years or periods or variables):
+        return tasks
+    selected = []
+    for task in tasks:
+        parts = task[1].split('.')
+        var_name = parts[4] if len(parts) > 4 else None
+        period = parts[5] if len(parts) > 5 else None
+        if variables and var_name not in variables:
+            continue
+        if years and not (period and period[:4].isdigit() and int(period[:4]) in years):
+            continue
+        if periods and not (period and any(fnmatch.fnmatchcase(period, p) for p in periods)):
+            continue
+        selected.append(task)
+    print(f"Selected {len(selected)} of {len(tasks)} files by years/periods/vars")
+    return selected
+
+
+def _pending_tasks(tasks, targets, input_path, catalog=None):
+    """Drop tasks whose outputs are recorded complete and current for every target."""
+    pending = []
+    for root, file, new_dir in tasks:
+        subdir = os.path.relpath(root, input_path)
+        source_file = os.path.join(root, file)
+        source_stat = catalog.stat(input_path, source_file) if catalog is not None else None
+        if all(t.manifest is not None and t.manifest.is_current(source_file, t.dst_name(subdir, file), source_stat)
+               for t in targets):
+            continue
+        pending.append((root, file, new_dir))
+    if len(pending) < len(tasks):
+        print(f"Skipping {len(tasks) - len(pending)} of {len(tasks)} files already complete in the manifest")
+    return pending
+
+
+def _failed_tasks(tasks, input_path, report_path):
+    """Only the tasks listed as failed in the failure report at report_path (--rerun-failed)."""
+    failed = failed_keys(report_path)
+    selected = [t for t in tasks if (os.path.normpath(os.path.relpath(t[0], input_path)), t[1]) in failed]
+    print(f"Rerunning {len(selected)} of {len(tasks)} files listed as failed in {report_path}")
+    return selected
+
+
+def _order_tasks_by_size(tasks, input_path, catalog=None):
+    """Largest source files first, so long files start early and small ones fill in at the end."""
+    if catalog is not None:
+        return sorted(tasks, key=lambda t: catalog.size(input_path, os.path.join(t[0], t[1])), reverse=True)
+    return sorted(tasks, key=lambda t: os.path.getsize(os.path.join(t[0], t[1])), reverse=True)
+
+
+class _TaskCounter:
+    """Shared next-task counter on rank 0, advanced with an atomic MPI fetch-and-add.
+
+    Every rank (rank 0 included) takes the next task index the moment it goes idle, so no
+    rank is reserved as a master and no rank waits on a fixed round-robin share.
+    """
+
+    def __init__(self, comm):
+        self._buf = np.zeros(1 if comm.Get_rank() == 0 else 0, dtype=np.int64)
+        self._win = MPI.Win.Create(self._buf, disp_unit=self._buf.itemsize, comm=comm)
+        self._one = np.ones(1, dtype=np.int64)
+        self._result = np.empty(1, dtype=np.int64)
+
+    def next(self):
+        self._win.Lock(0, MPI.LOCK_SHARED)
+        self._win.Fetch_and_op(self._one, self._result, 0, 0, MPI.SUM)
+        self._win.Unlock(0)
+        return int(self._result[0])
+
+    def free(self):
+        self._win.Free()
+
+
+def _rank_tasks(tasks, counter):
+    """Yield this rank's tasks: dynamically from the shared counter, or round-robin without one."""
+    if counter is None:
+        for i, t in enumerate(tasks):
+            if (i % SIZE) == RANK:
+                yield t
+        return
+    while True:
+        i = counter.next()
+        if i >= len(tasks):
+            return
+        yield tasks[i]
+
+
+def _process_task(root, file, targets, subdir, save_args, retries=0, backoff=0.0, source_stat=None):
+    """AOI_forcing_save_multi for one task, isolated: an exception costs this file, not the run.
+
+    A failed attempt is retried up to `retries` times, after backoff, 2*backoff, ... seconds.
+    source_stat is the cataloged stat of the source file, recorded in the manifests.
+    Returns (AOI_forcing_save_multi result, None), or (None, failure record) when every
+    attempt failed; the hidden .part outputs of the failed attempts are removed.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return AOI_forcing_save_multi(root, file, targets, subdir, *save_args, source_stat=source_stat), None
+        except Exception as e:
+            failure = failure_record(os.path.join(root, file), subdir, file, e, attempt + 1, RANK)
+        print(f"[rank {RANK}] {file} failed (attempt {attempt + 1} of {retries + 1}): {failure['error']}")
+        for target in targets:
+            part_name = os.path.join(target.output_path, subdir) + '/.' + target.AOI + '_' + file + '.part'
+            if os.path.exists(part_name):
+                os.remove(part_name)
+        if attempt < retries:
+            sleep(backoff * 2 ** attempt)
+    return None, failure
+
+
+def _run_node(task_iter, targets, input_path, save_args, workers=1, stage=None, catalog=None,
+              retries=0, backoff=0.0):
+    """Run this rank's tasks on `workers` local processes, optionally staging the outputs.
+
+    task_iter is consumed lazily (e.g. _rank_tasks with the shared counter), so with workers > 1
+    the rank keeps that many files in flight and takes the next one whenever a worker frees up.
+    With stage (a StagingArea) outputs are written under stage.target_dir(k) for target k and
+    published to their final paths, and recorded in the targets' manifests, as each file is
+    done; a file whose outputs cannot be published is reported as a failed task.
+    save_args are the AOI_forcing_save_multi arguments after subdir; failed tasks are retried
+    as in _process_task. A worker process that dies takes the files in flight on its pool with
+    it: they are reported as failed and the remaining tasks go to a new pool.
+    Returns (files, bytes, failure records).
+    """
+    task_iter = iter(task_iter)
+    run_targets = targets
+    if stage is not None:
+        run_targets = [AOITarget(t.AOI, t.AOI_points, stage.target_dir(k), t.index_cache, final_path=t.output_path)
+                       for k, t in enumerate(targets)]
+    nfiles, nbytes, failures = 0, 0, []
+
+    def finish(task, outcome):
+        nonlocal nfiles, nbytes
+        root, file, _ = task
+        source_file = os.path.join(root, file)
+        subdir = os.path.relpath(root, input_path)
+        nfiles += 1
+        nbytes += (catalog.size(input_path, source_file) if catalog else os.path.getsize(source_file))
+        results, failure = outcome
+        if failure is not None:
+            failures.append(failure)
+            print(f"[rank {RANK}] FAILED {file}: {failure['error']}")
+            return
+        if stage is not None:
+            # a target skipped for this file (no AOI cell in it) has no staged output
+            errors = stage.publish(source_file, [(k, result[0], targets[k].dst_name(subdir, file), result[1])
+                                                 for k, result in enumerate(results) if result is not None],
+                                   targets, catalog.stat(input_path, source_file) if catalog else None)
+            for final_path, e in errors:
+                print(f"[rank {RANK}] cannot publish {final_path}: {type(e).__name__}: {e}")
+            if errors:
+                failures.append(failure_record(source_file, subdir, file, errors[0][1], 1, RANK))
+                print(f"[rank {RANK}] FAILED {file}: {failures[-1]['error']}")
+                return
+        print(f"[rank {RANK}] Done {file}")
+
+    def submit(task, runner):
+        root, file, new_dir = task
+        if stage is None:
+            os.makedirs(new_dir, exist_ok=True)
+        source_stat = catalog.stat(input_path, os.path.join(root, file)) if catalog else None
+        return runner(_process_task, root, file, run_targets, os.path.relpath(root, input_path),
+                      save_args, retries, backoff, source_stat)
+
+    if workers <= 1 or ProcessPoolExecutor is None:
+        for task in task_iter:
+            finish(task, submit(task, lambda fn, *a: fn(*a)))
+    else:
+        # fork, not spawn: a spawned worker would re-import mpi4py and initialize MPI again
+        context = multiprocessing.get_context('fork')
+        task = next(task_iter, None)
+        while task is not None:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                running = {}
+                while task is not None and len(running) < workers:
+                    running[submit(task, executor.submit)] = task
+                    task = next(task_iter, None)
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    broken = False
+                    for fut in done:
+                        try:
+                            outcome = fut.result()
+                        except Exception as e:  # BrokenProcessPool: a worker was killed (e.g. a crash in netCDF-C)
+                            root, file, _ = running[fut]
+                            outcome = None, failure_record(os.path.join(root, file), os.path.relpath(root, input_path),
+                                                           file, e, 1, RANK)
+                            broken = True
+                        finish(running.pop(fut), outcome)
+                    if broken:
+                        break
+                    while task is not None and len(running) < workers:
+                        running[submit(task, executor.submit)] = task
+                        task = next(task_iter, None)
+                for fut, (root, file, _) in running.items():
+                    # every future of a broken pool fails; report the files that were in flight on it
+                    try:
+                        outcome = fut.result()
+                    except Exception as e:
+                        outcome = None, failure_record(os.path.join(root, file), os.path.relpath(root, input_path),
+                                                       file, e, 1, RANK)
+                    finish((root, file, None), outcome)
+
+    if stage is not None:
+        stage.summary()
+        stage.cleanup()
+    return nfiles, nbytes, failures
+
+
+def _print_utilization(stats):
+    """Print the per-rank utilization table gathered on rank 0."""
+    wall = max(st['wall'] for st in stats)
+    busy = [st['busy'] for st in stats]
+    print("Per-rank utilization (wall {:.2f}s):".format(wall))
+    print(f"{'rank':>5s} {'host':<20s} {'files':>6s} {'GB':>8s} {'busy s':>10s} {'idle s':>10s} {'util %':>7s}")
+    for st in stats:
+        util = 100.0 * st['busy'] / wall if wall > 0 else 0.0
+        print(f"{st['rank']:5d} {st['host'][:20]:<20s} {st['files']:6d} {st['bytes'] / 1e9:8.2f} "
+              f"{st['busy']:10.2f} {wall - st['busy']:10.2f} {util:7.1f}")
+    mean_busy = sum(busy) / len(busy)
+    if mean_busy > 0:
+        print(f"load imbalance (max/mean busy): {max(busy) / mean_busy:.2f}")
+
+
 def _load_aoi_points(aoi_path, aoi_file):
     full = os.path.join(aoi_path, aoi_file)
     if full.endswith('.csv'):
@@ -128,73 +698,332 @@ def _load_aoi_points(aoi_path, aoi_file):
     raise RuntimeError('Invalid AOI_points file; must be CSV or NC')
 
 
+def _parse_slab_gap(text):
+    return None if text.lower() in ('off', 'none', '') else parse_size(text)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Subset TES 1D forcing to an AOI (MPI-parallel, with local multiprocessing fallback).")
+    parser.add_argument("input_path", help="path to the 1D source data directory")
+    parser.add_argument("output_path", help="path for the 1D AOI forcing data directory")
+    parser.add_argument("AOI_gridID_path", help="path to the AOI gridIDs (csv or domain.nc)")
+    parser.add_argument("AOI_points_file", help="<AOI>_gridID.csv or <AOI>_domain.nc")
+    parser.add_argument("--catalog", default=os.environ.get('FORCING_CATALOG'),
+                        help="SQLite catalog of input_path made by 'aoi_catalog.py build'; tasks are planned from it "
+                             "instead of walking and stat'ing the archive (env FORCING_CATALOG)")
+    parser.add_argument("--years", default=os.environ.get('FORCING_YEARS'),
+                        help="only source files of these years, e.g. 1980-1999 or 1980,1990-1992 (env FORCING_YEARS)")
+    parser.add_argument("--periods", default=os.environ.get('FORCING_PERIODS'),
+                        help="only source files whose period field matches one of these comma-separated "
+                             "patterns, e.g. '1980-0[1-6],*-12' (env FORCING_PERIODS)")
+    parser.add_argument("--vars", default=os.environ.get('FORCING_VARS'),
+                        help="only source files of these forcing variables, e.g. TBOT,FSDS (env FORCING_VARS)")
+    parser.add_argument("--write-mode", choices=("stream", "staged"),
+                        default=os.environ.get('FORCING_WRITE_MODE', 'stream'),
+                        help="stream: write each time chunk as soon as it is subset (memory bounded by the chunk); "
+                             "staged: hold the whole variable and write it once (env FORCING_WRITE_MODE)")
+    parser.add_argument("--raw", action="store_true", default=os.environ.get('AOI_RAW_IO', '0') == '1',
+                        help="disable netCDF4 auto mask/scale and copy values in their on-disk dtype "
+                             "(byte-identical packed values, no masks or float64 upcast; env AOI_RAW_IO=1)")
+    parser.add_argument("--index-cache-dir", default=None,
+                        help="directory for the gridID->AOI index sidecars shared by all ranks and reruns "
+                             "(default: <output_path>/.aoi_index_cache)")
+    parser.add_argument("--schedule", choices=("dynamic", "static"),
+                        default=os.environ.get('FORCING_SCHEDULE', 'dynamic'),
+                        help="dynamic: files ordered largest first and handed to whichever rank goes idle; "
+                             "static: fixed round-robin split in discovery order (env FORCING_SCHEDULE)")
+    parser.add_argument("--aoi-list", default=None,
+                        help="text file of extra AOIs, one '<AOI points file> <output_path>' per line; every "
+                             "source chunk is read once and written to all AOIs (the positional AOI included)")
+    parser.add_argument("--prefetch", type=int, default=int(os.environ.get('FORCING_PREFETCH', '0')),
+                        help="time chunks a background thread reads ahead while the current chunk is subset "
+                             "and written (0 = sequential; env FORCING_PREFETCH)")
+    parser.add_argument("--chunk-size", type=int, default=int(os.environ.get('FORCING_CHUNK_SIZE', '0')) or None,
+                        help=f"time steps per chunk for 3D variables (default {DEFAULT_CHUNK_SIZE}, or derived from "
+                             "--mem-budget; env FORCING_CHUNK_SIZE)")
+    parser.add_argument("--mem-budget", type=parse_size, default=os.environ.get('FORCING_MEM_BUDGET'),
+                        help="per-rank memory for chunk buffers, e.g. 2G; the chunk length is derived per variable "
+                             "from its shape, dtype and the AOI size and caps --chunk-size (env FORCING_MEM_BUDGET)")
+    parser.add_argument("--calibrate-chunk", action="store_true",
+                        default=os.environ.get('FORCING_CALIBRATE_CHUNK', '0') == '1',
+                        help="time a few chunk sizes on the first file and use the fastest "
+                             "(env FORCING_CALIBRATE_CHUNK=1)")
+    parser.add_argument("--telemetry-dir", default=os.environ.get('FORCING_TELEMETRY_DIR'),
+                        help="directory for the per-file/per-variable JSON-lines telemetry "
+                             "(default: <output_path>/.forcing_telemetry; env FORCING_TELEMETRY_DIR); "
+                             "summarize with aoi_telemetry.py")
+    parser.add_argument("--no-telemetry", action="store_true", help="do not write telemetry records")
+    parser.add_argument("--slab-gap", type=_parse_slab_gap, default=os.environ.get('FORCING_SLAB_GAP', '1M'),
+                        help="read only the cell ranges that cover the AOI, reading through gaps of up to this "
+                             "many bytes per row instead of issuing another request; 'off' reads the full cell "
+                             "dimension (default 1M; env FORCING_SLAB_GAP)")
+    parser.add_argument("--tile-dir", default=os.environ.get('FORCING_TILE_DIR'),
+                        help="tiled copy of input_path made by 'aoi_tiles.py tile'; only the tiles holding AOI cells "
+                             "are opened, untiled or changed files are read from input_path (env FORCING_TILE_DIR)")
+    parser.add_argument("--cell-store", default=os.environ.get('FORCING_CELL_STORE'),
+                        help="cell-major copy of input_path made by 'aoi_cellstore.py build'; converted files are "
+                             "read from it, whole time series per AOI cell unless --chunk-size or --mem-budget "
+                             "caps the time chunk (env FORCING_CELL_STORE)")
+    parser.add_argument("--output-format", choices=tuple(OUTPUT_FORMATS),
+                        default=os.environ.get('FORCING_OUTPUT_FORMAT', 'NETCDF3_64BIT'),
+                        help="AOI output file format: NETCDF3_64BIT (CDF-2), CDF5 or NETCDF4_CLASSIC "
+                             "(env FORCING_OUTPUT_FORMAT)")
+    parser.add_argument("--complevel", type=int, default=int(os.environ.get('FORCING_COMPLEVEL', '0')),
+                        help="zlib level with shuffle for NETCDF4_CLASSIC outputs, 0 = none (env FORCING_COMPLEVEL)")
+    parser.add_argument("--chunk-time", type=int, default=int(os.environ.get('FORCING_CHUNK_TIME', '1')),
+                        help="time steps per HDF5 chunk of NETCDF4_CLASSIC outputs; each chunk spans all AOI "
+                             "cells, so 1 matches DATM reading one time slice at a time (env FORCING_CHUNK_TIME)")
+    parser.add_argument("--reader", choices=("netcdf4", "mmap"), default=os.environ.get('FORCING_READER', 'netcdf4'),
+                        help="netcdf4: read through netCDF4-python; mmap: map classic (CDF-1/2/5) source files and "
+                             "read 3D variables straight from the mapping, same values (env FORCING_READER)")
+    parser.add_argument("--node-workers", type=int, default=int(os.environ.get('FORCING_NODE_WORKERS', '0')),
+                        help="hybrid mode: worker processes per MPI rank (run one rank per node); each rank keeps "
+                             "this many files in flight (env FORCING_NODE_WORKERS)")
+    parser.add_argument("--stage-dir", default=os.environ.get('FORCING_STAGE_DIR'),
+                        help="write outputs on node-local storage under this directory ('auto': $SLURM_TMPDIR, "
+                             "$TMPDIR or /tmp) and copy each one to output_path as soon as it is done "
+                             "(env FORCING_STAGE_DIR)")
+    parser.add_argument("--retries", type=int, default=int(os.environ.get('FORCING_RETRIES', '2')),
+                        help="extra attempts for a file that fails (env FORCING_RETRIES)")
+    parser.add_argument("--retry-backoff", type=float, default=float(os.environ.get('FORCING_RETRY_BACKOFF', '2')),
+                        help="seconds before the first retry, doubled for each further one (env FORCING_RETRY_BACKOFF)")
+    parser.add_argument("--failure-report", default=os.environ.get('FORCING_FAILURE_REPORT'),
+                        help="JSON report of the files that failed every attempt (default: "
+                             "<output_path>/.forcing_failures.json; env FORCING_FAILURE_REPORT)")
+    parser.add_argument("--rerun-failed", action="store_true",
+                        help="process only the files listed in the failure report of the previous run")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate every output, ignoring the completion manifest")
+    args = parser.parse_args(argv)
+    if args.complevel and args.output_format != 'NETCDF4_CLASSIC':
+        parser.error("--complevel needs --output-format NETCDF4_CLASSIC")
+    return args
+
+
+def _prime_index_caches(tasks, targets, input_path, tiles=None):
+    """Resolve the AOI indices of the first task's gridID layout once, before the workers start."""
+    root, file, _ = tasks[0]
+    key = os.path.join(os.path.relpath(root, input_path), file)
+    if tiles is not None and tiles.tiles and tiles.covers(key, os.path.join(root, file)):
+        # the tiled view has its own (smaller) layout
+        src = tiles.open(key)
+        try:
+            grid_ids = src['gridID'][...]
+        finally:
+            src.close()
+        for target in targets:
+            target.index_cache.lookup(grid_ids)
+        return
+    for target in targets:
+        target.index_cache.prime(os.path.join(root, file))
+
+
+def _calibrate_chunk_size(tasks, targets, raw, slab_gap=None):
+    """Pick the fastest chunk size on the first task file (see aoi_chunking.calibrate_chunk_size).
+
+    The AOI cells of every target are read together, over the same slabs as the real run.
+    """
+    source_file = os.path.join(tasks[0][0], tasks[0][1])
+    AOI_idx = reduce(np.union1d, [target.index_cache.prime(source_file)[0] for target in targets])
+    chunk_size, timings = calibrate_chunk_size(source_file, AOI_idx, raw=raw, slab_gap=slab_gap)
+    print("Chunk-size calibration on " + tasks[0][1] + ": "
+          + ", ".join(f"{size}: {seconds:.3f}s" for size, seconds in timings.items())
+          + f" -> {chunk_size}")
+    return chunk_size
+
+
+def _load_aoi_list(list_file):
+    """Read '<AOI points file> <output_path>' lines (blank lines and # comments ignored)."""
+    entries = []
+    with open(list_file) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            aoi_points_file, aoi_output_path = line.split()
+            entries.append((aoi_points_file, aoi_output_path))
+    return entries
+
+
 def main():
-    args = sys.argv[1:]
-    if len(sys.argv) != 5 or sys.argv[1] == '--help':
-        print("Example use: python TES_AOI_forcingGEN_mpi.py <input_path> <output_path> <AOI_gridID_path> <AOI_points_file>")
-        print(" <input_path>: path to the 1D source data directory")
-        print(" <output_path>: path for the 1D AOI forcing data directory")
-        print(" <AOI_gridID_path>: path to the AOI gridIDs (csv or domain.nc)")
-        print(" <AOI_points_file>: <AOI>_gridID.csv or <AOI>_domain.nc")
-        sys.exit(0)
-
-    input_path = args[0]
+    args = _parse_args()
+
+    input_path = args.input_path
     if not input_path.endswith("/"): input_path += '/'
-    output_path = args[1]
+    output_path = args.output_path
     if not output_path.endswith("/"): output_path += '/'
-    aoi_path = args[2]
+    aoi_path = args.AOI_gridID_path
     if not aoi_path.endswith("/"): aoi_path += '/'
-    aoi_file = args[3]
+    aoi_file = args.AOI_points_file
     AOI = aoi_file.split('_')[0]
+    stream = args.write_mode == 'stream'
+    raw = args.raw
+
+    # an output written with other options is not current for this run
+    output_options = {'raw': raw, 'output_format': args.output_format, 'complevel': args.complevel,
+                      'chunk_time': args.chunk_time, 'reader': args.reader}
 
     AOI_points = _load_aoi_points(aoi_path, aoi_file)
+    index_cache = AOIIndexCache(args.index_cache_dir or os.path.join(output_path, '.aoi_index_cache'),
+                                AOI, AOI_points, os.path.join(output_path, AOI + '_missing_gridIDs.csv'))
+    manifest = ForcingManifest(os.path.join(output_path, '.forcing_manifest'), AOI, index_cache.aoi_fingerprint,
+                               output_options)
+    targets = [AOITarget(AOI, AOI_points, output_path, index_cache, manifest)]
+    if args.aoi_list:
+        # multi-AOI fan-out: each extra AOI gets its own output tree and index cache
+        for extra_file, extra_output in _load_aoi_list(args.aoi_list):
+            extra_AOI = os.path.basename(extra_file).split('_')[0]
+            extra_points = _load_aoi_points(os.path.dirname(extra_file), os.path.basename(extra_file))
+            extra_cache = AOIIndexCache(args.index_cache_dir or os.path.join(extra_output, '.aoi_index_cache'),
+                                        extra_AOI, extra_points,
+                                        os.path.join(extra_output, extra_AOI + '_missing_gridIDs.csv'))
+            extra_manifest = ForcingManifest(os.path.join(extra_output, '.forcing_manifest'), extra_AOI,
+                                             extra_cache.aoi_fingerprint, output_options)
+            targets.append(AOITarget(extra_AOI, extra_points, extra_output, extra_cache, extra_manifest))
+        print("Multi-AOI mode: " + ", ".join(t.AOI for t in targets))
+
+    chunk_size = args.chunk_size
+    years = _parse_years(args.years) if args.years else None
+    periods = _split_list(args.periods) if args.periods else None
+    variables = set(_split_list(args.vars)) if args.vars else None
+    telemetry = None
+    if not args.no_telemetry:
+        telemetry = TelemetryLog(args.telemetry_dir or os.path.join(output_path, '.forcing_telemetry'),
+                                 RANK if USING_MPI else 0)
+
+    catalog = ForcingCatalog(args.catalog) if args.catalog else None
+    cell_store = CellStore(args.cell_store) if args.cell_store else None
+    output = OutputLayout(args.output_format, args.complevel, args.chunk_time)
+    tiles = None
+    if args.tile_dir:
+        tiles = TileArchive(args.tile_dir)
+        if RANK == 0:
+            tiles.select([t.AOI_points for t in targets])
+        if USING_MPI and SIZE > 1:
+            tiles.tiles = COMM.bcast(tiles.tiles, root=0)
+
+    stage = StagingArea(args.stage_dir, RANK) if args.stage_dir else None
+    report_path = args.failure_report or os.path.join(output_path, '.forcing_failures.json')
+    retry = (args.retries, args.retry_backoff)
+    if args.rerun_failed and not os.path.exists(report_path):
+        sys.exit(f"--rerun-failed: no failure report at {report_path}")
 
     # Build the task list and distribute
     if USING_MPI and SIZE > 1:
         if RANK == 0:
-            tasks = _discover_tasks(input_path, output_path)
+            tasks = catalog.tasks(input_path, output_path) if catalog else _discover_tasks(input_path, output_path)
+            tasks = _select_tasks(tasks, years, periods, variables)
+            if args.rerun_failed:
+                tasks = _failed_tasks(tasks, input_path, report_path)
+            if not args.force:
+                tasks = _pending_tasks(tasks, targets, input_path, catalog)
+            if args.schedule == 'dynamic':
+                tasks = _order_tasks_by_size(tasks, input_path, catalog)
+            # resolve the shared gridID layout once; the other ranks load the sidecar
+            if tasks:
+                _prime_index_caches(tasks, targets, input_path, tiles)
+                if args.calibrate_chunk:
+                    chunk_size = _calibrate_chunk_size(tasks, targets, raw, args.slab_gap)
         else:
             tasks = None
-        tasks = COMM.bcast(tasks, root=0)
-        local_tasks = [t for i, t in enumerate(tasks) if (i % SIZE) == RANK]
+        tasks, chunk_size = COMM.bcast((tasks, chunk_size), root=0)
+        counter = _TaskCounter(COMM) if args.schedule == 'dynamic' else None
+        save_args = (stream, raw, args.prefetch, chunk_size, args.mem_budget, telemetry, args.slab_gap, tiles,
+                     cell_store, output, args.reader)
 
-        start_total = process_time()
-        for root, file, new_dir in local_tasks:
+        COMM.Barrier()
+        wall_start = perf_counter()
+        busy, nfiles, nbytes, failures = 0.0, 0, 0, []
+        if args.node_workers > 1 or stage is not None:
+            # hybrid mode: a process pool per rank, outputs staged on node-local disk
+            nfiles, nbytes, failures = _run_node(_rank_tasks(tasks, counter), targets, input_path, save_args,
+                                                 args.node_workers, stage, catalog, *retry)
+            busy = perf_counter() - wall_start
+            tasks_left = []
+        else:
+            tasks_left = _rank_tasks(tasks, counter)
+        for root, file, new_dir in tasks_left:
             os.makedirs(new_dir, exist_ok=True)
             parts = file.split('.')
             var_name = parts[4] if len(parts) > 4 else ''
             period = parts[5] if len(parts) > 5 else ''
             print(f"[rank {RANK}/{SIZE}] processing {var_name} ({period}) in {file}")
-            start = process_time()
-            AOI_forcing_save_1d(root, file, AOI, AOI_points, new_dir)
-            end = process_time()
-            print(f"[rank {RANK}] Done {file} in {end-start:.2f}s")
-        end_total = process_time()
-        print(f"[rank {RANK}] Finished {len(local_tasks)} files in {end_total-start_total:.2f}s")
+            start = perf_counter()
+            _, failure = _process_task(root, file, targets, os.path.relpath(root, input_path), save_args, *retry,
+                                       catalog.stat(input_path, os.path.join(root, file)) if catalog else None)
+            elapsed = perf_counter() - start
+            busy += elapsed
+            nfiles += 1
+            nbytes += (catalog.size(input_path, os.path.join(root, file)) if catalog
+                       else os.path.getsize(os.path.join(root, file)))
+            if failure is not None:
+                failures.append(failure)
+                print(f"[rank {RANK}] FAILED {file} after {elapsed:.2f}s (wall): {failure['error']}")
+                continue
+            print(f"[rank {RANK}] Done {file} in {elapsed:.2f}s (wall)")
+        print(f"[rank {RANK}] Finished {nfiles} files in {perf_counter() - wall_start:.2f}s (wall)")
+
+        # everyone waits for the last file, so idle time is measured against the common end
+        COMM.Barrier()
+        wall = perf_counter() - wall_start
+        if counter is not None:
+            counter.free()
+        stats = COMM.gather({'rank': RANK, 'host': socket.gethostname(), 'files': nfiles,
+                             'bytes': nbytes, 'busy': busy, 'wall': wall, 'failures': failures}, root=0)
+        if RANK == 0:
+            _print_utilization(stats)
+            failures = [f for s in stats for f in s['failures']]
+            write_report(report_path, failures, len(tasks))
+        n_failed = COMM.bcast(len(failures) if RANK == 0 else None, root=0)
 
     else:
         # Local fallback: default 32 workers (override with FORCING_SERIAL_WORKERS)
-        tasks = _discover_tasks(input_path, output_path)
+        tasks = catalog.tasks(input_path, output_path) if catalog else _discover_tasks(input_path, output_path)
+        tasks = _select_tasks(tasks, years, periods, variables)
+        if args.rerun_failed:
+            tasks = _failed_tasks(tasks, input_path, report_path)
+        if not args.force:
+            tasks = _pending_tasks(tasks, targets, input_path, catalog)
+        if args.schedule == 'dynamic':
+            # the pool already hands out work on demand; largest first keeps the tail short
+            tasks = _order_tasks_by_size(tasks, input_path, catalog)
+        if tasks:
+            _prime_index_caches(tasks, targets, input_path, tiles)
+            if args.calibrate_chunk:
+                chunk_size = _calibrate_chunk_size(tasks, targets, raw, args.slab_gap)
         default_workers = int(os.environ.get('FORCING_SERIAL_WORKERS', '32'))
-        if ProcessPoolExecutor is None or default_workers <= 1:
+        save_args = (stream, raw, args.prefetch, chunk_size, args.mem_budget, telemetry, args.slab_gap, tiles,
+                     cell_store, output, args.reader)
+        failures = []
+        if stage is not None:
+            _, _, failures = _run_node(tasks, targets, input_path, save_args, args.node_workers or default_workers,
+                                       stage, catalog, *retry)
+        elif ProcessPoolExecutor is None or default_workers <= 1:
             for root, file, new_dir in tasks:
                 os.makedirs(new_dir, exist_ok=True)
                 parts = file.split('.')
                 var_name = parts[4] if len(parts) > 4 else ''
                 period = parts[5] if len(parts) > 5 else ''
                 print('processing ' + var_name + '(' + period + ') in the file ' + file)
-                start = process_time()
-                AOI_forcing_save_1d(root, file, AOI, AOI_points, new_dir)
-                end = process_time()
+                start = perf_counter()
+                _, failure = _process_task(root, file, targets, os.path.relpath(root, input_path), save_args, *retry,
+                                           catalog.stat(input_path, os.path.join(root, file)) if catalog else None)
+                end = perf_counter()
+                if failure is not None:
+                    failures.append(failure)
+                    print("FAILED " + file + ": " + failure['error'])
+                    continue
                 print("Generating 1D forcing data for " + AOI + " domain takes {}".format(end-start))
         else:
-            with ProcessPoolExecutor(max_workers=default_workers) as executor:
-                futures = []
-                for root, file, new_dir in tasks:
-                    os.makedirs(new_dir, exist_ok=True)
-                    futures.append(executor.submit(AOI_forcing_save_1d, root, file, AOI, AOI_points, new_dir))
-                for fut in as_completed(futures):
-                    fut.result()
+            _, _, failures = _run_node(tasks, targets, input_path, save_args, default_workers, None, catalog, *retry)
+        write_report(report_path, failures, len(tasks))
+        n_failed = len(failures)
+
+    if n_failed:
+        if RANK == 0:
+            print(f"{n_failed} files failed; see {report_path} and rerun them with --rerun-failed")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
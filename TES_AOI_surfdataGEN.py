@@ -7,14 +7,50 @@ from pyproj import Transformer
 from scipy.spatial import cKDTree
 import pandas as pd
 import sys, os
+import shutil
+import tempfile
+from math import prod
 
 from datetime import datetime
 
+from aoi_gather import create_variable_like
+from aoi_gridindex import load_grid_index, report_missing, shared_base
+from aoi_surfdata import copy_slabs, part_name, slab_bytes_from_env, subset_to_part, subset_variable
+
+# Parallel mode under mpirun/srun; the script runs serially (or on SURFDATA_WORKERS local
+# processes) without MPI
+try:
+    from mpi4py import MPI  # type: ignore
+    COMM = MPI.COMM_WORLD
+    RANK = COMM.Get_rank()
+    SIZE = COMM.Get_size()
+except Exception:
+    COMM = None
+    RANK = 0
+    SIZE = 1
+
 # Get current date
 current_date = datetime.now()
 # Format date to mmddyyyy
 formatted_date = current_date.strftime('%y%m%d')
 
+
+def _subset_parts(jobs, source_file, domain_idx, parts_dir, raw, slab_bytes, workers):
+    """Subset the gridcell variables in jobs into part files, on `workers` local processes."""
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(subset_to_part, source_file, name, domain_idx, parts_dir, raw, slab_bytes)
+                       for name in jobs]
+            for fut in as_completed(futures):
+                name, _, seconds = fut.result()
+                print(f"[rank {RANK}] subset {name} in {seconds:.2f}s")
+    else:
+        for name in jobs:
+            name, _, seconds = subset_to_part(source_file, name, domain_idx, parts_dir, raw, slab_bytes)
+            print(f"[rank {RANK}] subset {name} in {seconds:.2f}s")
+
+
 def main():
     args = sys.argv[1:]
     # Check the number of arguments
@@ -68,27 +104,64 @@ def main():
     AOIsurfdata = output_path +'/'+str(AOI)+'_surfdata.TES_SE.4km.1d.NLCD.c'+ formatted_date +'.nc'
     print("AOIsurfdata:" + AOIsurfdata)
 
-    # check if file exists then delete it
-    if os.path.exists(AOIsurfdata):
-        os.remove(AOIsurfdata)
-
     source_file = input_path+ surfdata_file
 
-    dst = nc.Dataset(AOIsurfdata, 'w', format='NETCDF3_64BIT')
-
-    # open the 1D domain data
-    src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
-
-    # read gridIDs from src file
-    TES_gridIDs = src.variables['gridID'][:]
-    TES_gridcell_list = list(TES_gridIDs)
-    print(TES_gridcell_list[0:5])
-
-    # get the index of AOI_points in the TES_gridcell_list
-    domain_idx = np.where(np.in1d(TES_gridcell_list, AOI_points))[0]
+    # AOI_RAW_IO=1: copy values in their on-disk dtype without auto mask/scale
+    raw = os.environ.get('AOI_RAW_IO', '0') == '1'
+    # SURFDATA_SLAB_SIZE: bytes of source layers read per slab (default 256M)
+    slab_bytes = slab_bytes_from_env()
+    # SURFDATA_WORKERS=N and/or MPI ranks: subset the gridcell variables in parallel
+    workers = int(os.environ.get('SURFDATA_WORKERS', '1'))
+    parallel = SIZE > 1 or workers > 1
+
+    if RANK == 0:
+        # check if file exists then delete it
+        if os.path.exists(AOIsurfdata):
+            os.remove(AOIsurfdata)
+
+        # open the 1D domain data
+        src = nc.Dataset(source_file, 'r', format='NETCDF3_64BIT')
+
+        # read gridIDs from src file
+        TES_gridIDs = src.variables['gridID'][:]
+        print(np.ravel(TES_gridIDs)[0:5])
+
+        # get the index of AOI_points in the TES gridIDs (sorted index sidecar next to the source)
+        grid_index = load_grid_index(TES_gridIDs, shared_base(source_file))
+        domain_idx = grid_index.rows(AOI_points)
+        report_missing(grid_index.missing(AOI_points), AOI,
+                       output_path + '/' + str(AOI) + '_missing_gridIDs.csv')
+
+        # domain_idx = np.sort(domain_idx).squeeze()
+        print("gridID_idx", domain_idx[0:10])
+        if domain_idx.size == 0:
+            # a zero-length gridcell would be created as an unlimited dimension
+            src.close()
+            sys.exit(f"Error: no {AOI} gridID is in {source_file}, so no surfdata file is written")
+
+        if raw:
+            src.set_auto_maskandscale(False)
+
+    parts_dir = None
+    if parallel:
+        if RANK == 0:
+            # largest variables first, so the small ones fill in at the end
+            jobs = sorted((name for name, v in src.variables.items()
+                           if len(v.dimensions) > 0 and v.dimensions[-1] == 'gridcell'),
+                          key=lambda name: prod(src[name].shape) * src[name].dtype.itemsize, reverse=True)
+            parts_dir = tempfile.mkdtemp(prefix='.' + str(AOI) + '_surfdata.parts.', dir=output_path)
+            print(f"Subsetting {len(jobs)} gridcell variables on {SIZE} ranks x {workers} workers")
+        else:
+            jobs = domain_idx = None
+        if SIZE > 1:
+            jobs, domain_idx, parts_dir = COMM.bcast((jobs, domain_idx, parts_dir), root=0)
+        _subset_parts(jobs[RANK::SIZE], source_file, domain_idx, parts_dir, raw, slab_bytes, workers)
+        if SIZE > 1:
+            COMM.Barrier()
+        if RANK != 0:
+            return
 
-    # domain_idx = np.sort(domain_idx).squeeze()
-    print("gridID_idx", domain_idx[0:10])
+    dst = nc.Dataset(AOIsurfdata, 'w', format='NETCDF3_64BIT')
 
     # Copy the global attributes from the source to the target
     for name in src.ncattrs():
@@ -102,7 +175,7 @@ def main():
         else:
             # Update the 'ni' dimension with the length of the list
             #dst.dimensions['ni'].set_length(len(AOI_points))
-            ni = dst.createDimension('gridcell', AOI_points.size)
+            ni = dst.createDimension('gridcell', domain_idx.size)
 
     count = 0 # record how may 2D layers have been processed 
     
@@ -110,36 +183,31 @@ def main():
     for name, variable in src.variables.items():
 
         if (len(variable.dimensions) == 0 or variable.dimensions[-1] != 'gridcell'):
-            x = dst.createVariable(name, variable.datatype, variable.dimensions)   
+            x = create_variable_like(dst, name, variable, raw=raw)
             print(name, variable.dimensions)
-            # Copy variable attributes
-            dst[name].setncatts(src[name].__dict__)
+            # Copy variable attributes (in raw mode _FillValue was set at creation)
+            attrs = dict(src[name].__dict__)
+            if raw:
+                attrs.pop('_FillValue', None)
+            dst[name].setncatts(attrs)
             # Copy the data
             dst[name][...] = src[name][...]
 
         else:
-            if len(variable.dimensions) == 1:
-                x = dst.createVariable(name, variable.datatype, ('gridcell',))   
-                print(name, dst[name].dimensions)           
-                dst[name][:] = src[name][domain_idx]
-            if len(variable.dimensions) == 2:
-                x = dst.createVariable(name, variable.datatype, variable.dimensions[:-1]+('gridcell',))   
-                print(name, dst[name].dimensions)               
-                for index in range(variable.shape[0]):
-                    # get all the source data (global)
-                    dst[name][index,:] = src[name][index][domain_idx]
-
-                    count = count +1
-
-            if len(variable.dimensions) == 3:
-                x = dst.createVariable(name, variable.datatype, variable.dimensions[:-1]+('gridcell',))   
-                print(name, dst[name].dimensions)   
-                for index1 in range(variable.shape[0]):
-                    for index2 in range(variable.shape[1]):
-                        # get all the source data (global)
-                        dst[name][index1,index2,:] = src[name][index1][index2][domain_idx]
-                    print('finished layer#: ' + str(index1))    
-                    count = count + variable.shape[1]
+            x = create_variable_like(dst, name, variable, variable.dimensions[:-1]+('gridcell',), raw=raw)
+            print(name, dst[name].dimensions)
+            if parts_dir is not None:
+                # assemble the part a worker subset: same dtype and fill, copied unchanged
+                part = nc.Dataset(part_name(parts_dir, name), 'r')
+                part.set_auto_maskandscale(False)
+                copy_slabs(part[name], dst[name], slab_bytes)
+                part.close()
+                layers = prod(variable.shape[:-1])
+            else:
+                # whole multi-layer slabs: one read, one gather and one write per slab
+                layers = subset_variable(src[name], dst[name], domain_idx, slab_bytes)
+            if len(variable.dimensions) > 1:
+                count = count + layers
 
             # Copy variable attributes (except _FillValue)
             attrs = dict(src[name].__dict__)
@@ -163,5 +231,16 @@ def main():
     # Save the target netCDF file
     dst.close()
 
+    if parts_dir is not None:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except BaseException:
+        if SIZE > 1:
+            # the other ranks are waiting in a collective; take the whole job down
+            import traceback
+            traceback.print_exc()
+            COMM.Abort(1)
+        raise
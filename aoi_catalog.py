@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# aoi_catalog: SQLite metadata catalog of a TES forcing archive
+#
+#   python3 aoi_catalog.py build <forcing_dir> <catalog.sqlite> [--workers N]
+#   python3 aoi_catalog.py info <catalog.sqlite>
+#
+# build opens every .nc file under forcing_dir once and records its relative path, size, mtime,
+# variable/period name fields, time range and gridID fingerprint (table files), its dimensions
+# (table dimensions) and its variables with dtype and shape (table variables). Rebuilding only
+# rescans new or changed files (size/mtime) and drops removed ones; the scan runs MPI-parallel
+# under srun or on --workers local processes, and only rank 0 writes the database.
+#
+# TES_AOI_forcingGEN_mpi.py --catalog <catalog.sqlite> plans its tasks (selection by years/
+# periods/vars, largest-first ordering, resume checks) from the catalog instead of walking
+# and stat'ing the archive.
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import netCDF4 as nc
+
+from aoi_gridindex import gridid_fingerprint
+
+try:
+    from mpi4py import MPI
+    COMM = MPI.COMM_WORLD
+    RANK = COMM.Get_rank()
+    SIZE = COMM.Get_size()
+except Exception:
+    COMM = None
+    RANK = 0
+    SIZE = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,      -- relative to the forcing_dir recorded in meta
+    size INTEGER, mtime_ns INTEGER,
+    var_name TEXT, period TEXT,
+    n_time INTEGER, time_start REAL, time_end REAL, time_units TEXT, calendar TEXT,
+    gridid_fingerprint TEXT, data_model TEXT, scanned TEXT);
+CREATE TABLE IF NOT EXISTS dimensions (
+    path TEXT, name TEXT, size INTEGER, unlimited INTEGER, PRIMARY KEY (path, name));
+CREATE TABLE IF NOT EXISTS variables (
+    path TEXT, name TEXT, dtype TEXT, dimensions TEXT, shape TEXT, PRIMARY KEY (path, name));
+CREATE INDEX IF NOT EXISTS files_var_period ON files (var_name, period);
+"""
+
+
+def archive_files(forcing_dir):
+    """Yield (directory, file name) of every .nc file under forcing_dir.
+
+    Hidden files and directories are skipped, so temporary copies (e.g. .<name>.nc) and
+    manifest or cache directories never become source files.
+    """
+    for root, dirs, files in os.walk(forcing_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for file in files:
+            if file.endswith('.nc') and not file.startswith('.'):
+                yield root, file
+
+
+def walk_archive(forcing_dir):
+    """{relative path: (size, mtime_ns)} of every .nc file under forcing_dir (see archive_files)."""
+    found = {}
+    for root, file in archive_files(forcing_dir):
+        st = os.stat(os.path.join(root, file))
+        key = os.path.normpath(os.path.relpath(os.path.join(root, file), forcing_dir))
+        found[key] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+def scan_file(forcing_dir, key, stat):
+    """Catalog record of one source file: (files row, dimension rows, variable rows)."""
+    parts = os.path.basename(key).split('.')
+    src = nc.Dataset(os.path.join(forcing_dir, key), 'r')
+    try:
+        n_time = time_start = time_end = time_units = calendar = None
+        if 'time' in src.dimensions:
+            n_time = len(src.dimensions['time'])
+        if 'time' in src.variables and n_time:
+            time = src['time']
+            time_start, time_end = float(time[0]), float(time[n_time - 1])
+            time_units = getattr(time, 'units', None)
+            calendar = getattr(time, 'calendar', None)
+        fingerprint = gridid_fingerprint(src['gridID'][...]) if 'gridID' in src.variables else None
+        row = (key, stat[0], stat[1],
+               parts[4] if len(parts) > 4 else None, parts[5] if len(parts) > 5 else None,
+               n_time, time_start, time_end, time_units, calendar,
+               fingerprint, src.data_model, datetime.now().isoformat(timespec='seconds'))
+        dims = [(key, name, len(d), int(d.isunlimited())) for name, d in src.dimensions.items()]
+        variables = [(key, name, str(v.dtype), ','.join(v.dimensions), ','.join(str(n) for n in v.shape))
+                     for name, v in src.variables.items()]
+    finally:
+        src.close()
+    return row, dims, variables
+
+
+def _scan_one(job):
+    return scan_file(*job)
+
+
+def connect(catalog_path):
+    db = sqlite3.connect(catalog_path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def build_catalog(forcing_dir, catalog_path, workers=1):
+    """Scan new/changed files of forcing_dir into catalog_path and drop removed ones."""
+    forcing_dir = os.path.abspath(forcing_dir)
+    if RANK == 0:
+        found = walk_archive(forcing_dir)
+        known = {}
+        if os.path.exists(catalog_path):
+            db = connect(catalog_path)
+            root = db.execute("SELECT value FROM meta WHERE key = 'forcing_dir'").fetchone()
+            if root is None or root[0] == forcing_dir:
+                known = {path: (size, mtime) for path, size, mtime in
+                         db.execute("SELECT path, size, mtime_ns FROM files")}
+            else:
+                print(f"Catalog was built for {root[0]}; rescanning every file")
+            db.close()
+        todo = sorted(key for key, stat in found.items() if known.get(key) != stat)
+        removed = sorted(set(known) - set(found))
+        print(f"Scanning {len(todo)} of {len(found)} files ({len(removed)} removed since the last build)")
+    else:
+        found = todo = removed = None
+    if SIZE > 1:
+        found, todo = COMM.bcast((found, todo), root=0)
+
+    jobs = [(forcing_dir, key, found[key]) for key in todo[RANK::SIZE]]
+    if SIZE == 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = list(executor.map(_scan_one, jobs, chunksize=8))
+    else:
+        records = [_scan_one(job) for job in jobs]
+    if SIZE > 1:
+        gathered = COMM.gather(records, root=0)
+        if RANK == 0:
+            records = [r for part in gathered for r in part]
+    if RANK != 0:
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+    db = connect(catalog_path)
+    with db:
+        stale = removed + [row[0] for row, _, _ in records]
+        if not known:
+            # new catalog, or one built for another forcing_dir
+            stale = [path for (path,) in db.execute("SELECT path FROM files")]
+        for table in ('files', 'dimensions', 'variables'):
+            db.executemany(f"DELETE FROM {table} WHERE path = ?", [(path,) for path in stale])
+        db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       [row for row, _, _ in records])
+        db.executemany("INSERT INTO dimensions VALUES (?, ?, ?, ?)", [d for _, dims, _ in records for d in dims])
+        db.executemany("INSERT INTO variables VALUES (?, ?, ?, ?, ?)", [v for _, _, vs in records for v in vs])
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('forcing_dir', ?)", (forcing_dir,))
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)",
+                   (datetime.now().isoformat(timespec='seconds'),))
+    n_files = db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    db.close()
+    print(f"Catalog: {n_files} files in {catalog_path}")
+
+
+class ForcingCatalog:
+    """Read side of a catalog: the task list and file sizes of a forcing generation run."""
+
+    def __init__(self, catalog_path):
+        if not os.path.exists(catalog_path):
+            raise FileNotFoundError(f"no forcing catalog at {catalog_path} (run 'aoi_catalog.py build' first)")
+        self.catalog_path = catalog_path
+        db = sqlite3.connect(catalog_path)
+        try:
+            self.forcing_dir = db.execute("SELECT value FROM meta WHERE key = 'forcing_dir'").fetchone()[0]
+            self.files = {path: {'size': size, 'mtime_ns': mtime}
+                          for path, size, mtime in db.execute("SELECT path, size, mtime_ns FROM files")}
+        finally:
+            db.close()
+
+    def tasks(self, input_path, output_path):
+        """(root, file, new_dir) tasks, as TES_AOI_forcingGEN_mpi._discover_tasks builds them."""
+        if os.path.abspath(input_path) != self.forcing_dir:
+            print(f"Warning: catalog {self.catalog_path} was built for {self.forcing_dir}, not {input_path}")
+        tasks = []
+        for key in sorted(self.files):
+            subdir, file = os.path.split(key)
+            tasks.append((os.path.join(input_path, subdir), file, os.path.join(output_path, subdir)))
+        return tasks
+
+    def stat(self, input_path, source_file):
+        """Cataloged {size, mtime_ns} of source_file (a path under input_path), or None."""
+        return self.files.get(os.path.normpath(os.path.relpath(source_file, input_path)))
+
+    def size(self, input_path, source_file):
+        rec = self.stat(input_path, source_file)
+        return rec['size'] if rec is not None else 0
+
+
+def summarize(catalog_path):
+    db = sqlite3.connect(catalog_path)
+    try:
+        root, updated = (db.execute("SELECT value FROM meta WHERE key = ?", (k,)).fetchone()[0]
+                         for k in ('forcing_dir', 'updated'))
+        print(f"{catalog_path}: {root} (updated {updated})")
+        rows = db.execute("SELECT var_name, COUNT(*), SUM(size), MIN(period), MAX(period), "
+                          "COUNT(DISTINCT gridid_fingerprint) FROM files GROUP BY var_name ORDER BY var_name")
+        print(f"{'variable':>10s} {'files':>7s} {'GB':>9s} {'first':>9s} {'last':>9s} {'layouts':>8s}")
+        for var_name, n, size, first, last, layouts in rows:
+            print(f"{str(var_name):>10s} {n:7d} {size / 1e9:9.2f} {str(first):>9s} {str(last):>9s} {layouts:8d}")
+        shapes = db.execute("SELECT name, dtype, shape, COUNT(*) FROM variables WHERE dimensions LIKE 'time,%' "
+                            "GROUP BY name, dtype, shape ORDER BY name")
+        print()
+        print(f"{'variable':>10s} {'dtype':>8s} {'files':>7s} shape (time,...)")
+        for name, dtype, shape, n in shapes:
+            print(f"{name:>10s} {dtype:>8s} {n:7d} ({shape})")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite metadata catalog of a TES forcing archive.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="build (or refresh) a catalog")
+    p.add_argument("forcing_dir", help="source forcing directory")
+    p.add_argument("catalog", help="SQLite file to create or update")
+    p.add_argument("--workers", type=int, default=1, help="local worker processes when not under MPI")
+    p = sub.add_parser('info', help="summarize a catalog")
+    p.add_argument("catalog")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        try:
+            build_catalog(args.forcing_dir, args.catalog, args.workers)
+        except BaseException:
+            if SIZE > 1:
+                # the other ranks are waiting in a collective; take the whole job down
+                import traceback
+                traceback.print_exc()
+                COMM.Abort(1)
+            raise
+    else:
+        summarize(args.catalog)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# aoi_cdf: memory-mapped reader for classic netCDF (CDF-1, CDF-2 and CDF-5) forcing files
+#
+# The classic format keeps every variable at a fixed offset given in the file header: a
+# non-record variable is one contiguous block, a record variable one slice per record, records
+# being recsize bytes apart. MappedFile parses the header once and exposes each variable as a
+# numpy view of the mapped file, so time chunks and AOI columns are sliced or fancy-indexed
+# straight out of the page cache, without a netCDF library call per read.
+
+import mmap
+import struct
+
+import numpy as np
+from netCDF4 import default_fillvals
+
+_MAGIC = b'CDF'
+_STREAMING = 0xFFFFFFFF
+_NC_DIMENSION, _NC_VARIABLE, _NC_ATTRIBUTE = 0x0A, 0x0B, 0x0C
+_NC_TYPES = {1: 'i1', 2: 'S1', 3: '>i2', 4: '>i4', 5: '>f4', 6: '>f8',
+             7: 'u1', 8: '>u2', 9: '>u4', 10: '>i8', 11: '>u8'}
+
+
+class _Header:
+    """Sequential big-endian reader of a classic netCDF header."""
+
+    def __init__(self, buf, version):
+        self.buf = buf
+        self.pos = 4
+        self.version = version
+
+    def int32(self):
+        value, = struct.unpack_from('>i', self.buf, self.pos)
+        self.pos += 4
+        return value
+
+    def count(self):
+        """NON_NEG: 32-bit in CDF-1/2, 64-bit in CDF-5."""
+        if self.version == 5:
+            value, = struct.unpack_from('>q', self.buf, self.pos)
+            self.pos += 8
+            return value
+        value, = struct.unpack_from('>I', self.buf, self.pos)
+        self.pos += 4
+        return value
+
+    def offset(self):
+        """OFFSET: 32-bit in CDF-1, 64-bit in CDF-2/5."""
+        fmt, size = ('>i', 4) if self.version == 1 else ('>q', 8)
+        value, = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += size
+        return value
+
+    def padded(self, nbytes):
+        data = bytes(self.buf[self.pos:self.pos + nbytes])
+        self.pos += (nbytes + 3) // 4 * 4
+        return data
+
+    def name(self):
+        return self.padded(self.count()).decode('utf-8')
+
+    def list_header(self, tag):
+        found, n = self.int32(), self.count()
+        if found not in (0, tag):
+            raise ValueError(f"corrupt header: expected tag {tag:#x}, found {found:#x}")
+        return n
+
+    def attributes(self):
+        attrs = {}
+        for _ in range(self.list_header(_NC_ATTRIBUTE)):
+            name = self.name()
+            dtype = np.dtype(_NC_TYPES[self.int32()])
+            n = self.count()
+            attrs[name] = np.frombuffer(self.padded(n * dtype.itemsize), dtype=dtype)
+        return attrs
+
+
+class MappedFile:
+    """Header and mapped data of a classic netCDF file.
+
+    dimensions: name -> length (the record dimension reports numrecs)
+    variables:  name -> dict(dimensions, dtype, begin, shape, record, attributes)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._views = {}
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: empty file")
+        try:
+            if self._mm[:3] != _MAGIC or self._mm[3] not in (1, 2, 5):
+                raise ValueError(f"{path}: not a classic (CDF-1/2/5) netCDF file")
+            self.version = self._mm[3]
+            self._parse()
+        except BaseException:
+            self.close()
+            raise
+
+    def _parse(self):
+        h = _Header(self._mm, self.version)
+        numrecs = h.count()
+        if numrecs == _STREAMING:
+            raise ValueError(f"{self.path}: numrecs is not set (file still being written)")
+
+        dims = []
+        for _ in range(h.list_header(_NC_DIMENSION)):
+            dims.append((h.name(), h.count()))
+        self.attributes = h.attributes()
+
+        self.variables = {}
+        record_vars = []
+        for _ in range(h.list_header(_NC_VARIABLE)):
+            name = h.name()
+            dimids = [h.count() if self.version == 5 else h.int32() for _ in range(h.count())]
+            attributes = h.attributes()
+            dtype = np.dtype(_NC_TYPES[h.int32()])
+            h.count()  # vsize: recomputed below, it overflows for > 4 GiB variables in CDF-2
+            begin = h.offset()
+            record = bool(dimids) and dims[dimids[0]][1] == 0
+            shape = tuple(numrecs if (record and i == 0) else dims[d][1] for i, d in enumerate(dimids))
+            self.variables[name] = dict(dimensions=tuple(dims[d][0] for d in dimids), dtype=dtype,
+                                        begin=begin, shape=shape, record=record, attributes=attributes)
+            if record:
+                record_vars.append(name)
+
+        # a record holds one padded slice of every record variable; with a single record
+        # variable the slices are not padded
+        slice_sizes = [int(np.prod(self.variables[v]['shape'][1:], dtype=np.int64)) * self.variables[v]['dtype'].itemsize
+                       for v in record_vars]
+        if len(record_vars) == 1:
+            self.recsize = slice_sizes[0]
+        else:
+            self.recsize = sum((n + 3) // 4 * 4 for n in slice_sizes)
+        self.numrecs = numrecs
+        self.dimensions = {name: (numrecs if length == 0 else length) for name, length in dims}
+
+    def view(self, name):
+        """Read-only numpy view (on-disk big-endian dtype) of variable `name` in the mapped file."""
+        view = self._views.get(name)
+        if view is None:
+            var = self.variables[name]
+            dtype, shape = var['dtype'], var['shape']
+            strides = _c_strides(shape, dtype.itemsize)
+            if var['record']:
+                strides[0] = self.recsize
+            view = np.ndarray(shape, dtype=dtype, buffer=self._mm, offset=var['begin'], strides=tuple(strides))
+            self._views[name] = view
+        return view
+
+    def close(self):
+        self._views.clear()
+        if getattr(self, '_mm', None) is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # an array still refers to the mapping; it is released with that array
+            self._mm = None
+        self._file.close()
+
+
+def _c_strides(shape, itemsize):
+    strides = []
+    step = itemsize
+    for n in reversed(shape):
+        strides.insert(0, step)
+        step *= n
+    return strides
+
+
+class MappedVariable:
+    """A 3D forcing variable read from a MappedFile, with netCDF4-python's read semantics.
+
+    ncvar is the netCDF4 variable of the same file, used for its attributes. With
+    mask_and_scale=True reads are unpacked (scale_factor/add_offset) exactly as netCDF4 does
+    for values that are then taken with np.ma.getdata: masked values (_FillValue or the default
+    fill, missing_value, outside valid_range/valid_min/valid_max) keep their packed value.
+    With mask_and_scale=False reads are the on-disk values in native byte order.
+    """
+
+    def __init__(self, mapped, ncvar, mask_and_scale=True):
+        self.mapped = mapped
+        self.ncvar = ncvar
+        self.name = ncvar.name
+        self.mask_and_scale = mask_and_scale
+        self._view = mapped.view(ncvar.name)
+        self.shape = self._view.shape
+        self.dimensions = ncvar.dimensions
+        self.dtype = self._view.dtype.newbyteorder('=')
+
+    def __getattr__(self, name):
+        # netCDF attributes (scale_factor, ...) of the variable
+        return getattr(self.ncvar, name)
+
+    def __getitem__(self, key):
+        return self._convert(self._view[key])
+
+    def read_columns(self, start, end, columns):
+        """Time steps [start, end) of the cells at positions `columns`, in one fancy-indexed gather."""
+        return self._convert(self._view[start:end, ..., columns])
+
+    def _convert(self, data):
+        data = data.astype(self.dtype)  # native byte order, and a copy out of the mapping
+        if not self.mask_and_scale:
+            return data
+        var = self.ncvar
+        unsigned = getattr(var, '_Unsigned', False) in ("true", "True") and data.dtype.kind == 'i'
+        if unsigned:
+            data = data.view(f"u{data.dtype.itemsize}")
+        scale_factor = getattr(var, 'scale_factor', None)
+        add_offset = getattr(var, 'add_offset', None)
+        if scale_factor is None and add_offset is None:
+            return data  # masked values keep their on-disk value in the data of a masked read
+        if scale_factor is not None and add_offset is not None:
+            if add_offset != 0.0 or scale_factor != 1.0:
+                unpacked = data * scale_factor + add_offset
+            else:
+                unpacked = data.astype(np.asarray(scale_factor).dtype)
+        elif scale_factor is not None:
+            if scale_factor == 1.0:
+                return data
+            unpacked = data * scale_factor
+        else:
+            if add_offset == 0.0:
+                return data
+            unpacked = data + add_offset
+        mask = self._mask(data, unsigned)
+        if mask.any():
+            np.copyto(unpacked, data, casting='unsafe', where=mask)
+        return unpacked
+
+    def _mask(self, data, unsigned):
+        """The mask netCDF4-python's Variable._toma computes for `data`."""
+        var = self.ncvar
+        disk = var.dtype
+
+        def attr(name):
+            value = np.array(getattr(var, name), disk)
+            return value.view(data.dtype) if unsigned else value
+
+        mask = np.zeros(data.shape, dtype=bool)
+        if hasattr(var, 'missing_value'):
+            for m in np.atleast_1d(attr('missing_value')):
+                mask |= np.isnan(data) if _isnan(m) else data == m
+        if hasattr(var, '_FillValue'):
+            fval = attr('_FillValue')
+            mask |= np.isnan(data) if _isnan(fval) else data == fval
+        else:
+            # classic files have filling on, so the default fill is masked for every type (bytes too)
+            fval = np.array(default_fillvals[disk.str[1:]], disk)
+            mask |= data == fval
+        validmin = validmax = None
+        if hasattr(var, 'valid_range') and np.size(var.valid_range) == 2:
+            validmin, validmax = (np.array(v, disk) for v in np.ravel(var.valid_range))
+        else:
+            if hasattr(var, 'valid_min'):
+                validmin = np.array(var.valid_min, disk)
+            if hasattr(var, 'valid_max'):
+                validmax = np.array(var.valid_max, disk)
+        if unsigned:
+            validmin = None if validmin is None else validmin.view(data.dtype)
+            validmax = None if validmax is None else validmax.view(data.dtype)
+        if validmin is not None:
+            mask |= data < validmin
+        if validmax is not None:
+            mask |= data > validmax
+        return mask
+
+
+def _isnan(value):
+    try:
+        return bool(np.isnan(value))
+    except TypeError:
+        return False
+
+
+def open_mapped(path):
+    """MappedFile of path, or None if it is not a classic netCDF file that can be mapped."""
+    try:
+        return MappedFile(path)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# aoi_cellstore: cell-major (time-contiguous) copy of the TES forcing for point and site AOIs
+#
+#   python3 aoi_cellstore.py build <forcing_dir> <store_dir> [--cells-per-chunk 16] [--complevel 0]
+#   python3 aoi_cellstore.py info <store_dir>
+#
+# Every source file <forcing_dir>/<subdir>/<name>.nc is rewritten as <store_dir>/<subdir>/<name>.nc
+# in NETCDF4_CLASSIC with the same dimensions, variables and attributes, but with every
+# (time, nj, ni) variable chunked as (all time steps, nj, cells_per_chunk): the full time series
+# of a cell is one contiguous HDF5 chunk. Values are copied raw (packing and _FillValue kept).
+# store_index.json records the size/mtime of each converted source file.
+#
+# TES_AOI_forcingGEN_mpi.py --cell-store <store_dir> reads converted files from the store and
+# fetches only the chunks holding AOI cells, each over the whole time axis unless --chunk-size or
+# --mem-budget caps the time chunk.
+
+import argparse
+import json
+import os
+import sys
+
+import netCDF4 as nc
+
+from aoi_gather import create_variable_like, is_cell_variable
+from aoi_tiles import source_files, source_stat
+
+try:
+    from mpi4py import MPI
+    COMM = MPI.COMM_WORLD
+    RANK = COMM.Get_rank()
+    SIZE = COMM.Get_size()
+except Exception:
+    COMM = None
+    RANK = 0
+    SIZE = 1
+
+INDEX_JSON = 'store_index.json'
+
+
+def convert_file(source_file, store_file, cells_per_chunk=16, block_cells=65536, complevel=0):
+    """Write the cell-major copy of one source file.
+
+    3D variables are copied in blocks of block_cells cells with all time steps, so every
+    HDF5 chunk is written exactly once; peak memory is about time * nj * block_cells values.
+    """
+    src = nc.Dataset(source_file, 'r')
+    src.set_auto_maskandscale(False)
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    part_name = os.path.join(os.path.dirname(store_file), '.' + os.path.basename(store_file) + '.part')
+    dst = nc.Dataset(part_name, 'w', format='NETCDF4_CLASSIC')
+    dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+    for name, dimension in src.dimensions.items():
+        dst.createDimension(name, None if dimension.isunlimited() else len(dimension))
+
+    for name, variable in src.variables.items():
+        if is_cell_variable(variable) and len(variable.dimensions) == 3:
+            d0, d1, d2 = variable.shape
+            compression = dict(zlib=True, complevel=complevel, shuffle=True) if complevel > 0 else {}
+            x = dst.createVariable(name, variable.datatype, variable.dimensions,
+                                   fill_value=getattr(variable, '_FillValue', None),
+                                   chunksizes=(max(d0, 1), d1, min(cells_per_chunk, d2)), **compression)
+            x.set_auto_maskandscale(False)
+        else:
+            x = create_variable_like(dst, name, variable, raw=True)
+        x.setncatts({a: variable.getncattr(a) for a in variable.ncattrs() if a != '_FillValue'})
+
+        if is_cell_variable(variable) and len(variable.dimensions) == 3:
+            d0, d1, d2 = variable.shape
+            block = max(cells_per_chunk, block_cells // cells_per_chunk * cells_per_chunk)
+            for lo in range(0, d2, block):
+                x[0:d0, :, lo:lo + block] = variable[:, :, lo:lo + block]
+        else:
+            x[...] = variable[...]
+
+    src.close()
+    dst.close()
+    os.replace(part_name, store_file)
+
+
+def build_store(forcing_dir, store_dir, cells_per_chunk=16, block_cells=65536, complevel=0, workers=1):
+    """Convert every .nc file under forcing_dir (files already converted and unchanged are skipped)."""
+    if RANK == 0:
+        keys = source_files(forcing_dir)
+        meta = {'cells_per_chunk': cells_per_chunk, 'complevel': complevel, 'files': {}}
+        json_path = os.path.join(store_dir, INDEX_JSON)
+        if os.path.exists(json_path):
+            with open(json_path) as f:
+                old = json.load(f)
+            if (old['cells_per_chunk'], old['complevel']) == (cells_per_chunk, complevel):
+                meta = old
+            else:
+                print("Existing store uses another chunking/compression; converting every file")
+        todo = [key for key in keys if meta['files'].get(key) != source_stat(os.path.join(forcing_dir, key))]
+        print(f"Converting {len(todo)} of {len(keys)} files to cell-major chunks of {cells_per_chunk} cells")
+    else:
+        todo = meta = None
+    if SIZE > 1:
+        todo, meta = COMM.bcast((todo, meta), root=0)
+
+    jobs = [(forcing_dir, store_dir, key, cells_per_chunk, block_cells, complevel) for key in todo[RANK::SIZE]]
+    if SIZE == 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            done = dict(executor.map(_convert_one, jobs))
+    else:
+        done = dict(_convert_one(job) for job in jobs)
+    if SIZE > 1:
+        gathered = COMM.gather(done, root=0)
+        if RANK == 0:
+            done = {k: v for d in gathered for k, v in d.items()}
+    if RANK == 0:
+        meta['files'].update(done)
+        os.makedirs(store_dir, exist_ok=True)
+        tmp = os.path.join(store_dir, f".{INDEX_JSON}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(store_dir, INDEX_JSON))
+        print(f"Store index: {len(meta['files'])} files in {os.path.join(store_dir, INDEX_JSON)}")
+
+
+def _convert_one(job):
+    forcing_dir, store_dir, key, cells_per_chunk, block_cells, complevel = job
+    source_file = os.path.join(forcing_dir, key)
+    stat = source_stat(source_file)  # before reading, so a file rewritten meanwhile is converted again
+    print(f"[rank {RANK}] converting {key}")
+    convert_file(source_file, os.path.join(store_dir, key), cells_per_chunk, block_cells, complevel)
+    return key, stat
+
+
+class CellStore:
+    """Read side of a cell-major store: which source files it can stand in for."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_JSON)) as f:
+            self.meta = json.load(f)
+
+    def covers(self, key, source_file):
+        """True if key was converted from the current source_file (unchanged size and mtime)."""
+        rec = self.meta['files'].get(os.path.normpath(key))
+        return rec is not None and rec == source_stat(source_file)
+
+    def open(self, key):
+        return nc.Dataset(os.path.join(self.store_dir, os.path.normpath(key)), 'r')
+
+
+def is_cell_major(variable):
+    """True for a variable whose HDF5 chunks hold every time step (see convert_file)."""
+    chunking = variable.chunking() if hasattr(variable, 'chunking') else 'contiguous'
+    return chunking not in (None, 'contiguous') and chunking[0] >= variable.shape[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cell-major (time-contiguous) copy of the TES forcing archive.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="convert (or update) a forcing archive")
+    p.add_argument("forcing_dir", help="source forcing directory")
+    p.add_argument("store_dir", help="destination of the converted files and store_index.json")
+    p.add_argument("--cells-per-chunk", type=int, default=16, help="cells per HDF5 chunk (all time steps)")
+    p.add_argument("--block-cells", type=int, default=65536, help="cells converted per read (memory bound)")
+    p.add_argument("--complevel", type=int, default=0, help="zlib level with shuffle (0 = uncompressed)")
+    p.add_argument("--workers", type=int, default=1, help="local worker processes when not under MPI")
+    p = sub.add_parser('info', help="summarize a store")
+    p.add_argument("store_dir")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        try:
+            build_store(args.forcing_dir, args.store_dir, args.cells_per_chunk, args.block_cells,
+                        args.complevel, args.workers)
+        except BaseException:
+            if SIZE > 1:
+                # the other ranks are waiting in a collective; take the whole job down
+                import traceback
+                traceback.print_exc()
+                COMM.Abort(1)
+            raise
+    else:
+        store = CellStore(args.store_dir)
+        print(f"{len(store.meta['files'])} files, {store.meta['cells_per_chunk']} cells per chunk, "
+              f"complevel {store.meta['complevel']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# aoi_chunking: time-chunk length for forcing subsetting from a per-rank memory budget
+
+import re
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+
+from aoi_gather import gather_chunk, plan_slabs, read_slabs, slab_positions
+
+DEFAULT_CHUNK_SIZE = 16  # time steps per read without --chunk-size or a budget (the scripts' original value)
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+    """Parse a memory size such as '512M', '2G', '1.5GiB' or '1000000' to bytes."""
+    m = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)(I?B)?\s*', str(text).upper())
+    if m is None:
+        raise ValueError(f"cannot parse memory size {text!r} (e.g. 512M, 2G)")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2)])
+
+
+def read_dtype(variable, raw=False):
+    """In-memory dtype of values read from `variable`, from its metadata (no data read)."""
+    # default reads of packed variables come back in the dtype of scale_factor
+    dtype = variable.dtype
+    if not raw and hasattr(variable, 'scale_factor'):
+        dtype = np.result_type(dtype, np.asarray(variable.scale_factor).dtype)
+    return np.dtype(dtype)
+
+
+def chunk_size_for_budget(shape, dtype, n_aoi, mem_budget, prefetch=0, n_targets=1, stream=True,
+                          masked=True):
+    """Largest time-chunk length whose working set fits in mem_budget bytes.
+
+    shape:     (time, nj, ni) of the source variable; dtype: its in-memory dtype
+    n_aoi:     AOI cells per target (the AOI fraction is n_aoi / ni)
+    prefetch:  read-ahead depth; prefetch + 2 source chunks can be alive at once (see _read_chunks)
+    n_targets: AOIs written from the same read (multi-AOI fan-out)
+    stream:    False adds the whole-variable staging buffer of every target as a fixed cost
+    masked:    default (non-raw) reads also carry a one-byte-per-element mask
+
+    Returns at least 1 and at most the number of timesteps.
+    """
+    d0, d1, d2 = shape
+    itemsize = np.dtype(dtype).itemsize
+    fixed = 0
+    per_step = (prefetch + 2) * d1 * d2 * (itemsize + (1 if masked else 0))
+    if stream:
+        per_step += n_targets * d1 * n_aoi * itemsize
+    else:
+        fixed = n_targets * d0 * d1 * n_aoi * itemsize
+    return int(max(1, min(d0, (mem_budget - fixed) // per_step)))
+
+
+def calibrate_chunk_size(source_file, AOI_idx, candidates=(4, 8, 16, 32, 64), raw=False, slab_gap=None,
+                         max_steps=128):
+    """Time read + gather of the first 3D variable of source_file per candidate chunk size.
+
+    Only the first max_steps time steps are timed, read as the generator reads them: over the
+    slabs planned for slab_gap (see aoi_gather.plan_slabs), or full width when slab_gap is None.
+    The prefix is read once before timing so every candidate sees the same (warm) cache.
+    Returns (best chunk size, {chunk size: seconds}).
+    """
+    src = nc.Dataset(source_file, 'r')
+    if raw:
+        src.set_auto_maskandscale(False)
+    try:
+        variable = next((v for v in src.variables.values()
+                         if len(v.dimensions) == 3 and v.dimensions[-1] in ('ni', 'gridcell')), None)
+        if variable is None:
+            return DEFAULT_CHUNK_SIZE, {}
+        steps = min(variable.shape[0], max_steps)
+        sizes = sorted({min(c, steps) for c in candidates})
+        AOI_idx = np.asarray(AOI_idx, dtype=np.int64)
+        if slab_gap is None or AOI_idx.size == 0:
+            slabs, positions = None, AOI_idx
+        else:
+            slabs = plan_slabs(AOI_idx, read_dtype(variable, raw).itemsize, slab_gap)
+            positions = slab_positions(AOI_idx, slabs)
+
+        def read(start, end):
+            return variable[start:end, :, :] if slabs is None else read_slabs(variable, start, end, slabs)
+
+        read(0, steps)  # warm-up
+        timings = {}
+        for chunk_size in sizes:
+            t0 = perf_counter()
+            for start in range(0, steps, chunk_size):
+                gather_chunk(read(start, min(start + chunk_size, steps)), positions)
+            timings[chunk_size] = perf_counter() - t0
+        return min(timings, key=timings.get), timings
+    finally:
+        src.close()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# aoi_consolidate: concatenate the AOI forcing period files of each variable into yearly or decadal files
+#
+#   python3 aoi_consolidate.py <experiment_root>/forcing <experiment_root>/forcing_consolidated [--by year|decade]
+#
+# Every group of files <subdir>/<AOI>_clmforc.<dataset>.<res>.1d.<VAR>.<YYYY-MM>.nc that falls into the
+# same year (or decade), whatever their subdirectories, is written as one file
+# <subdir>/<AOI>_clmforc.<dataset>.<res>.1d.<VAR>.<label>.nc in the subdirectory of its first member,
+# label '1980' or '1980-1989', concatenated along the time dimension in period order. Variables
+# without a time dimension are taken from the first file. Values are copied raw, chunk_size time
+# steps at a time, so memory is bounded by one chunk whatever the length of the group.
+# consolidate_index.json records the size/mtime of the members of each output; reruns only
+# rewrite groups whose members changed.
+#
+# The output keeps the naming forcing_domain_link_creation.py expects: it links the consolidated
+# tree instead of <experiment_root>/forcing when <experiment_root>/forcing_consolidated exists.
+# datm_streams.txt lists the linked file names of each variable for the DATM stream files.
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+import netCDF4 as nc
+import numpy as np
+
+from aoi_gather import create_variable_like
+from aoi_tiles import source_files, source_stat
+
+try:
+    from mpi4py import MPI
+    COMM = MPI.COMM_WORLD
+    RANK = COMM.Get_rank()
+    SIZE = COMM.Get_size()
+except Exception:
+    COMM = None
+    RANK = 0
+    SIZE = 1
+
+INDEX_JSON = 'consolidate_index.json'
+STREAMS_TXT = 'datm_streams.txt'
+DEFAULT_CHUNK_SIZE = 365
+
+
+def group_label(period, by='year'):
+    """'1985-07' -> '1985' (by year) or '1980-1989' (by decade)."""
+    year = int(period[:4])
+    if by == 'year':
+        return f"{year:04d}"
+    decade = year // 10 * 10
+    return f"{decade:04d}-{decade + 9:04d}"
+
+
+def plan_groups(keys, by='year'):
+    """Map output key -> sorted member keys for the period files among keys.
+
+    The variable and period are the parts[4]/parts[5] fields of the '.'-separated file name,
+    as in TES_AOI_forcingGEN_mpi.py; files without a YYYY-MM period field are left out.
+    Members are grouped by output file name across subdirectories (a decade spans the per-year
+    subdirectories), and each output is written once, in the subdirectory of its first member.
+    Raises ValueError when a period appears twice in a group or two outputs share a link name.
+    """
+    groups = defaultdict(list)
+    for key in keys:
+        parts = os.path.basename(key).split('.')
+        if len(parts) < 7 or not (len(parts[5]) >= 4 and parts[5][:4].isdigit()):
+            continue
+        groups['.'.join(parts[:5] + [group_label(parts[5], by)] + parts[6:])].append(key)
+
+    planned = {}
+    links = {}
+    for out_file, members in sorted(groups.items()):
+        members = sorted(members, key=lambda k: (os.path.basename(k).split('.')[5], k))
+        periods = [os.path.basename(k).split('.')[5] for k in members]
+        for previous, key, period in zip(members, members[1:], periods[1:]):
+            if os.path.basename(previous).split('.')[5] == period:
+                raise ValueError(f"period {period} of {out_file} is in both {previous} and {key}")
+        out_key = os.path.join(os.path.dirname(members[0]), out_file)
+        name = link_name(out_key)
+        if name in links:
+            raise ValueError(f"{links[name]} and {out_key} would both be linked as {name}")
+        links[name] = out_key
+        planned[out_key] = members
+    return dict(sorted(planned.items()))
+
+
+def link_name(file):
+    """Name under atm_forcing.datm7.km.1d, as given by forcing_domain_link_creation.py."""
+    parts = os.path.basename(file).split('_')
+    name = '_'.join(parts[1:]) if len(parts) > 1 else os.path.basename(file)
+    return name[:len('clmforc.')] + 'Daymet.km' + name[name.find('.1d'):]
+
+
+def _variable_kwargs(variable):
+    """Chunking/compression of a NETCDF4 source variable, to carry over to the output."""
+    if not hasattr(variable, 'chunking'):
+        return {}
+    try:
+        chunking = variable.chunking()
+        filters = variable.filters() or {}
+    except Exception:
+        return {}  # netCDF-3 source
+    kwargs = {}
+    if chunking not in (None, 'contiguous'):
+        kwargs['chunksizes'] = tuple(chunking)
+    if filters.get('zlib'):
+        kwargs.update(zlib=True, complevel=filters.get('complevel', 4), shuffle=filters.get('shuffle', False))
+    return kwargs
+
+
+def consolidate_group(member_files, out_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Concatenate member_files along time into out_file (written as a hidden .part, then renamed).
+
+    Dimensions other than time, and gridID when present, must match the first member. Time
+    coordinates with a different 'units' attribute are converted to the units of the first member.
+    """
+    first = nc.Dataset(member_files[0], 'r')
+    first.set_auto_maskandscale(False)
+    time_dim = 'time' if 'time' in first.dimensions else next(
+        (name for name, d in first.dimensions.items() if d.isunlimited()), None)
+    if time_dim is None:
+        first.close()
+        raise ValueError(f"{member_files[0]} has no time dimension to concatenate along")
+
+    os.makedirs(os.path.dirname(out_file) or '.', exist_ok=True)
+    part_name = os.path.join(os.path.dirname(out_file), '.' + os.path.basename(out_file) + '.part')
+    dst = nc.Dataset(part_name, 'w', format=first.data_model)
+    dst.setncatts({name: first.getncattr(name) for name in first.ncattrs()})
+    for name, dimension in first.dimensions.items():
+        dst.createDimension(name, None if name == time_dim else len(dimension))
+
+    time_vars = []
+    for name, variable in first.variables.items():
+        x = create_variable_like(dst, name, variable, raw=True, **_variable_kwargs(variable))
+        x.setncatts({a: variable.getncattr(a) for a in variable.ncattrs() if a != '_FillValue'})
+        if time_dim in variable.dimensions:
+            if variable.dimensions[0] != time_dim:
+                raise ValueError(f"{name}: time must be the leading dimension")
+            time_vars.append(name)
+        else:
+            x[...] = variable[...]
+    grid_ids = first['gridID'][...] if 'gridID' in first.variables else None
+    first.close()
+
+    start = 0
+    for member_file in member_files:
+        src = nc.Dataset(member_file, 'r')
+        src.set_auto_maskandscale(False)
+        for name, dimension in dst.dimensions.items():
+            if name != time_dim and len(src.dimensions[name]) != len(dimension):
+                raise ValueError(f"{member_file}: dimension {name} is {len(src.dimensions[name])}, "
+                                 f"expected {len(dimension)}")
+        if grid_ids is not None and not np.array_equal(src['gridID'][...], grid_ids):
+            raise ValueError(f"{member_file}: gridID differs from the first file of the group")
+        n_time = len(src.dimensions[time_dim])
+        for name in time_vars:
+            variable, x = src[name], dst[name]
+            convert = (getattr(variable, 'units', None) != getattr(x, 'units', None)
+                       and 'since' in str(getattr(x, 'units', '')))
+            for lo in range(0, n_time, chunk_size):
+                hi = min(lo + chunk_size, n_time)
+                values = variable[lo:hi]
+                if convert:
+                    calendar = getattr(x, 'calendar', 'standard')
+                    dates = nc.num2date(values, variable.units, calendar)
+                    values = np.asarray(nc.date2num(dates, x.units, calendar)).astype(x.dtype)
+                x[start + lo:start + hi] = values
+        src.close()
+        start += n_time
+
+    dst.close()
+    os.replace(part_name, out_file)
+    return start
+
+
+def write_streams(out_dir, groups, stream_path=None):
+    """Write datm_streams.txt: per variable, the <filePath>/<fileNames> block of its DATM stream."""
+    per_var = defaultdict(list)
+    for out_key in groups:
+        per_var[os.path.basename(out_key).split('.')[4]].append(link_name(out_key))
+    stream_path = stream_path or '$DIN_LOC_ROOT_CLMFORC/atm_forcing.datm7.km.1d'
+    lines = [f"<!-- generated by aoi_consolidate.py from {os.path.abspath(out_dir)} -->"]
+    for var, names in sorted(per_var.items()):
+        lines.append(f"<!-- {var} -->")
+        lines.append("<filePath>")
+        lines.append(f"   {stream_path}")
+        lines.append("</filePath>")
+        lines.append("<fileNames>")
+        lines.extend(f"   {name}" for name in sorted(names))
+        lines.append("</fileNames>")
+    tmp = os.path.join(out_dir, f".{STREAMS_TXT}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, os.path.join(out_dir, STREAMS_TXT))
+
+
+def consolidate_archive(forcing_dir, out_dir, by='year', chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                        force=False, stream_path=None):
+    """Consolidate every period group under forcing_dir (unchanged groups already written are skipped)."""
+    if RANK == 0:
+        try:
+            groups = plan_groups(source_files(forcing_dir), by)
+        except ValueError as e:
+            raise SystemExit(f"cannot consolidate {forcing_dir}: {e}")
+        if not groups:
+            raise SystemExit(f"no period files under {forcing_dir}")
+        meta = {'by': by, 'files': {}}
+        json_path = os.path.join(out_dir, INDEX_JSON)
+        if os.path.exists(json_path):
+            with open(json_path) as f:
+                old = json.load(f)
+            # outputs of another grouping (or of removed periods) would be linked alongside the new ones
+            for out_key in old['files']:
+                if out_key not in groups and os.path.exists(os.path.join(out_dir, out_key)):
+                    os.remove(os.path.join(out_dir, out_key))
+            if old['by'] != by:
+                print(f"Existing consolidation is per {old['by']}; rewriting every group")
+            elif not force:
+                meta = old
+        members_stat = {out_key: {key: source_stat(os.path.join(forcing_dir, key)) for key in members}
+                        for out_key, members in groups.items()}
+        todo = [out_key for out_key in groups
+                if meta['files'].get(out_key) != members_stat[out_key]
+                or not os.path.exists(os.path.join(out_dir, out_key))]
+        n_members = sum(len(m) for m in groups.values())
+        print(f"Consolidating {n_members} files into {len(groups)} per-{by} files ({len(todo)} to write)")
+    else:
+        groups = todo = meta = members_stat = None
+    if SIZE > 1:
+        groups, todo, meta, members_stat = COMM.bcast((groups, todo, meta, members_stat), root=0)
+
+    jobs = [(forcing_dir, out_dir, out_key, groups[out_key], members_stat[out_key], chunk_size)
+            for out_key in todo[RANK::SIZE]]
+    if SIZE == 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            done = dict(executor.map(_consolidate_one, jobs))
+    else:
+        done = dict(_consolidate_one(job) for job in jobs)
+    if SIZE > 1:
+        gathered = COMM.gather(done, root=0)
+        if RANK == 0:
+            done = {k: v for d in gathered for k, v in d.items()}
+    if RANK == 0:
+        meta['files'].update(done)
+        meta['files'] = {k: v for k, v in meta['files'].items() if k in groups}
+        os.makedirs(out_dir, exist_ok=True)
+        tmp = os.path.join(out_dir, f".{INDEX_JSON}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(out_dir, INDEX_JSON))
+        write_streams(out_dir, groups, stream_path)
+        print(f"Index: {len(meta['files'])} files in {json_path}; "
+              f"DATM file lists in {os.path.join(out_dir, STREAMS_TXT)}")
+
+
+def _consolidate_one(job):
+    forcing_dir, out_dir, out_key, members, stat, chunk_size = job
+    print(f"[rank {RANK}] {out_key} <- {len(members)} files")
+    consolidate_group([os.path.join(forcing_dir, key) for key in members],
+                      os.path.join(out_dir, out_key), chunk_size)
+    return out_key, stat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concatenate AOI forcing period files into yearly or decadal files.")
+    parser.add_argument("forcing_dir", help="AOI forcing output tree (TES_AOI_forcingGEN_mpi.py output_path)")
+    parser.add_argument("out_dir", help="destination of the consolidated files, e.g. <experiment_root>/forcing_consolidated")
+    parser.add_argument("--by", choices=('year', 'decade'), default='year', help="files per year or per decade")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="time steps copied per read (memory bound)")
+    parser.add_argument("--workers", type=int, default=1, help="local worker processes when not under MPI")
+    parser.add_argument("--stream-path", default=None,
+                        help="<filePath> written to datm_streams.txt (default: $DIN_LOC_ROOT_CLMFORC/atm_forcing.datm7.km.1d)")
+    parser.add_argument("--force", action='store_true', help="rewrite every group")
+    args = parser.parse_args()
+
+    try:
+        consolidate_archive(args.forcing_dir, args.out_dir, args.by, args.chunk_size, args.workers,
+                            args.force, args.stream_path)
+    except BaseException:
+        if SIZE > 1:
+            # the other ranks are waiting in a collective; take the whole job down
+            import traceback
+            traceback.print_exc()
+            COMM.Abort(1)
+        raise
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+# aoi_failures: JSON report of the forcing files that failed, and the rerun set it defines
+
+import json
+import os
+import socket
+import traceback
+from datetime import datetime
+
+
+def failure_record(source_file, subdir, file, exc, attempts, rank=0):
+    """Report entry of a task that failed `attempts` times, the last time with `exc`."""
+    return {
+        'source': os.path.abspath(source_file),
+        'subdir': subdir,
+        'file': file,
+        'error': f"{type(exc).__name__}: {exc}",
+        'traceback': ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
+        'attempts': attempts,
+        'rank': rank,
+        'host': socket.gethostname(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def write_report(path, failures, n_tasks):
+    """Write (replace) the failure report: one record per failed file, sorted by file."""
+    report = {
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'tasks': n_tasks,
+        'failed': len(failures),
+        'failures': sorted(failures, key=lambda f: (f['subdir'], f['file'])),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=1)
+    os.replace(tmp, path)
+
+
+def failed_keys(path):
+    """{(subdir, file)} of the failures in the report at path."""
+    with open(path) as f:
+        report = json.load(f)
+    return {(os.path.normpath(rec['subdir']), rec['file']) for rec in report['failures']}
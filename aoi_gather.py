@@ -0,0 +1,107 @@
+# aoi_gather: vectorized AOI column gather shared by the TES AOI generators
+
+import numpy as np
+
+
+def is_cell_variable(variable):
+    """True for a variable whose last dimension is the cell axis (ni or gridcell)."""
+    return len(variable.dimensions) > 0 and variable.dimensions[-1] in ('ni', 'gridcell')
+
+
+def aoi_indices(grid_ids, AOI_points):
+    """Return the sorted positions of the AOI gridIDs along the last (ni/gridcell) axis.
+
+    Equivalent to np.where(np.in1d(grid_ids, AOI_points))[0] on the flattened gridIDs,
+    returned as an int64 array that can be reused for every chunk of every variable.
+    """
+    grid_ids = np.ravel(np.ma.getdata(grid_ids))
+    AOI_points = np.ravel(np.ma.getdata(AOI_points))
+    return np.flatnonzero(np.isin(grid_ids, AOI_points)).astype(np.int64)
+
+
+def gather_chunk(source_data, AOI_idx, out=None):
+    """Subset a (..., ni) chunk to (..., n_aoi) with one indexed take on the last axis.
+
+    source_data: array read from the source file, e.g. a (time, nj, ni) time chunk
+    AOI_idx:     integer positions from aoi_indices()
+    out:         optional preallocated (..., n_aoi) array (e.g. a slice of a staging buffer)
+
+    Masked arrays are gathered from their data, as the previous per-timestep copy did.
+    """
+    data = np.ma.getdata(source_data)
+    if out is None:
+        out = np.empty(data.shape[:-1] + (AOI_idx.size,), dtype=data.dtype)
+    # mode='clip' avoids the internal buffering numpy does for mode='raise' with out=;
+    # AOI_idx holds positions along the last axis, so every index is already in range
+    np.take(data, AOI_idx, axis=-1, out=out, mode='clip')
+    return out
+
+
+def create_variable_like(dst, name, variable, dimensions=None, raw=False, **kwargs):
+    """Create dst variable `name` with the datatype of the source `variable`.
+
+    With raw=True the source _FillValue is set at creation (it cannot be added later) and
+    auto mask/scale is turned off, so raw on-disk values can be written back unchanged.
+    Extra keyword arguments (e.g. chunksizes, zlib) are passed to createVariable.
+    """
+    if dimensions is None:
+        dimensions = variable.dimensions
+    if not raw:
+        return dst.createVariable(name, variable.datatype, dimensions, **kwargs)
+    x = dst.createVariable(name, variable.datatype, dimensions,
+                           fill_value=getattr(variable, '_FillValue', None), **kwargs)
+    x.set_auto_maskandscale(False)
+    return x
+
+
+def plan_slabs(AOI_idx, itemsize, gap_bytes, max_slabs=64):
+    """Cover the sorted AOI positions with few contiguous [lo, hi) cell ranges.
+
+    Neighbouring AOI cells are merged into one range when the gap between them costs at
+    most gap_bytes to read (gap cells * itemsize), since reading across it is cheaper than
+    another request. If that still leaves more than max_slabs ranges, the smallest gaps
+    are merged as well. Returns an int64 (n_slabs, 2) array.
+    """
+    AOI_idx = np.asarray(AOI_idx, dtype=np.int64)
+    if AOI_idx.size == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    gaps = np.diff(AOI_idx) - 1
+    breaks = np.flatnonzero(gaps * itemsize > gap_bytes)
+    if breaks.size > max_slabs - 1:
+        # keep only the largest gaps as breaks
+        breaks = np.sort(breaks[np.argsort(gaps[breaks], kind='stable')[breaks.size - (max_slabs - 1):]])
+    lo = AOI_idx[np.concatenate(([0], breaks + 1))]
+    hi = AOI_idx[np.concatenate((breaks, [AOI_idx.size - 1]))] + 1
+    return np.stack([lo, hi], axis=1)
+
+
+def slab_positions(AOI_idx, slabs):
+    """Map AOI positions on the full cell axis to positions in the concatenated slabs."""
+    offsets = np.concatenate(([0], np.cumsum(slabs[:, 1] - slabs[:, 0])[:-1]))
+    slab = np.searchsorted(slabs[:, 0], AOI_idx, side='right') - 1
+    return (AOI_idx - slabs[slab, 0] + offsets[slab]).astype(np.int64)
+
+
+def read_slabs(variable, start, end, slabs):
+    """Read time steps [start, end) of a 3D variable restricted to the cell ranges in slabs.
+
+    Returns a plain (end - start, nj, sum of slab widths) array (masked reads contribute
+    their data, as gather_chunk does).
+    """
+    if len(slabs) == 1:
+        lo, hi = slabs[0]
+        return np.ma.getdata(variable[start:end, :, lo:hi])
+    if hasattr(variable, 'read_columns'):
+        # memory-mapped or tiled source (aoi_cdf.MappedVariable, aoi_tiles.TiledVariable): all slabs
+        # in one indexed gather
+        columns = np.concatenate([np.arange(lo, hi) for lo, hi in slabs])
+        return variable.read_columns(start, end, columns)
+    out = None
+    pos = 0
+    for lo, hi in slabs:
+        data = np.ma.getdata(variable[start:end, :, lo:hi])
+        if out is None:
+            out = np.empty(data.shape[:-1] + (int((slabs[:, 1] - slabs[:, 0]).sum()),), dtype=data.dtype)
+        out[..., pos:pos + hi - lo] = data
+        pos += hi - lo
+    return out
@@ -0,0 +1,136 @@
+# aoi_gridindex: gridID -> row index of a TES domain, surfdata or forcing gridID vector
+#
+# GridIndex sorts the gridID vector once (with its argsort permutation) and resolves AOI
+# gridIDs to source rows with np.searchsorted, or with a dense direct-address table when the
+# gridIDs are unique raster indices that fill most of their range. The sorted index is saved
+# as a .npy sidecar next to the base file, named by the gridID fingerprint, so the domain,
+# surfdata and forcing generators (and every rerun) load it instead of sorting again; they
+# share the base domain's sidecars when AOI_GRID_INDEX_BASE points at it.
+
+import hashlib
+import os
+
+import numpy as np
+
+DENSE_FILL = 2  # use a dense table when max gridID + 1 <= DENSE_FILL * cells
+
+_LOADED = {}  # fingerprint -> GridIndex, shared by every AOI resolved in this process
+
+
+def gridid_fingerprint(grid_ids):
+    """Fingerprint of a gridID vector: '<length>-<blake2b of the int64 values>'."""
+    values = np.ascontiguousarray(np.ravel(np.ma.getdata(grid_ids)), dtype=np.int64)
+    digest = hashlib.blake2b(values.tobytes(), digest_size=8).hexdigest()
+    return f"{values.size}-{digest}"
+
+
+class GridIndex:
+    """Row lookup for one gridID vector (flattened: rows are positions on the ni/gridcell axis).
+
+    sorted_ids/order: the gridIDs in ascending order and their source rows (a stable
+    argsort), as built by from_grid_ids or loaded from a sidecar.
+    """
+
+    def __init__(self, sorted_ids, order):
+        self.sorted_ids = sorted_ids
+        self.order = order
+        self.size = sorted_ids.size
+        self.unique = self.size < 2 or bool(np.all(sorted_ids[1:] != sorted_ids[:-1]))
+        self._table = None
+        if self.unique and self.size and sorted_ids[0] >= 0 and sorted_ids[-1] + 1 <= DENSE_FILL * self.size:
+            # direct address: table[gridID] = row, -1 where there is no cell
+            self._table = np.full(int(sorted_ids[-1]) + 1, -1, dtype=np.int64)
+            self._table[sorted_ids] = order
+
+    @classmethod
+    def from_grid_ids(cls, grid_ids):
+        ids = np.ravel(np.ma.getdata(grid_ids)).astype(np.int64)
+        order = np.argsort(ids, kind='stable')
+        return cls(ids[order], order)
+
+    def _query(self, AOI_points):
+        return np.unique(np.ravel(np.ma.getdata(AOI_points)).astype(np.int64))
+
+    def rows(self, AOI_points):
+        """Sorted rows of every cell whose gridID is in AOI_points.
+
+        Same result as np.where(np.in1d(grid_ids, AOI_points))[0], duplicates included.
+        """
+        wanted = self._query(AOI_points)
+        if self._table is not None:
+            inside = (wanted >= 0) & (wanted < self._table.size)
+            rows = self._table[wanted[inside]]
+            return np.sort(rows[rows >= 0])
+        lo = np.searchsorted(self.sorted_ids, wanted, side='left')
+        counts = np.searchsorted(self.sorted_ids, wanted, side='right') - lo
+        # expand the [lo, hi) runs of the matching gridIDs into sorted-array positions
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(counts.sum())
+        return np.sort(self.order[positions])
+
+    def missing(self, AOI_points):
+        """The AOI gridIDs that are not in this gridID vector (sorted, unique)."""
+        wanted = self._query(AOI_points)
+        if self._table is not None:
+            inside = (wanted >= 0) & (wanted < self._table.size)
+            found = np.zeros(wanted.size, dtype=bool)
+            found[inside] = self._table[wanted[inside]] >= 0
+            return wanted[~found]
+        pos = np.minimum(np.searchsorted(self.sorted_ids, wanted), max(self.size - 1, 0))
+        found = self.sorted_ids[pos] == wanted if self.size else np.zeros(wanted.size, dtype=bool)
+        return wanted[~found]
+
+
+def shared_base(default=None):
+    """Sidecar base shared by the generators of a run: env AOI_GRID_INDEX_BASE (the base
+    domain file, exported by the experiment scripts), else default."""
+    return os.environ.get('AOI_GRID_INDEX_BASE') or default
+
+
+def sidecar_path(base_file, fingerprint):
+    """<base_file without .nc>.gridindex-<fingerprint>.npy"""
+    stem = base_file[:-3] if base_file.endswith('.nc') else base_file
+    return f"{stem}.gridindex-{fingerprint}.npy"
+
+
+def load_grid_index(grid_ids, base_file=None, fingerprint=None):
+    """GridIndex of grid_ids, from the sidecar next to base_file when one exists.
+
+    The sidecar is a (2, n) int64 array [sorted gridIDs, rows], memory-mapped when loaded.
+    It is written when missing; a read-only base directory only costs the rebuild.
+    """
+    fingerprint = fingerprint or gridid_fingerprint(grid_ids)
+    index = _LOADED.get(fingerprint)
+    if index is not None:
+        return index
+    sidecar = sidecar_path(base_file, fingerprint) if base_file else None
+    if sidecar and os.path.exists(sidecar):
+        stored = np.load(sidecar, mmap_mode='r')
+        index = GridIndex(stored[0], stored[1])
+    else:
+        index = GridIndex.from_grid_ids(grid_ids)
+        if sidecar:
+            # write under a per-process name and rename, so concurrent runs never see a partial file
+            tmp = f"{sidecar}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, 'wb') as f:
+                    np.save(f, np.stack([index.sorted_ids, index.order]))
+                os.replace(tmp, sidecar)
+            except OSError as e:
+                print(f"Warning: cannot save the gridID index next to {base_file} ({e})")
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    _LOADED[fingerprint] = index
+    return index
+
+
+def report_missing(missing, AOI, csv_path=None, limit=10):
+    """Print the AOI gridIDs missing from the source and optionally list them all in csv_path."""
+    if missing.size == 0:
+        return
+    shown = ', '.join(str(g) for g in missing[:limit]) + (', ...' if missing.size > limit else '')
+    print(f"Warning: {missing.size} {AOI} gridIDs are not in the source and are skipped: {shown}")
+    if csv_path:
+        os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+        np.savetxt(csv_path, missing, fmt='%d', header='gridID', comments='')
+        print(f"Missing gridIDs written to {csv_path}")
@@ -0,0 +1,62 @@
+# aoi_index_cache: gridID-layout -> AOI index cache shared by all forcing files, ranks and reruns
+
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+from aoi_gridindex import gridid_fingerprint, load_grid_index, report_missing, shared_base
+
+
+class AOIIndexCache:
+    """Resolve a source gridID vector to sorted AOI indices, once per gridID layout.
+
+    Indices are kept in memory keyed by gridid_fingerprint() and persisted as one small
+    .npy sidecar per layout under cache_dir, so every rank/worker and every rerun loads
+    them instead of repeating the set-membership test against the full TES gridID vector.
+    AOI gridIDs missing from a layout are reported when it is first resolved, and listed in
+    missing_csv when given.
+    """
+
+    def __init__(self, cache_dir, AOI, AOI_points, missing_csv=None):
+        self.cache_dir = cache_dir
+        self.AOI = AOI
+        self.AOI_points = AOI_points
+        self.missing_csv = missing_csv
+        self.aoi_fingerprint = gridid_fingerprint(AOI_points)
+        self._indices = {}
+
+    def _sidecar(self, layout):
+        return os.path.join(self.cache_dir, f"{self.AOI}.{layout}.aoi-{self.aoi_fingerprint}.npy")
+
+    def lookup(self, grid_ids):
+        """Return (AOI_idx, layout fingerprint) for the gridID vector of a source file."""
+        layout = gridid_fingerprint(grid_ids)
+        AOI_idx = self._indices.get(layout)
+        if AOI_idx is not None:
+            return AOI_idx, layout
+
+        sidecar = self._sidecar(layout)
+        if os.path.exists(sidecar):
+            AOI_idx = np.load(sidecar)
+        else:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # the sorted gridID index of the layout, shared with the domain/surfdata generators
+            grid_index = load_grid_index(grid_ids, shared_base(os.path.join(self.cache_dir, 'gridID')), layout)
+            AOI_idx = grid_index.rows(self.AOI_points)
+            report_missing(grid_index.missing(self.AOI_points), self.AOI, self.missing_csv)
+            # write under a per-process name and rename, so concurrent ranks never see a partial file
+            tmp = f"{sidecar}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, AOI_idx)
+            os.replace(tmp, sidecar)
+        self._indices[layout] = AOI_idx
+        return AOI_idx, layout
+
+    def prime(self, source_file):
+        """Resolve the layout of one source file up front (e.g. on rank 0 before the others start)."""
+        src = nc.Dataset(source_file, 'r')
+        try:
+            return self.lookup(src['gridID'][...])
+        finally:
+            src.close()
@@ -0,0 +1,153 @@
+# aoi_kdtree: persisted cKDTree over the TES cell centres of a base domain
+#
+# TES_AOI_domainGEN resolves *_xcyc.csv / *_xcyc_lcc.csv points to their nearest TES cell.
+# The tree over every land cell is built once per base domain and coordinate pair, straight
+# from the (nj, ni) coordinate arrays, and pickled next to the domain (cKDTree supports
+# pickling). Later runs unpickle it instead of reading the coordinates and rebuilding the
+# tree; a cache that cannot be loaded, e.g. one written by another SciPy, is rebuilt.
+
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import scipy
+from scipy.spatial import cKDTree
+
+QUERY_BATCH = 1 << 20  # points per tree.query call
+
+
+def domain_fingerprint(domain_file):
+    """Fingerprint of a domain file from its resolved path, size and mtime (no data read)."""
+    path = os.path.realpath(domain_file)
+    st = os.stat(path)
+    key = f"{path}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def cache_path(domain_file, xname, yname):
+    """<domain without .nc>.kdtree-<xname>-<yname>-<fingerprint>.pkl"""
+    stem = domain_file[:-3] if domain_file.endswith('.nc') else domain_file
+    return f"{stem}.kdtree-{xname}-{yname}-{domain_fingerprint(domain_file)}.pkl"
+
+
+class PointIndex:
+    """Nearest-cell lookup over the cell centres of a domain (rows along ni)."""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    @property
+    def bounds(self):
+        """((x_min, y_min), (x_max, y_max)) of the cell centres."""
+        return tuple(float(v) for v in self.tree.mins), tuple(float(v) for v in self.tree.maxes)
+
+    def query(self, points, batch=QUERY_BATCH):
+        """(distance, row) of the nearest cell to each (x, y) point, in batches of `batch` points."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        dist = np.empty(points.shape[0], dtype=np.float64)
+        rows = np.empty(points.shape[0], dtype=np.int64)
+        for start in range(0, points.shape[0], batch):
+            end = min(start + batch, points.shape[0])
+            dist[start:end], rows[start:end] = self.tree.query(points[start:end], k=1, workers=-1)
+        return dist, rows
+
+    def filter(self, points, tolerance=None, batch=QUERY_BATCH):
+        """Split (x, y) points into kept and rejected in one vectorized pass.
+
+        A point is rejected as 'outside_domain' when it lies outside the bounding box of the
+        cell centres (or is NaN), and with a tolerance as 'beyond_tolerance' when its nearest
+        cell centre is farther than tolerance (coordinate units). Returns (kept mask, reasons,
+        distance, row) per point; reasons is '' for kept points, and points outside the box
+        have distance NaN and row -1.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        (x_min, y_min), (x_max, y_max) = self.bounds
+        x, y = points[:, 0], points[:, 1]
+        inside = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        dist = np.full(points.shape[0], np.nan)
+        rows = np.full(points.shape[0], -1, dtype=np.int64)
+        dist[inside], rows[inside] = self.query(points[inside], batch)
+        kept = inside.copy()
+        if tolerance is not None:
+            kept &= dist <= tolerance
+        reasons = np.full(points.shape[0], '', dtype=object)
+        reasons[~inside] = 'outside_domain'
+        reasons[inside & ~kept] = 'beyond_tolerance'
+        return kept, reasons, dist, rows
+
+
+def write_rejected_points(csv_path, points, kept, reasons, dist, names=('x', 'y')):
+    """CSV of the rejected points: input row, coordinates, reason and nearest-cell distance."""
+    rejected = np.flatnonzero(~kept)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    pd.DataFrame({'point': rejected, names[0]: points[rejected, 0], names[1]: points[rejected, 1],
+                  'reason': reasons[rejected], 'distance': dist[rejected]}).to_csv(csv_path, index=False)
+    return rejected.size
+
+
+def _save(tree, path):
+    """Pickle the tree to path (written under a per-process name, then renamed)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump({'scipy': scipy.__version__, 'tree': tree}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _load(path):
+    """cKDTree pickled at path, or None if it was written by another scipy version."""
+    with open(path, 'rb') as f:
+        cached = pickle.load(f)
+    if cached['scipy'] != scipy.__version__ or not isinstance(cached['tree'], cKDTree):
+        return None
+    return cached['tree']
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)  # cache directory of an earlier layout
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def load_point_index(domain_file, xname='xc', yname='yc'):
+    """PointIndex over (xname, yname) of domain_file, from its cache when one is current.
+
+    The cache is keyed by the domain's fingerprint and the scipy version; a stale cache, or
+    one that fails to load for any reason, is rebuilt, and a read-only domain directory only
+    costs the build.
+    """
+    path = cache_path(domain_file, xname, yname)
+    if os.path.exists(path):
+        try:
+            tree = _load(path)
+            if tree is not None:
+                print(f"Loaded the {xname}/{yname} KD-tree from {path}")
+                return PointIndex(tree)
+        except Exception as e:
+            print(f"Warning: cannot load the KD-tree cache {path} ({type(e).__name__}: {e}); rebuilding it")
+        _remove(path)
+
+    src = nc.Dataset(domain_file, 'r')
+    try:
+        # (n, 2) cell centres straight from the coordinate arrays
+        coords = np.column_stack([np.ravel(np.ma.getdata(src[xname][...])).astype(np.float64),
+                                  np.ravel(np.ma.getdata(src[yname][...])).astype(np.float64)])
+    finally:
+        src.close()
+    tree = cKDTree(coords)
+    try:
+        _save(tree, path)
+        print(f"Saved the {xname}/{yname} KD-tree to {path}")
+        # caches of earlier versions of the domain file
+        for stale in glob.glob(path.rsplit('-', 1)[0] + '-*'):
+            if stale != path and not stale.endswith('.tmp'):
+                _remove(stale)
+    except OSError as e:
+        print(f"Warning: cannot save the KD-tree next to {domain_file} ({e})")
+        _remove(f"{path}.{os.getpid()}.tmp")
+    return PointIndex(tree)
@@ -0,0 +1,85 @@
+# aoi_manifest: completion manifest that makes AOI forcing generation resumable
+
+import json
+import os
+import socket
+from datetime import datetime
+
+
+class ForcingManifest:
+    """Completion records for the AOI forcing outputs of one AOI.
+
+    Each finished output is recorded with its source path, size and mtime, the AOI and
+    gridID-layout fingerprints, the output options it was written with (e.g. raw mode and
+    output format) and a 'complete' status. Every process appends to its own
+    <AOI>.<host>.<pid>.jsonl file under manifest_dir, so ranks never contend for one file;
+    load() merges them and the newest record per output wins.
+    """
+
+    def __init__(self, manifest_dir, AOI, aoi_fingerprint, options=None):
+        self.manifest_dir = manifest_dir
+        self.AOI = AOI
+        self.aoi_fingerprint = aoi_fingerprint
+        self.options = options or {}
+        self._records = None
+
+    def load(self):
+        records = {}
+        if os.path.isdir(self.manifest_dir):
+            for name in sorted(os.listdir(self.manifest_dir)):
+                if not (name.startswith(self.AOI + '.') and name.endswith('.jsonl')):
+                    continue
+                with open(os.path.join(self.manifest_dir, name)) as f:
+                    for line in f:
+                        try:
+                            rec = json.loads(line)
+                        except ValueError:
+                            continue  # torn last line of a job killed mid-write
+                        prev = records.get(rec['output'])
+                        if prev is None or rec['finished'] >= prev['finished']:
+                            records[rec['output']] = rec
+        self._records = records
+        return records
+
+    def is_current(self, source_file, dst_name, source_stat=None):
+        """True if dst_name was completed from the unchanged source_file for this AOI and options.
+
+        source_stat ({size, mtime_ns}, e.g. from a forcing catalog) saves the stat of source_file.
+        """
+        if self._records is None:
+            self.load()
+        rec = self._records.get(os.path.abspath(dst_name))
+        if rec is None or rec.get('status') != 'complete' or not os.path.exists(dst_name):
+            return False
+        if source_stat is None:
+            st = os.stat(source_file)
+            source_stat = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        return (rec['source'] == os.path.abspath(source_file)
+                and rec['size'] == source_stat['size']
+                and rec['mtime_ns'] == source_stat['mtime_ns']
+                and rec['aoi_fingerprint'] == self.aoi_fingerprint
+                and rec.get('options', {}) == self.options)
+
+    def record(self, source_file, dst_name, layout=None, source_stat=None):
+        """Append the completion record of dst_name (call after its atomic rename).
+
+        source_stat ({size, mtime_ns}, e.g. from a forcing catalog) saves the stat of source_file.
+        """
+        if source_stat is None:
+            st = os.stat(source_file)
+            source_stat = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        rec = {
+            'output': os.path.abspath(dst_name),
+            'source': os.path.abspath(source_file),
+            'size': source_stat['size'],
+            'mtime_ns': source_stat['mtime_ns'],
+            'aoi_fingerprint': self.aoi_fingerprint,
+            'layout': layout,
+            'options': self.options,
+            'status': 'complete',
+            'finished': datetime.now().isoformat(timespec='microseconds'),
+        }
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = os.path.join(self.manifest_dir, f"{self.AOI}.{socket.gethostname()}.{os.getpid()}.jsonl")
+        with open(path, 'a') as f:
+            f.write(json.dumps(rec) + '\n')
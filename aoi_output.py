@@ -0,0 +1,62 @@
+# aoi_output: file format and variable layout of the AOI forcing outputs
+
+# --output-format choices -> netCDF4.Dataset format
+OUTPUT_FORMATS = {
+    'NETCDF3_64BIT': 'NETCDF3_64BIT_OFFSET',  # CDF-2, the historical default
+    'CDF5': 'NETCDF3_64BIT_DATA',             # CDF-5: 64-bit sizes, no 4 GiB per-record limit
+    'NETCDF4_CLASSIC': 'NETCDF4_CLASSIC',     # HDF5 storage, classic data model: chunking/compression
+}
+
+
+class OutputLayout:
+    """Format of the AOI output files and chunking/compression of their variables.
+
+    Chunking only applies to NETCDF4_CLASSIC. (time, ..., cell) variables are chunked as
+    chunk_time time steps by all AOI cells, so DATM's read of one time slice across all
+    cells touches a single chunk; chunk_cells caps the cells per chunk for very large AOIs.
+    complevel > 0 adds zlib (with shuffle) at that level.
+    """
+
+    def __init__(self, output_format='NETCDF3_64BIT', complevel=0, chunk_time=1, chunk_cells=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unknown output format {output_format!r} (choose from {', '.join(OUTPUT_FORMATS)})")
+        if complevel and output_format != 'NETCDF4_CLASSIC':
+            raise ValueError("compression needs --output-format NETCDF4_CLASSIC")
+        self.output_format = output_format
+        self.complevel = complevel
+        self.chunk_time = chunk_time
+        self.chunk_cells = chunk_cells
+
+    @property
+    def dataset_format(self):
+        return OUTPUT_FORMATS[self.output_format]
+
+    def variable_kwargs(self, dimensions, shape):
+        """createVariable keyword arguments for an output variable of the given dimensions/shape."""
+        if self.output_format != 'NETCDF4_CLASSIC' or len(dimensions) == 0:
+            return {}
+        kwargs = {}
+        if self.complevel:
+            kwargs.update(zlib=True, complevel=self.complevel, shuffle=True)
+        if dimensions[-1] in ('ni', 'gridcell'):
+            chunks = []
+            for dim, n in zip(dimensions, shape):
+                if dim in ('ni', 'gridcell'):
+                    n = n if self.chunk_cells is None else min(self.chunk_cells, n)
+                elif dim == 'time':
+                    n = min(self.chunk_time, n) if n else self.chunk_time
+                chunks.append(max(1, int(n)))
+            kwargs['chunksizes'] = tuple(chunks)
+        return kwargs
+
+    def __repr__(self):
+        return (f"OutputLayout({self.output_format!r}, complevel={self.complevel}, "
+                f"chunk_time={self.chunk_time}, chunk_cells={self.chunk_cells})")
+
+
+def output_shape(variable, n_cells):
+    """Shape of the AOI output of a source variable: the cell dimension becomes n_cells."""
+    shape = tuple(int(n) for n in variable.shape)
+    if variable.dimensions and variable.dimensions[-1] in ('ni', 'gridcell'):
+        shape = shape[:-1] + (int(n_cells),)
+    return shape
@@ -67,6 +67,8 @@ def render_run_domain_surfdata_sh(cfg: dict, scripts_dir: Path, exp_root: Path)
     lines.append("if [ ! -e domain.lnd.TES_SE.4km.1d.nc ]; then")
     lines.append("  ln -sf \"${BASE_DOMAIN_FILE}\" domain.lnd.TES_SE.4km.1d.nc")
     lines.append("fi")
+    lines.append("# Sorted gridID index sidecars (*.gridindex-*.npy) are kept next to the linked base domain")
+    lines.append("export AOI_GRID_INDEX_BASE=\"$(pwd)/domain.lnd.TES_SE.4km.1d.nc\"")
     lines.append("")
     lines.append("echo \"[1/2] Generating AOI domain...\"")
     lines.append("python3 TES_AOI_domainGEN.py \"${AOI_POINTS_DIR}\" \"${DOM_SURF_DIR}\" \"${AOI_POINTS_FILE}\" 2>&1 | tee \"${DOM_SURF_DIR}/${EXPID}_domaingen.log.${date_string}\"")
@@ -117,6 +119,8 @@ def render_run_forcing_sbatch(cfg: dict, scripts_dir: Path, exp_root: Path) -> s
     lines.append("echo \"SRC_ROOT: ${SRC_ROOT}\"")
 
     lines.append("cd \"${EXP_ROOT}/scripts\"")
+    lines.append("# reuse the sorted gridID index sidecars of run_domain_surfdata.sh")
+    lines.append("export AOI_GRID_INDEX_BASE=\"${AOI_GRID_INDEX_BASE:-${EXP_ROOT}/scripts/domain.lnd.TES_SE.4km.1d.nc}\"")
 
     lines.append("")
     lines.append("date_string=$(date +'%y%m%d-%H%M')")
@@ -130,6 +134,14 @@ def render_run_forcing_sbatch(cfg: dict, scripts_dir: Path, exp_root: Path) -> s
     lines.append("AOI_POINTS_FILE=$(ls -1 ${AOI_FILE_PATH}/*_domain.lnd.TES_SE.4km.1d.c*.nc 2>/dev/null | sort | tail -n1 | xargs -r basename)")
     lines.append("if [ -z \"${AOI_POINTS_FILE}\" ]; then echo 'ERROR: AOI domain file not found'; exit 2; fi")
     lines.append("")
+    lines.append("# Hybrid mode (FORCING_NODE_WORKERS=N): one rank per node with N worker processes, outputs staged")
+    lines.append("# on node-local disk (FORCING_STAGE_DIR, default auto) and copied to OUT_DIR file by file")
+    lines.append("SRUN_LAYOUT=\"-n ${SCHED_TASKS:-2}\"")
+    lines.append("if [ -n \"${FORCING_NODE_WORKERS:-}\" ]; then")
+    lines.append("  SRUN_LAYOUT=\"--ntasks-per-node=1 --cpus-per-task=${FORCING_NODE_WORKERS}\"")
+    lines.append("  export FORCING_STAGE_DIR=\"${FORCING_STAGE_DIR:-auto}\"")
+    lines.append("fi")
+    lines.append("")
     lines.append("# If not running inside a Slurm allocation, run with srun using env SCHED_* overrides")
     lines.append("if [ -z \"${SLURM_JOB_ID:-}\" ]; then")
     lines.append("  ACCOUNT=\"${SCHED_ACCOUNT:-" + account + "}\"")
@@ -138,13 +150,22 @@ def render_run_forcing_sbatch(cfg: dict, scripts_dir: Path, exp_root: Path) -> s
     lines.append("  TIME=\"${SCHED_TIME:-" + time_limit + "}\"")
     lines.append("  MEM=\"${SCHED_MEM:-" + mem + "}\"")
     lines.append("  SRUN_NTASKS=\"${SCHED_TASKS:-2}\"")
-    lines.append("  echo \"srun -A '${ACCOUNT}' -p '${PARTITION}' -N '${NODES}' -t '${TIME}' --mem='${MEM}' -n '${SRUN_NTASKS}' python3 TES_AOI_forcingGEN_mpi.py '${FORCING_DIR}' '${OUT_DIR}' '${AOI_FILE_PATH}/' '${AOI_POINTS_FILE}'\" | tee \"${OUT_DIR}/${EXPID}_forcinggen.cmd.${date_string}\"")
-    lines.append("  exec srun -A \"${ACCOUNT}\" -p \"${PARTITION}\" -N \"${NODES}\" -t \"${TIME}\" --mem=\"${MEM}\" -n \"${SRUN_NTASKS}\" python3 TES_AOI_forcingGEN_mpi.py \"${FORCING_DIR}\" \"${OUT_DIR}\" \"${AOI_FILE_PATH}/\" \"${AOI_POINTS_FILE}\" 2>&1 | tee \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("  echo \"srun -A '${ACCOUNT}' -p '${PARTITION}' -N '${NODES}' -t '${TIME}' --mem='${MEM}' ${SRUN_LAYOUT} python3 TES_AOI_forcingGEN_mpi.py '${FORCING_DIR}' '${OUT_DIR}' '${AOI_FILE_PATH}/' '${AOI_POINTS_FILE}'\" | tee \"${OUT_DIR}/${EXPID}_forcinggen.cmd.${date_string}\"")
+    lines.append("  srun -A \"${ACCOUNT}\" -p \"${PARTITION}\" -N \"${NODES}\" -t \"${TIME}\" --mem=\"${MEM}\" ${SRUN_LAYOUT} python3 TES_AOI_forcingGEN_mpi.py \"${FORCING_DIR}\" \"${OUT_DIR}\" \"${AOI_FILE_PATH}/\" \"${AOI_POINTS_FILE}\" 2>&1 | tee \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("  if [ -n \"${FORCING_CONSOLIDATE:-}\" ]; then")
+    lines.append("    srun -A \"${ACCOUNT}\" -p \"${PARTITION}\" -N \"${NODES}\" -t \"${TIME}\" --mem=\"${MEM}\" -n \"${SRUN_NTASKS}\" python3 aoi_consolidate.py \"${OUT_DIR}\" \"${EXP_ROOT}/forcing_consolidated\" --by \"${FORCING_CONSOLIDATE}\" 2>&1 | tee -a \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("  fi")
+    lines.append("  exit 0")
     lines.append("fi")
     lines.append("")
     lines.append("# Running under Slurm allocation")
-    lines.append("echo \"srun -n '${SCHED_TASKS}' python3 TES_AOI_forcingGEN_mpi.py '${FORCING_DIR}' '${OUT_DIR}' '${AOI_FILE_PATH}/' '${AOI_POINTS_FILE}'\" | tee \"${OUT_DIR}/${EXPID}_forcinggen.cmd.${date_string}\"")
-    lines.append("srun -n \"${SCHED_TASKS:-2}\" python3 TES_AOI_forcingGEN_mpi.py \"${FORCING_DIR}\" \"${OUT_DIR}\" \"${AOI_FILE_PATH}/\" \"${AOI_POINTS_FILE}\" 2>&1 | tee \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("echo \"srun ${SRUN_LAYOUT} python3 TES_AOI_forcingGEN_mpi.py '${FORCING_DIR}' '${OUT_DIR}' '${AOI_FILE_PATH}/' '${AOI_POINTS_FILE}'\" | tee \"${OUT_DIR}/${EXPID}_forcinggen.cmd.${date_string}\"")
+    lines.append("srun ${SRUN_LAYOUT} python3 TES_AOI_forcingGEN_mpi.py \"${FORCING_DIR}\" \"${OUT_DIR}\" \"${AOI_FILE_PATH}/\" \"${AOI_POINTS_FILE}\" 2>&1 | tee \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("")
+    lines.append("# Optional: concatenate the period files into per-year/per-decade files (FORCING_CONSOLIDATE=year|decade)")
+    lines.append("if [ -n \"${FORCING_CONSOLIDATE:-}\" ]; then")
+    lines.append("  srun -n \"${SCHED_TASKS:-2}\" python3 aoi_consolidate.py \"${OUT_DIR}\" \"${EXP_ROOT}/forcing_consolidated\" --by \"${FORCING_CONSOLIDATE}\" 2>&1 | tee -a \"${OUT_DIR}/${EXPID}_forcinggen.log.${date_string}\"")
+    lines.append("fi")
     return "\n".join(lines) + "\n"
 
 
@@ -179,6 +200,15 @@ def render_export_env_sh(cfg: dict, exp_root: Path) -> str:
     lines.append(f"export SURFDATA_DIR=\"{surf_dir}\"")
     lines.append(f"export SURFDATA_FILE=\"{surf_file}\"")
     lines.append(f"export FORCING_DIR=\"{forcing_dir}\"")
+    # Optional forcing selectors (read by TES_AOI_forcingGEN_mpi.py as --years/--periods/--vars)
+    # and consolidation (run_forcing.sbatch runs aoi_consolidate.py --by <year|decade>) and hybrid mode
+    forcing = cfg.get("forcing", {})
+    for key in ("years", "periods", "vars", "consolidate", "node_workers"):
+        value = forcing.get(key)
+        if value:
+            if isinstance(value, list):
+                value = ",".join(str(v) for v in value)
+            lines.append(f"export FORCING_{key.upper()}=\"{value}\"")
     lines.append("")
     # Optional scheduler exports for external use
     if scheduler:
@@ -266,6 +296,11 @@ def render_create_uelm_adspin_sh(cfg: dict, exp_root: Path) -> str:
     lines.append("./case.setup --reset")
     lines.append("./case.setup")
     lines.append("")
+    lines.append("# Consolidated forcing (aoi_consolidate.py) is not named per month: DATM needs the file lists")
+    lines.append("if [ -f \"${CASE_DATA}/forcing_consolidated/datm_streams.txt\" ]; then")
+    lines.append("  echo \"NOTE: copy the <fileNames> lists of ${CASE_DATA}/forcing_consolidated/datm_streams.txt into the user_datm.streams.txt.* files of this case\"")
+    lines.append("fi")
+    lines.append("")
     lines.append("./case.build --clean-all")
     lines.append("./case.build")
     lines.append("")
@@ -302,6 +337,22 @@ def main() -> None:
         "TES_AOI_surfdataGEN.py",
         "TES_AOI_forcingGEN.py",
         "TES_AOI_forcingGEN_mpi.py",
+        "aoi_catalog.py",
+        "aoi_cdf.py",
+        "aoi_cellstore.py",
+        "aoi_chunking.py",
+        "aoi_consolidate.py",
+        "aoi_failures.py",
+        "aoi_gather.py",
+        "aoi_gridindex.py",
+        "aoi_index_cache.py",
+        "aoi_kdtree.py",
+        "aoi_manifest.py",
+        "aoi_output.py",
+        "aoi_staging.py",
+        "aoi_surfdata.py",
+        "aoi_telemetry.py",
+        "aoi_tiles.py",
         "forcing_domain_link_creation.py",
         "forcinglink_creation.py",
         "check_nc_compression.py",
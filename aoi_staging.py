@@ -0,0 +1,82 @@
+# aoi_staging: node-local staging of AOI forcing outputs, published to the shared tree per file
+#
+# In hybrid mode each rank (one per node) writes its outputs under a private directory on
+# node-local storage and copies each one to the experiment's forcing tree as soon as its task
+# is done, one large sequential copy per file, instead of many small hyperslab writes and
+# renames on GPFS. A failed copy costs that file only: it is reported as a task failure and
+# left out of the manifest, and the remaining files are still published.
+
+import os
+import shutil
+import socket
+from time import perf_counter
+
+COPY_BLOCK = 64 << 20  # bytes per read/write of the bulk copy
+
+
+def default_stage_base():
+    """Node-local scratch: $SLURM_TMPDIR, then $TMPDIR, then /tmp."""
+    return os.environ.get('SLURM_TMPDIR') or os.environ.get('TMPDIR') or '/tmp'
+
+
+class StagingArea:
+    """Private staging tree of one rank: <base>/aoi_stage.<job>.<rank>/<target number>/...
+
+    base 'auto' (or None) picks default_stage_base(). publish() copies the staged outputs of
+    one task to their final names and records them in the targets' manifests; summary()
+    prints the totals and cleanup() removes the tree.
+    """
+
+    def __init__(self, base, rank=0):
+        if base in (None, '', 'auto'):
+            base = default_stage_base()
+        job = os.environ.get('SLURM_JOB_ID') or str(os.getpid())
+        self.root = os.path.join(base, f"aoi_stage.{job}.{rank}")
+        self.rank = rank
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def target_dir(self, k):
+        return os.path.join(self.root, str(k))
+
+    def publish(self, source_file, outputs, targets, source_stat=None):
+        """Copy the staged outputs of one source file to their final paths and record them.
+
+        outputs: (target number, staged path, final path, layout) per target. Each file is
+        copied to a hidden .part next to its final path and renamed, then recorded in its
+        target's manifest (source_stat, e.g. from a forcing catalog, saves a stat of the
+        source). Every output is attempted; returns the (final path, exception) of the ones
+        that could not be published or recorded (a partial copy is removed).
+        """
+        errors = []
+        for k, staged_path, final_path, layout in outputs:
+            t0 = perf_counter()
+            part_name = os.path.join(os.path.dirname(final_path), '.' + os.path.basename(final_path) + '.part')
+            try:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                with open(staged_path, 'rb') as fsrc, open(part_name, 'wb') as fdst:
+                    shutil.copyfileobj(fsrc, fdst, COPY_BLOCK)
+                os.replace(part_name, final_path)
+                os.remove(staged_path)
+                if targets[k].manifest is not None:
+                    targets[k].manifest.record(source_file, final_path, layout, source_stat)
+            except OSError as e:
+                errors.append((final_path, e))
+                if os.path.exists(part_name):
+                    os.remove(part_name)
+                continue
+            self.files += 1
+            self.bytes += os.path.getsize(final_path)
+            self.seconds += perf_counter() - t0
+        return errors
+
+    def summary(self):
+        """Print and return (files, bytes, seconds) published so far."""
+        rate = self.bytes / 1e6 / self.seconds if self.seconds > 0 else 0
+        print(f"[rank {self.rank} {socket.gethostname()}] published {self.files} staged files, "
+              f"{self.bytes / 1e6:.1f} MB in {self.seconds:.2f}s ({rate:.1f} MB/s)")
+        return self.files, self.bytes, self.seconds
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,107 @@
+# aoi_surfdata: slab-wise subsetting of gridcell variables for TES_AOI_surfdataGEN
+#
+# A surfdata variable is (..., gridcell), e.g. PCT_NAT_PFT (natpft, gridcell) or MONTHLY_LAI
+# (time, lsmpft, gridcell). Instead of one read and one write per layer, the leading axes are
+# cut into slabs of as many whole layers as fit in a byte budget; each slab is read once over
+# the AOI's gridcell range, gathered with a single indexed take and written in one call.
+#
+# In parallel mode (SURFDATA_WORKERS or an MPI launch) each variable is subset by a worker
+# into its own part file (subset_to_part); the writer then assembles the parts into the AOI
+# surfdata in source order (copy_slabs).
+
+import os
+from math import prod
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+
+from aoi_chunking import parse_size
+from aoi_gather import create_variable_like
+
+DEFAULT_SLAB_BYTES = 256 << 20
+
+
+def slab_bytes_from_env():
+    """Slab budget in bytes: env SURFDATA_SLAB_SIZE (e.g. 64M, 1G), default 256 MiB."""
+    size = os.environ.get('SURFDATA_SLAB_SIZE')
+    return parse_size(size) if size else DEFAULT_SLAB_BYTES
+
+
+def layer_slabs(shape, layer_bytes, slab_bytes=DEFAULT_SLAB_BYTES):
+    """Yield index tuples over the leading (non-gridcell) axes of shape, one per slab.
+
+    layer_bytes is the size of one layer (one gridcell row). A slab is a run of whole
+    layers of at most slab_bytes: it spans every inner axis and a block of the outermost
+    axis that still fits, so a (time, lsmpft) variable is cut along time while lsmpft
+    layers are kept together. A single layer larger than slab_bytes is its own slab.
+    A 1D variable yields the empty tuple once.
+    """
+    lead = tuple(shape[:-1])
+    if not lead:
+        yield ()
+        return
+    for axis in range(len(lead)):
+        inner = prod(lead[axis + 1:]) * layer_bytes
+        if inner <= slab_bytes:
+            break
+    step = max(1, slab_bytes // max(inner, 1))
+    for outer in np.ndindex(*lead[:axis]):
+        for lo in range(0, lead[axis], step):
+            yield outer + (slice(lo, min(lo + step, lead[axis])),)
+
+
+def subset_variable(src_var, dst_var, domain_idx, slab_bytes=DEFAULT_SLAB_BYTES):
+    """Copy the AOI cells (sorted positions domain_idx on the last axis) of src_var to dst_var.
+
+    Reads only the gridcell range the AOI spans. Masked reads stay masked, so masked cells
+    are written as the destination fill value, as the per-layer copy did. Returns the number
+    of layers copied.
+    """
+    if domain_idx.size == 0:
+        return 0
+    lo, hi = int(domain_idx[0]), int(domain_idx[-1]) + 1
+    columns = domain_idx - lo
+    width = slice(lo, hi)
+    layer_bytes = (hi - lo) * src_var.dtype.itemsize
+    for key in layer_slabs(src_var.shape, layer_bytes, slab_bytes):
+        # key covers the outer axes; the inner axes of the slab are taken whole
+        dst_var[key + (Ellipsis,)] = src_var[key + (Ellipsis, width)][..., columns]
+    return prod(src_var.shape[:-1])
+
+
+def copy_slabs(src_var, dst_var, slab_bytes=DEFAULT_SLAB_BYTES):
+    """Copy an already subset (..., gridcell) variable slab by slab, values unchanged."""
+    layer_bytes = src_var.shape[-1] * src_var.dtype.itemsize
+    for key in layer_slabs(src_var.shape, layer_bytes, slab_bytes):
+        dst_var[key + (Ellipsis,)] = src_var[key + (Ellipsis,)]
+
+
+def part_name(parts_dir, name):
+    return os.path.join(parts_dir, name + '.nc')
+
+
+def subset_to_part(source_file, name, domain_idx, parts_dir, raw=False, slab_bytes=DEFAULT_SLAB_BYTES):
+    """Subset gridcell variable `name` of source_file into its own part file under parts_dir.
+
+    The part holds the variable as the serial path writes it into the AOI surfdata (same
+    dtype, masked cells as the fill value, no attributes), so copying it raw with copy_slabs
+    gives the same bytes. Returns (name, part file, seconds).
+    """
+    t0 = perf_counter()
+    src = nc.Dataset(source_file, 'r')
+    if raw:
+        src.set_auto_maskandscale(False)
+    out_file = part_name(parts_dir, name)
+    part = nc.Dataset(out_file, 'w', format='NETCDF3_64BIT')
+    try:
+        variable = src[name]
+        for dim, size in zip(variable.dimensions[:-1], variable.shape[:-1]):
+            part.createDimension(dim, size)
+        part.createDimension('gridcell', domain_idx.size)
+        create_variable_like(part, name, variable, raw=raw)
+        subset_variable(variable, part[name], domain_idx, slab_bytes)
+    finally:
+        part.close()
+        src.close()
+    return name, out_file, perf_counter() - t0
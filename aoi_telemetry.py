@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# aoi_telemetry: per-file / per-variable JSON-lines timing for AOI forcing generation
+#
+# TES_AOI_forcingGEN_mpi.py appends one 'variable' record per subset variable and one 'file'
+# record per source file to <telemetry_dir>/forcing.<host>.<pid>.jsonl. Run this module to
+# summarize them per rank and per variable:
+#
+#   python3 aoi_telemetry.py <experiment_root>/forcing/.forcing_telemetry
+
+import argparse
+import glob
+import json
+import os
+import resource
+import socket
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+PHASES = ('open', 'read', 'subset', 'write', 'close')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (ru_maxrss is KB on Linux)."""
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+class FileTelemetry:
+    """Wall-time and byte counters for one source file, split by phase and by variable.
+
+    open:   source/output open, gridID read, index lookup, dimension and variable definitions
+    read:   time spent waiting for source data (with prefetch only the part not hidden by the reader thread)
+    subset: AOI gather
+    write:  hyperslab writes and attribute copies
+    close:  closing, renaming into place and the manifest record
+    """
+
+    def __init__(self, source_file):
+        self.source_file = source_file
+        self.start = perf_counter()
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.chunks = 0
+        self.variables = {}
+        self._var = None
+
+    def variable(self, name):
+        """Attribute the following phases and bytes to variable `name` as well (None: stop)."""
+        if name is None:
+            self._var = None
+            return
+        self._var = self.variables.setdefault(name, {
+            'variable': name, 'read': 0.0, 'subset': 0.0, 'write': 0.0,
+            'bytes_read': 0, 'bytes_written': 0, 'chunks': 0})
+
+    @contextmanager
+    def phase(self, name):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - t0
+            self.totals[name] += elapsed
+            if self._var is not None and name in self._var:
+                self._var[name] += elapsed
+
+    def read(self, nbytes):
+        self.bytes_read += nbytes
+        if self._var is not None:
+            self._var['bytes_read'] += nbytes
+
+    def wrote(self, nbytes):
+        self.bytes_written += nbytes
+        if self._var is not None:
+            self._var['bytes_written'] += nbytes
+
+    def chunk(self):
+        self.chunks += 1
+        if self._var is not None:
+            self._var['chunks'] += 1
+
+    def records(self):
+        """'variable' records followed by the 'file' record."""
+        for rec in self.variables.values():
+            yield dict(kind='variable', file=os.path.basename(self.source_file), **rec,
+                       read_mbps=_mbps(rec['bytes_read'], rec['read']),
+                       write_mbps=_mbps(rec['bytes_written'], rec['write']))
+        wall = perf_counter() - self.start
+        yield dict(kind='file', file=os.path.basename(self.source_file), source=self.source_file, wall=wall,
+                   **self.totals, bytes_read=self.bytes_read, bytes_written=self.bytes_written,
+                   read_mbps=_mbps(self.bytes_read, self.totals['read']),
+                   write_mbps=_mbps(self.bytes_written, self.totals['write']),
+                   chunks=self.chunks, variables=len(self.variables), peak_rss_mb=peak_rss_mb())
+
+
+def _mbps(nbytes, seconds):
+    return nbytes / 1e6 / seconds if seconds > 0 else None
+
+
+class TelemetryLog:
+    """Append FileTelemetry records, tagged with rank/host/pid, to a per-process JSONL file."""
+
+    def __init__(self, telemetry_dir, rank=0):
+        self.telemetry_dir = telemetry_dir
+        self.rank = rank
+
+    def write(self, stats):
+        os.makedirs(self.telemetry_dir, exist_ok=True)
+        host, pid = socket.gethostname(), os.getpid()
+        tags = {'rank': self.rank, 'host': host, 'pid': pid,
+                'time': datetime.now().isoformat(timespec='seconds')}
+        path = os.path.join(self.telemetry_dir, f"forcing.{host}.{pid}.jsonl")
+        with open(path, 'a') as f:
+            for rec in stats.records():
+                f.write(json.dumps({**tags, **rec}) + '\n')
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn last line of a killed job
+    return records
+
+
+def _table(title, key_name, groups, columns):
+    width = max([len(key_name)] + [len(str(key)) for key in groups])
+    print(title)
+    print(f"{key_name:>{width}s} " + " ".join(f"{c:>10s}" for c, _ in columns))
+    for key in sorted(groups):
+        print(f"{str(key):>{width}s} " + " ".join(_fmt(fn(groups[key])) for _, fn in columns))
+    print()
+
+
+def _fmt(value):
+    if value is None:
+        return f"{'-':>10s}"
+    if isinstance(value, float):
+        return f"{value:10.2f}"
+    return f"{value:>10}"
+
+
+def summarize(records):
+    files = [r for r in records if r.get('kind') == 'file']
+    variables = [r for r in records if r.get('kind') == 'variable']
+    if not files:
+        print("no telemetry records found")
+        return
+
+    def total(rows, key):
+        return sum(r[key] for r in rows)
+
+    per_rank = defaultdict(list)
+    for r in files:
+        per_rank[r['rank']].append(r)
+    rank_columns = [('files', len), ('wall s', lambda g: total(g, 'wall'))]
+    rank_columns += [(p + ' s', lambda g, p=p: total(g, p)) for p in PHASES]
+    rank_columns += [('read MB', lambda g: total(g, 'bytes_read') / 1e6),
+                     ('read MB/s', lambda g: _mbps(total(g, 'bytes_read'), total(g, 'read'))),
+                     ('write MB/s', lambda g: _mbps(total(g, 'bytes_written'), total(g, 'write'))),
+                     ('peak RSS', lambda g: max(r['peak_rss_mb'] for r in g))]
+    _table("Per rank (seconds are wall time summed over files; peak RSS in MB)", 'rank', per_rank, rank_columns)
+
+    per_var = defaultdict(list)
+    for r in variables:
+        per_var[r['variable']].append(r)
+    var_columns = [('files', len), ('chunks', lambda g: total(g, 'chunks'))]
+    var_columns += [(p + ' s', lambda g, p=p: total(g, p)) for p in ('read', 'subset', 'write')]
+    var_columns += [('read MB', lambda g: total(g, 'bytes_read') / 1e6),
+                    ('read MB/s', lambda g: _mbps(total(g, 'bytes_read'), total(g, 'read'))),
+                    ('write MB/s', lambda g: _mbps(total(g, 'bytes_written'), total(g, 'write')))]
+    _table("Per variable", 'variable', per_var, var_columns)
+
+    phase_totals = {p: total(files, p) for p in PHASES}
+    wall = total(files, 'wall')
+    shares = ", ".join(f"{p} {100 * t / wall:.0f}%" for p, t in phase_totals.items()) if wall else ''
+    print(f"{len(files)} files, {len(per_rank)} ranks; share of file wall time: {shares}")
+    print(f"dominant phase: {max(phase_totals, key=phase_totals.get)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize AOI forcing telemetry (JSON lines) per rank and variable.")
+    parser.add_argument("paths", nargs='+', help="telemetry directories or .jsonl files")
+    args = parser.parse_args()
+    summarize(load_records(args.paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# aoi_tiles: spatially tiled copy of the TES forcing archive for fast AOI extraction
+#
+# One-time tiling (MPI-parallel when run under mpirun/srun, otherwise --workers processes):
+#
+#   python3 aoi_tiles.py tile <forcing_dir> <tile_dir> [--block-size 65536] [--order gridid|hilbert]
+#   python3 aoi_tiles.py info <tile_dir>
+#
+# Every source file <forcing_dir>/<subdir>/<name>.nc is rewritten as one file per tile,
+# <tile_dir>/<subdir>/<name>.tileNNNN.nc, holding the tile's cells (in source order) of every
+# ni/gridcell variable, values copied byte for byte (raw, packing and _FillValue kept), and the
+# other variables unchanged. tile_index.npz maps every source cell to its tile; tile_index.json
+# records the tiling and the size/mtime of each tiled source file.
+#
+# TES_AOI_forcingGEN_mpi.py --tile-dir <tile_dir> then opens only the tiles that hold AOI cells
+# (TileArchive/TiledDataset below) and falls back to the source file for anything not tiled.
+
+import argparse
+import json
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+
+from aoi_chunking import DEFAULT_CHUNK_SIZE
+from aoi_gather import create_variable_like, gather_chunk, is_cell_variable
+from aoi_gridindex import gridid_fingerprint
+
+try:
+    from mpi4py import MPI
+    COMM = MPI.COMM_WORLD
+    RANK = COMM.Get_rank()
+    SIZE = COMM.Get_size()
+except Exception:
+    COMM = None
+    RANK = 0
+    SIZE = 1
+
+INDEX_JSON = 'tile_index.json'
+INDEX_NPZ = 'tile_index.npz'
+
+
+def hilbert_keys(x, y, order=16):
+    """Hilbert-curve distance of integer cell coordinates 0 <= x, y < 2**order."""
+    n = np.uint64(1 << order)
+    x = np.asarray(x, dtype=np.uint64).copy()
+    y = np.asarray(y, dtype=np.uint64).copy()
+    d = np.zeros(x.shape, dtype=np.uint64)
+    s = n >> np.uint64(1)
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.uint64)
+        ry = ((y & s) > 0).astype(np.uint64)
+        d += s * s * ((np.uint64(3) * rx) ^ ry)
+        # rotate the quadrant so the curve stays continuous
+        turn = ry == 0
+        flip = turn & (rx == 1)
+        x[flip] = n - np.uint64(1) - x[flip]
+        y[flip] = n - np.uint64(1) - y[flip]
+        x[turn], y[turn] = y[turn], x[turn].copy()
+        s >>= np.uint64(1)
+    return d
+
+
+def build_tiling(grid_ids, block_size, order='gridid', lon=None, lat=None):
+    """Assign every source cell to a tile of at most block_size cells.
+
+    order='gridid' cuts the cells sorted by gridID into blocks; order='hilbert' cuts them
+    sorted along a Hilbert curve over lon/lat, so each tile is a compact patch. Returns the
+    int32 tile number of every source position.
+    """
+    grid_ids = np.ravel(np.ma.getdata(grid_ids))
+    if order == 'hilbert':
+        if lon is None or lat is None:
+            raise ValueError("hilbert tiling needs LONGXY/LATIXY in the source files")
+        lon = np.ravel(np.ma.getdata(lon)).astype(np.float64)
+        lat = np.ravel(np.ma.getdata(lat)).astype(np.float64)
+        scale = (1 << 16) - 1
+
+        def quantize(v):
+            span = v.max() - v.min()
+            return np.zeros(v.shape, dtype=np.uint64) if span == 0 else \
+                np.round((v - v.min()) / span * scale).astype(np.uint64)
+
+        ranked = np.argsort(hilbert_keys(quantize(lon), quantize(lat)), kind='stable')
+    else:
+        ranked = np.argsort(grid_ids, kind='stable')
+    tile = np.empty(grid_ids.size, dtype=np.int32)
+    tile[ranked] = np.arange(grid_ids.size) // block_size
+    return tile
+
+
+def tile_cells(tile):
+    """Source positions of every tile, ascending: list indexed by tile number."""
+    ranked = np.argsort(tile, kind='stable')
+    bounds = np.searchsorted(tile[ranked], np.arange(tile.max() + 2))
+    return [ranked[bounds[t]:bounds[t + 1]] for t in range(tile.max() + 1)]
+
+
+def tile_path(tile_dir, key, t):
+    return os.path.join(tile_dir, key[:-3] + f".tile{t:04d}.nc")
+
+
+def tile_file(source_file, tile_dir, key, cells, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write the tiles of one source file (raw copy; each source chunk is read once)."""
+    src = nc.Dataset(source_file, 'r')
+    src.set_auto_maskandscale(False)
+    parts = [tile_path(tile_dir, key, t) for t in range(len(cells))]
+    os.makedirs(os.path.dirname(parts[0]), exist_ok=True)
+    dsts = []
+    for t, path in enumerate(parts):
+        part_name = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.part')
+        dst = nc.Dataset(part_name, 'w', format=src.data_model)
+        dst.setncatts({name: src.getncattr(name) for name in src.ncattrs()})
+        for name, dimension in src.dimensions.items():
+            if name in ('ni', 'gridcell'):
+                dst.createDimension(name, cells[t].size)
+            else:
+                dst.createDimension(name, None if dimension.isunlimited() else len(dimension))
+        dsts.append((part_name, dst))
+
+    for name, variable in src.variables.items():
+        for _, dst in dsts:
+            x = create_variable_like(dst, name, variable, raw=True)
+            x.setncatts({a: variable.getncattr(a) for a in variable.ncattrs() if a != '_FillValue'})
+        if not is_cell_variable(variable):
+            data = variable[...]
+            for _, dst in dsts:
+                dst[name][...] = data
+        elif len(variable.dimensions) < 3:
+            data = variable[...]
+            for t, (_, dst) in enumerate(dsts):
+                dst[name][...] = gather_chunk(data, cells[t])
+        else:
+            d0 = variable.shape[0]
+            for start in range(0, d0, chunk_size):
+                data = variable[start:start + chunk_size]
+                for t, (_, dst) in enumerate(dsts):
+                    dst[name][start:start + data.shape[0]] = gather_chunk(data, cells[t])
+
+    src.close()
+    for (part_name, dst), path in zip(dsts, parts):
+        dst.close()
+        os.replace(part_name, path)
+
+
+def source_files(forcing_dir):
+    """Relative paths of every .nc file under forcing_dir, sorted."""
+    keys = []
+    for root, dirs, files in os.walk(forcing_dir):
+        for file in sorted(files):
+            if file.endswith('.nc'):
+                keys.append(os.path.normpath(os.path.join(os.path.relpath(root, forcing_dir), file)))
+    return sorted(keys)
+
+
+def source_stat(path):
+    """Size and mtime of a source file, as recorded in the index of a derived store."""
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def tile_archive(forcing_dir, tile_dir, block_size=65536, order='gridid', workers=1,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    """Tile every .nc file under forcing_dir into tile_dir (files already tiled and unchanged are skipped)."""
+    if RANK == 0:
+        keys = source_files(forcing_dir)
+        if not keys:
+            raise SystemExit(f"no .nc files under {forcing_dir}")
+        first = nc.Dataset(os.path.join(forcing_dir, keys[0]), 'r')
+        grid_ids = first['gridID'][...]
+        lon = first['LONGXY'][...] if 'LONGXY' in first.variables else None
+        lat = first['LATIXY'][...] if 'LATIXY' in first.variables else None
+        first.close()
+        layout = gridid_fingerprint(grid_ids)
+
+        meta = None
+        json_path = os.path.join(tile_dir, INDEX_JSON)
+        if os.path.exists(json_path):
+            with open(json_path) as f:
+                meta = json.load(f)
+            if (meta['layout'], meta['block_size'], meta['order']) != (layout, block_size, order):
+                print("Existing tiling differs (layout/block size/order); retiling every file")
+                meta = None
+        if meta is None:
+            tile = build_tiling(grid_ids, block_size, order, lon, lat)
+            os.makedirs(tile_dir, exist_ok=True)
+            np.savez(os.path.join(tile_dir, INDEX_NPZ), gridID=np.ravel(np.ma.getdata(grid_ids)), tile=tile)
+            meta = {'layout': layout, 'block_size': block_size, 'order': order,
+                    'ntiles': int(tile.max()) + 1, 'files': {}}
+        todo = [key for key in keys if meta['files'].get(key) != source_stat(os.path.join(forcing_dir, key))]
+        print(f"Tiling {len(todo)} of {len(keys)} files into {meta['ntiles']} {order} tiles of "
+              f"<= {block_size} cells")
+    else:
+        todo = meta = None
+    if SIZE > 1:
+        todo, meta = COMM.bcast((todo, meta), root=0)
+
+    cells = tile_cells(np.load(os.path.join(tile_dir, INDEX_NPZ))['tile'])
+    mine = todo[RANK::SIZE]
+    done = {}
+    if SIZE == 1 and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_tile_one, [(forcing_dir, tile_dir, key, cells, meta['layout'], chunk_size)
+                                              for key in mine])
+            done.update(r for r in results if r is not None)
+    else:
+        for key in mine:
+            result = _tile_one((forcing_dir, tile_dir, key, cells, meta['layout'], chunk_size))
+            if result is not None:
+                done[result[0]] = result[1]
+    if SIZE > 1:
+        gathered = COMM.gather(done, root=0)
+        if RANK == 0:
+            done = {k: v for d in gathered for k, v in d.items()}
+    if RANK == 0:
+        meta['files'].update(done)
+        tmp = os.path.join(tile_dir, f".{INDEX_JSON}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(tile_dir, INDEX_JSON))
+        print(f"Tile index: {len(meta['files'])} files in {os.path.join(tile_dir, INDEX_JSON)}")
+
+
+def _tile_one(job):
+    forcing_dir, tile_dir, key, cells, layout, chunk_size = job
+    source_file = os.path.join(forcing_dir, key)
+    stat = source_stat(source_file)  # before reading, so a file rewritten meanwhile is retiled next time
+    src = nc.Dataset(source_file, 'r')
+    same_layout = gridid_fingerprint(src['gridID'][...]) == layout
+    src.close()
+    if not same_layout:
+        print(f"Skipping {key}: gridID layout differs from the tiling (it will be read untiled)")
+        return None
+    print(f"[rank {RANK}] tiling {key}")
+    tile_file(source_file, tile_dir, key, cells, chunk_size)
+    return key, stat
+
+
+class TileArchive:
+    """Read side of a tiled archive: which tiles an AOI needs and a view over them.
+
+    Picklable for worker processes: the index arrays are loaded lazily in each process.
+    """
+
+    def __init__(self, tile_dir):
+        self.tile_dir = tile_dir
+        with open(os.path.join(tile_dir, INDEX_JSON)) as f:
+            self.meta = json.load(f)
+        self.tiles = None
+        self._cells = None
+
+    def __getstate__(self):
+        return {'tile_dir': self.tile_dir, 'meta': self.meta, 'tiles': self.tiles, '_cells': None}
+
+    def cells(self):
+        if self._cells is None:
+            self._cells = tile_cells(np.load(os.path.join(self.tile_dir, INDEX_NPZ))['tile'])
+        return self._cells
+
+    def select(self, AOI_points_list):
+        """Select the tiles holding any of the AOI gridIDs (all AOIs of the run)."""
+        index = np.load(os.path.join(self.tile_dir, INDEX_NPZ))
+        wanted = np.concatenate([np.ravel(np.ma.getdata(p)) for p in AOI_points_list])
+        self.tiles = np.unique(index['tile'][np.isin(index['gridID'], wanted)]).tolist()
+        print(f"AOI cells lie in {len(self.tiles)} of {self.meta['ntiles']} tiles")
+        return self.tiles
+
+    def covers(self, key, source_file):
+        """True if key was tiled from the current source_file (unchanged size and mtime)."""
+        rec = self.meta['files'].get(os.path.normpath(key))
+        return rec is not None and rec == source_stat(source_file)
+
+    def open(self, key):
+        key = os.path.normpath(key)
+        cells = self.cells()
+        return TiledDataset([tile_path(self.tile_dir, key, t) for t in self.tiles],
+                            [cells[t] for t in self.tiles])
+
+
+class TiledDataset:
+    """Read-only stand-in for a source nc.Dataset restricted to a few tiles.
+
+    The ni/gridcell dimension holds the cells of the selected tiles in source order, so
+    AOI positions found on its gridID vector select the same cells, in the same order, as
+    on the full source file. Other variables and all attributes come from the first tile.
+    """
+
+    def __init__(self, paths, cells):
+        self.tiles = [nc.Dataset(path, 'r') for path in paths]
+        positions = np.concatenate(cells)
+        self.order = np.argsort(positions, kind='stable')
+        # tile number and tile-local offset of every cell of the view
+        self.tile_of = np.repeat(np.arange(len(cells)), [c.size for c in cells])[self.order]
+        self.local = np.concatenate([np.arange(c.size) for c in cells])[self.order]
+        first = self.tiles[0]
+        self.dimensions = first.dimensions
+        self.variables = {name: (TiledVariable(self, name) if is_cell_variable(variable) else variable)
+                          for name, variable in first.variables.items()}
+
+    def ncattrs(self):
+        return self.tiles[0].ncattrs()
+
+    def getncattr(self, name):
+        return self.tiles[0].getncattr(name)
+
+    def set_auto_maskandscale(self, flag):
+        for ds in self.tiles:
+            ds.set_auto_maskandscale(flag)
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def close(self):
+        for ds in self.tiles:
+            ds.close()
+
+
+class TiledVariable:
+    """ni/gridcell variable of a TiledDataset: reads the selected cells from their tiles in source order."""
+
+    def __init__(self, dataset, name):
+        self._dataset = dataset
+        self._parts = [ds.variables[name] for ds in dataset.tiles]
+        self.shape = self._parts[0].shape[:-1] + (dataset.order.size,)
+
+    def __getattr__(self, name):
+        # dimensions, datatype, dtype, ncattrs, scale_factor, ... of the first tile
+        return getattr(self._parts[0], name)
+
+    def __getitem__(self, key):
+        if key is Ellipsis:
+            key = ()
+        elif not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (len(self.shape) - len(key))
+        wanted = np.arange(self.shape[-1])[key[-1]]
+        scalar = np.ndim(wanted) == 0
+        wanted = np.atleast_1d(wanted)
+        tile_of, local = self._dataset.tile_of[wanted], self._dataset.local[wanted]
+        data = mask = None
+        for t in np.unique(tile_of):
+            # only the range of tile t that holds wanted cells
+            sel = np.flatnonzero(tile_of == t)
+            lo, hi = int(local[sel].min()), int(local[sel].max()) + 1
+            part = self._parts[t][key[:-1] + (slice(lo, hi),)]
+            if data is None:
+                data = np.empty(np.shape(part)[:-1] + (wanted.size,), dtype=np.ma.getdata(part).dtype)
+            data[..., sel] = np.ma.getdata(part)[..., local[sel] - lo]
+            if isinstance(part, np.ma.MaskedArray):
+                if mask is None:
+                    mask = np.zeros(data.shape, dtype=bool)
+                mask[..., sel] = np.ma.getmaskarray(part)[..., local[sel] - lo]
+        if data is None:
+            data = np.ma.getdata(self._parts[0][key[:-1] + (slice(0, 0),)])
+        if mask is not None:
+            data = np.ma.masked_array(data, mask=mask)
+        return data[..., 0] if scalar else data
+
+    def read_columns(self, start, end, columns):
+        """Time steps [start, end) of the cells at positions `columns`, reading each tile once."""
+        return np.ma.getdata(self[start:end, :, columns])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatially tiled copy of the TES forcing archive.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('tile', help="tile (or update the tiling of) a forcing archive")
+    p.add_argument("forcing_dir", help="source forcing directory (e.g. Daymet_ERA5_TESSFA2/entire_domain/forcing)")
+    p.add_argument("tile_dir", help="destination of the tiles and tile_index.{json,npz}")
+    p.add_argument("--block-size", type=int, default=65536, help="cells per tile")
+    p.add_argument("--order", choices=('gridid', 'hilbert'), default='gridid',
+                   help="gridid: blocks of consecutive gridIDs; hilbert: blocks along a Hilbert curve over lon/lat")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="time steps read per chunk")
+    p.add_argument("--workers", type=int, default=1, help="local worker processes when not under MPI")
+    p = sub.add_parser('info', help="summarize a tiled archive")
+    p.add_argument("tile_dir")
+    args = parser.parse_args()
+
+    if args.command == 'tile':
+        try:
+            tile_archive(args.forcing_dir, args.tile_dir, args.block_size, args.order, args.workers,
+                         args.chunk_size)
+        except BaseException:
+            if SIZE > 1:
+                # the other ranks are waiting in a collective; take the whole job down
+                import traceback
+                traceback.print_exc()
+                COMM.Abort(1)
+            raise
+    else:
+        archive = TileArchive(args.tile_dir)
+        sizes = [c.size for c in archive.cells()]
+        print(f"{archive.meta['ntiles']} {archive.meta['order']} tiles ({min(sizes)}-{max(sizes)} cells), "
+              f"layout {archive.meta['layout']}, {len(archive.meta['files'])} files tiled")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
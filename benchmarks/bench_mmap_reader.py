@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# Read + gather time per forcing variable: netCDF4-python reads vs the memory-mapped CDF-2 reader.
+#
+# Writes a synthetic TES-shaped NETCDF3_64BIT forcing file with a float32 variable and an int16
+# packed variable (scale_factor/add_offset/_FillValue, some cells at the fill value), then for
+# each variable times the time-chunk loop of the forcing generator:
+#
+#   netcdf4 full: variable[start:end, :, :] then gather_chunk (the --slab-gap off path)
+#   netcdf4 slab: read_slabs over the AOI bounding slabs then gather_chunk (the default path)
+#   mmap:         aoi_cdf.MappedVariable.read_columns of the AOI cells (--reader mmap)
+#
+# and checks the three return the same values. Finally AOI_forcing_save_1d is run with both
+# readers, default and raw, and the outputs are compared variable by variable. The file is
+# read once before timing, so the numbers compare warm page-cache reads.
+#
+# Example:
+#   python3 benchmarks/bench_mmap_reader.py --ni 300000 --ntime 248 --aoi-frac 0.01
+
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aoi_cdf import MappedFile, MappedVariable  # noqa: E402
+from aoi_gather import aoi_indices, gather_chunk, plan_slabs, read_slabs, slab_positions  # noqa: E402
+from TES_AOI_forcingGEN_mpi import AOI_forcing_save_1d  # noqa: E402
+
+
+def make_source(path, ni, ntime, rng):
+    src = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    src.createDimension('time', None)
+    src.createDimension('nj', 1)
+    src.createDimension('ni', ni)
+    src.createVariable('time', 'f8', ('time',))[:] = np.arange(ntime) / 8.0
+    src.createVariable('gridID', 'i4', ('nj', 'ni'))[:] = np.arange(ni, dtype=np.int32).reshape(1, ni)
+    tbot = src.createVariable('TBOT', 'f4', ('time', 'nj', 'ni'))
+    tbot[0:ntime] = rng.random((ntime, 1, ni), dtype=np.float32) * 300
+    fsds = src.createVariable('FSDS', 'i2', ('time', 'nj', 'ni'), fill_value=np.int16(-32767))
+    fsds.scale_factor = np.float32(0.05)
+    fsds.add_offset = np.float32(500.0)
+    fsds.set_auto_maskandscale(False)
+    packed = rng.integers(-30000, 30000, (ntime, 1, ni), dtype=np.int16)
+    packed[rng.random(packed.shape) < 0.01] = -32767
+    fsds[0:ntime] = packed
+    src.close()
+
+
+def time_netcdf4(path, name, AOI_idx, chunk_size, slab_gap):
+    src = nc.Dataset(path, 'r')
+    var = src[name]
+    slabs = positions = None
+    if slab_gap is not None:
+        slabs = plan_slabs(AOI_idx, var.dtype.itemsize, slab_gap)
+        positions = slab_positions(AOI_idx, slabs)
+    t0 = perf_counter()
+    parts = []
+    for start in range(0, var.shape[0], chunk_size):
+        end = min(start + chunk_size, var.shape[0])
+        if slabs is None:
+            parts.append(gather_chunk(var[start:end, :, :], AOI_idx))
+        else:
+            parts.append(gather_chunk(read_slabs(var, start, end, slabs), positions))
+    elapsed = perf_counter() - t0
+    src.close()
+    return elapsed, np.concatenate(parts)
+
+
+def time_mmap(path, name, AOI_idx, chunk_size):
+    src = nc.Dataset(path, 'r')
+    t0 = perf_counter()
+    mapped = MappedFile(path)
+    var = MappedVariable(mapped, src[name])
+    parts = []
+    for start in range(0, var.shape[0], chunk_size):
+        end = min(start + chunk_size, var.shape[0])
+        parts.append(var.read_columns(start, end, AOI_idx))
+    elapsed = perf_counter() - t0
+    mapped.close()
+    src.close()
+    return elapsed, np.concatenate(parts)
+
+
+def same_outputs(a, b, raw):
+    da, db = nc.Dataset(a), nc.Dataset(b)
+    da.set_auto_maskandscale(not raw)
+    db.set_auto_maskandscale(not raw)
+    try:
+        return all(np.array_equal(np.ma.getdata(da[name][...]), np.ma.getdata(db[name][...]))
+                   for name in da.variables)
+    finally:
+        da.close()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-variable read time: netCDF4 vs memory-mapped CDF-2 reader.")
+    parser.add_argument("--ni", type=int, default=300000, help="TES land cells (ni)")
+    parser.add_argument("--ntime", type=int, default=248, help="timesteps per file (248 = 3-hourly month)")
+    parser.add_argument("--aoi-frac", type=float, default=0.01, help="fraction of cells inside the AOI")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--slab-gap", type=int, default=1 << 20, help="bytes, as --slab-gap of the generator")
+    parser.add_argument("--dir", default=None, help="scratch directory (default: a temporary directory)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        file = 'clmforc.synthetic.4km.1d.ALL.1980-01.nc'
+        source_file = os.path.join(tmp, file)
+        make_source(source_file, args.ni, args.ntime, rng)
+        with open(source_file, 'rb') as f:
+            while f.read(1 << 24):
+                pass  # warm the page cache for every reader alike
+        n_aoi = max(1, int(args.ni * args.aoi_frac))
+        AOI_points = np.sort(rng.choice(args.ni, n_aoi, replace=False)).reshape(1, n_aoi)
+        AOI_idx = aoi_indices(np.arange(args.ni), AOI_points)
+
+        print(f"shape=({args.ntime}, 1, {args.ni}), AOI cells={n_aoi}, chunk_size={args.chunk_size}")
+        print(f"{'variable':10s} {'netcdf4 full s':>15s} {'netcdf4 slab s':>15s} {'mmap s':>8s} "
+              f"{'speedup':>8s} {'same':>5s}")
+        for name in ('TBOT', 'FSDS'):
+            t_full, full = time_netcdf4(source_file, name, AOI_idx, args.chunk_size, None)
+            t_slab, slab = time_netcdf4(source_file, name, AOI_idx, args.chunk_size, args.slab_gap)
+            t_mmap, mapped = time_mmap(source_file, name, AOI_idx, args.chunk_size)
+            same = np.array_equal(full, slab) and np.array_equal(full, mapped)
+            print(f"{name:10s} {t_full:15.3f} {t_slab:15.3f} {t_mmap:8.3f} "
+                  f"{min(t_full, t_slab) / t_mmap:8.1f} {str(same):>5s}")
+
+        for raw in (False, True):
+            outputs = {}
+            for reader in ('netcdf4', 'mmap'):
+                out_dir = os.path.join(tmp, f"{reader}-{'raw' if raw else 'default'}")
+                t0 = perf_counter()
+                AOI_forcing_save_1d(tmp, file, 'BENCH', AOI_points, out_dir, raw=raw, reader=reader)
+                print(f"AOI_forcing_save_1d reader={reader} raw={raw}: {perf_counter() - t0:.3f} s", file=sys.stderr)
+                outputs[reader] = os.path.join(out_dir, 'BENCH_' + file)
+            print(f"raw={raw}: mmap output identical to netcdf4 output: "
+                  f"{same_outputs(outputs['netcdf4'], outputs['mmap'], raw)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Write/read throughput and file size of the AOI forcing output layouts.
+#
+# Writes a synthetic TES-shaped AOI forcing variable (time, 1, n_cells) the way
+# TES_AOI_forcingGEN_mpi.py does (time chunks of --chunk-size), once per output layout,
+# then reads it back the way DATM does (one time slice across all cells per read) and
+# reports, per layout:
+#
+#   write MB/s:  uncompressed bytes / (create + write + close) seconds
+#   size MB:     file size on disk
+#   read MB/s:   uncompressed bytes / seconds to read every time slice
+#
+# Example:
+#   python3 benchmarks/bench_output_layout.py --cells 20000 --ntime 744 --dir /gpfs/.../scratch
+
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aoi_output import OutputLayout  # noqa: E402
+
+LAYOUTS = [
+    ('NETCDF3_64BIT', OutputLayout('NETCDF3_64BIT')),
+    ('CDF5', OutputLayout('CDF5')),
+    ('NC4C t=1', OutputLayout('NETCDF4_CLASSIC', chunk_time=1)),
+    ('NC4C t=8', OutputLayout('NETCDF4_CLASSIC', chunk_time=8)),
+    ('NC4C t=1 z1', OutputLayout('NETCDF4_CLASSIC', complevel=1, chunk_time=1)),
+    ('NC4C t=8 z1', OutputLayout('NETCDF4_CLASSIC', complevel=1, chunk_time=8)),
+    ('NC4C t=8 z4', OutputLayout('NETCDF4_CLASSIC', complevel=4, chunk_time=8)),
+]
+
+
+def synthetic_field(ntime, cells, rng):
+    """Smooth diurnal/spatial signal plus noise, like a TBOT time series (float32)."""
+    t = np.arange(ntime, dtype=np.float32)[:, None, None]
+    x = np.linspace(0, 1, cells, dtype=np.float32)[None, None, :]
+    field = 280 + 10 * np.sin(2 * np.pi * t / 24) + 5 * x + rng.normal(0, 0.5, (ntime, 1, cells))
+    return field.astype(np.float32)
+
+
+def write_file(path, layout, data, chunk_size):
+    ntime, nj, cells = data.shape
+    dst = nc.Dataset(path, 'w', format=layout.dataset_format)
+    dst.createDimension('time', None)
+    dst.createDimension('nj', nj)
+    dst.createDimension('ni', cells)
+    dims = ('time', 'nj', 'ni')
+    var = dst.createVariable('TBOT', 'f4', dims, **layout.variable_kwargs(dims, data.shape))
+    for start in range(0, ntime, chunk_size):
+        end = min(start + chunk_size, ntime)
+        var[start:end] = data[start:end]
+    dst.close()
+
+
+def read_slices(path):
+    src = nc.Dataset(path, 'r')
+    var = src['TBOT']
+    total = 0.0
+    for t in range(var.shape[0]):
+        total += float(var[t, :, :].sum())
+    src.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write/read throughput and size of AOI output layouts.")
+    parser.add_argument("--cells", type=int, default=20000, help="AOI cells (ni of the output)")
+    parser.add_argument("--ntime", type=int, default=744, help="timesteps per file (744 = hourly month)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="time steps written per call")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--dir", default=None, help="directory for the test files (default: a temp dir)")
+    args = parser.parse_args()
+
+    data = synthetic_field(args.ntime, args.cells, np.random.default_rng(0))
+    mb = data.nbytes / 1e6
+    print(f"shape=({args.ntime}, 1, {args.cells}) float32, {mb:.1f} MB uncompressed")
+    print(f"{'layout':14s} {'write MB/s':>11s} {'size MB':>9s} {'read MB/s':>10s}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for label, layout in LAYOUTS:
+            path = os.path.join(tmp, label.replace(' ', '_').replace('=', '') + '.nc')
+            write_s = read_s = float('inf')
+            for _ in range(args.repeat):
+                if os.path.exists(path):
+                    os.remove(path)
+                t0 = perf_counter()
+                write_file(path, layout, data, args.chunk_size)
+                write_s = min(write_s, perf_counter() - t0)
+                t0 = perf_counter()
+                read_slices(path)
+                read_s = min(read_s, perf_counter() - t0)
+            check = nc.Dataset(path)
+            assert np.array_equal(check['TBOT'][...], data), label
+            check.close()
+            print(f"{label:14s} {mb / write_s:11.1f} {os.path.getsize(path) / 1e6:9.1f} {mb / read_s:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
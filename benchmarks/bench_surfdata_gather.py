@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Before/after benchmark of the surfdata subsetting step on a synthetic TES-shaped surfdata file.
+#
+# Writes a NETCDF3_64BIT surfdata with realistic layer dimensions (natpft=17, lsmpft=17,
+# nlevsoi=10, nlevgrnd=15, time=12) and times, per variable:
+#
+#   legacy: the previous per-layer loop, dst[i1, i2, :] = src[name][i1][i2][domain_idx]
+#           (the chained src[name][i1] reads the whole (lsmpft, gridcell) slab per layer)
+#   slab:   aoi_surfdata.subset_variable -- bounded multi-layer slabs, one gather and
+#           one write per slab
+#
+# and checks the two AOI files are identical. The file is read once before timing, so the
+# numbers compare warm page-cache reads.
+#
+# Example:
+#   python3 benchmarks/bench_surfdata_gather.py --ni 300000 --aoi-frac 0.05
+
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import netCDF4 as nc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aoi_gather import aoi_indices  # noqa: E402
+from aoi_surfdata import DEFAULT_SLAB_BYTES, subset_variable  # noqa: E402
+
+DIMS = (('natpft', 17), ('lsmpft', 17), ('nlevsoi', 10), ('nlevgrnd', 15), ('time', 12))
+VARIABLES = (('AREA', 'f8', ()),
+             ('PCT_NAT_PFT', 'f8', ('natpft',)),
+             ('PCT_SAND', 'f8', ('nlevsoi',)),
+             ('ORGANIC', 'f8', ('nlevsoi',)),
+             ('TSOIL_INIT', 'f4', ('nlevgrnd',)),
+             ('MONTHLY_LAI', 'f4', ('time', 'lsmpft')),
+             ('MONTHLY_HEIGHT_TOP', 'f4', ('time', 'lsmpft')))
+
+
+def make_source(path, ni, rng):
+    src = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    src.createDimension('gridcell', ni)
+    for name, size in DIMS:
+        src.createDimension(name, size)
+    src.createVariable('gridID', 'i4', ('gridcell',))[:] = np.arange(ni, dtype=np.int32)
+    for name, dtype, lead in VARIABLES:
+        shape = tuple(dict(DIMS)[d] for d in lead) + (ni,)
+        src.createVariable(name, dtype, lead + ('gridcell',))[:] = rng.random(shape).astype(dtype)
+    src.close()
+
+
+def legacy_subset(src_var, dst_var, domain_idx):
+    if len(src_var.dimensions) == 1:
+        dst_var[:] = src_var[domain_idx]
+    if len(src_var.dimensions) == 2:
+        for index in range(src_var.shape[0]):
+            dst_var[index, :] = src_var[index][domain_idx]
+    if len(src_var.dimensions) == 3:
+        for index1 in range(src_var.shape[0]):
+            for index2 in range(src_var.shape[1]):
+                dst_var[index1, index2, :] = src_var[index1][index2][domain_idx]
+
+
+def run(source_file, out_file, domain_idx, subset):
+    src = nc.Dataset(source_file, 'r')
+    dst = nc.Dataset(out_file, 'w', format='NETCDF3_64BIT')
+    for name, dim in src.dimensions.items():
+        dst.createDimension(name, domain_idx.size if name == 'gridcell' else len(dim))
+    times = {}
+    for name, _, _ in VARIABLES:
+        variable = src[name]
+        t0 = perf_counter()
+        subset(variable, dst.createVariable(name, variable.datatype, variable.dimensions), domain_idx)
+        dst.sync()
+        times[name] = perf_counter() - t0
+    dst.close()
+    src.close()
+    return times
+
+
+def same_outputs(a, b):
+    da, db = nc.Dataset(a), nc.Dataset(b)
+    try:
+        return all(np.array_equal(da[name][...], db[name][...]) for name in da.variables)
+    finally:
+        da.close()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-layer vs slab-wise surfdata subsetting.")
+    parser.add_argument("--ni", type=int, default=300000, help="TES land gridcells")
+    parser.add_argument("--aoi-frac", type=float, default=0.05, help="fraction of gridcells inside the AOI")
+    parser.add_argument("--slab-size", type=int, default=DEFAULT_SLAB_BYTES, help="bytes per slab read")
+    parser.add_argument("--dir", default=None, help="scratch directory (default: a temporary directory)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        source_file = os.path.join(tmp, 'surfdata.synthetic.nc')
+        make_source(source_file, args.ni, rng)
+        with open(source_file, 'rb') as f:
+            while f.read(1 << 24):
+                pass  # warm the page cache for both runs alike
+        n_aoi = max(1, int(args.ni * args.aoi_frac))
+        # a regional AOI: one run of nearby cells, not every cell inside it
+        start = rng.integers(0, args.ni - 4 * n_aoi) if 4 * n_aoi < args.ni else 0
+        AOI_points = np.sort(rng.choice(np.arange(start, min(args.ni, start + 4 * n_aoi)), n_aoi, replace=False))
+        domain_idx = aoi_indices(np.arange(args.ni), AOI_points)
+
+        legacy = run(source_file, os.path.join(tmp, 'legacy.nc'), domain_idx, legacy_subset)
+        slab = run(source_file, os.path.join(tmp, 'slab.nc'), domain_idx,
+                   lambda s, d, idx: subset_variable(s, d, idx, args.slab_size))
+
+        print(f"gridcells={args.ni}, AOI cells={n_aoi}, slab size={args.slab_size / 2**20:.0f} MiB")
+        print(f"{'variable':20s} {'shape':>18s} {'legacy s':>9s} {'slab s':>8s} {'speedup':>8s}")
+        for name, _, lead in VARIABLES:
+            shape = tuple(dict(DIMS)[d] for d in lead) + (args.ni,)
+            print(f"{name:20s} {str(shape):>18s} {legacy[name]:9.3f} {slab[name]:8.3f} "
+                  f"{legacy[name] / slab[name]:8.1f}")
+        total_legacy, total_slab = sum(legacy.values()), sum(slab.values())
+        print(f"{'total':20s} {'':>18s} {total_legacy:9.3f} {total_slab:8.3f} {total_legacy / total_slab:8.1f}")
+        print(f"identical outputs: {same_outputs(os.path.join(tmp, 'legacy.nc'), os.path.join(tmp, 'slab.nc'))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,12 @@ os.makedirs(path)
 # Change to the new directory
 os.chdir(path)
 
+# Link the yearly/decadal files of aoi_consolidate.py when they exist
+forcing_dir = '../forcing_consolidated' if os.path.isdir('../forcing_consolidated') else '../forcing'
+print(f"Linking forcing files from {forcing_dir}")
+
 # Get a list of all files in the forcing directory and its subdirectories
-files = glob.glob('../forcing/**/*', recursive=True)
+files = glob.glob(forcing_dir + '/**/*', recursive=True)
 
 # Loop through the files
 for file in files:
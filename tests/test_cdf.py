@@ -0,0 +1,63 @@
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from aoi_cdf import MappedVariable, open_mapped
+
+COLUMNS = np.array([0, 3, 4, 17, 29])
+
+
+@pytest.fixture
+def classic_file(tmp_path):
+    path = str(tmp_path / 'forcing.nc')
+    rng = np.random.default_rng(0)
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', None)
+    ds.createDimension('nj', 1)
+    ds.createDimension('ni', 30)
+    ds.set_auto_maskandscale(False)
+    # packed int16 with _FillValue
+    packed = ds.createVariable('FSDS', 'i2', ('time', 'nj', 'ni'), fill_value=np.int16(-32767))
+    packed.scale_factor = np.float32(0.05)
+    packed.add_offset = np.float32(500.0)
+    raw = rng.integers(-30000, 30000, (6, 1, 30), dtype=np.int16)
+    raw[0, 0, :5] = -32767
+    packed[:] = raw
+    # float with _FillValue and a valid_range
+    filled = ds.createVariable('TBOT', 'f4', ('time', 'nj', 'ni'), fill_value=np.float32(1e20))
+    filled.valid_range = np.array([200.0, 330.0], dtype=np.float32)
+    values = rng.random((6, 1, 30), dtype=np.float32) * 150 + 190
+    values[1, 0, 3] = 1e20
+    filled[:] = values
+    # no _FillValue: the default fill is masked; scale_factor only
+    default = ds.createVariable('QBOT', 'f4', ('time', 'nj', 'ni'))
+    default.scale_factor = np.float32(2.0)
+    values = rng.random((6, 1, 30), dtype=np.float32)
+    values[2, 0, 4] = nc.default_fillvals['f4']
+    default[:] = values
+    ds.close()
+    return path
+
+
+@pytest.mark.parametrize('name', ['FSDS', 'TBOT', 'QBOT'])
+@pytest.mark.parametrize('mask_and_scale', [True, False])
+def test_read_columns_matches_netcdf4(classic_file, name, mask_and_scale):
+    src = nc.Dataset(classic_file)
+    src.set_auto_maskandscale(mask_and_scale)
+    mapped = open_mapped(classic_file)
+    try:
+        variable = MappedVariable(mapped, src[name], mask_and_scale)
+        expected = np.ma.getdata(src[name][1:5, :, COLUMNS])
+        data = variable.read_columns(1, 5, COLUMNS)
+        assert data.dtype == expected.dtype
+        assert np.array_equal(data, expected)
+        assert np.array_equal(variable[1:5, :, :], np.ma.getdata(src[name][1:5, :, :]))
+    finally:
+        mapped.close()
+        src.close()
+
+
+def test_open_mapped_rejects_netcdf4(tmp_path):
+    path = str(tmp_path / 'nc4.nc')
+    nc.Dataset(path, 'w', format='NETCDF4_CLASSIC').close()
+    assert open_mapped(path) is None
@@ -0,0 +1,51 @@
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from aoi_chunking import calibrate_chunk_size, chunk_size_for_budget, parse_size, read_dtype
+
+
+def test_parse_size():
+    assert parse_size('512M') == 512 << 20
+    assert parse_size('1.5GiB') == 3 << 29
+    assert parse_size('1000') == 1000
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_chunk_size_for_budget_is_bounded_by_the_time_axis():
+    # 4-byte values, 1000 cells, stream: (0 + 2) * 1000 * 5 + 10 * 4 bytes per step
+    assert chunk_size_for_budget((100, 1, 1000), np.float32, 10, 10040 * 7) == 7
+    assert chunk_size_for_budget((100, 1, 1000), np.float32, 10, 1 << 30) == 100
+    assert chunk_size_for_budget((100, 1, 1000), np.float32, 10, 1) == 1
+
+
+@pytest.fixture
+def forcing_file(tmp_path):
+    path = str(tmp_path / 'forcing.nc')
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', None)
+    ds.createDimension('nj', 1)
+    ds.createDimension('ni', 50)
+    packed = ds.createVariable('FSDS', 'i2', ('time', 'nj', 'ni'))
+    packed.scale_factor = np.float32(0.5)
+    packed[:] = np.arange(300 * 50).reshape(300, 1, 50) % 1000
+    ds.close()
+    return path
+
+
+def test_read_dtype_follows_the_packing(forcing_file):
+    src = nc.Dataset(forcing_file)
+    try:
+        assert read_dtype(src['FSDS']) == np.float32
+        assert read_dtype(src['FSDS'], raw=True) == np.int16
+    finally:
+        src.close()
+
+
+@pytest.mark.parametrize('slab_gap', [None, 0])
+def test_calibration_times_a_prefix(forcing_file, slab_gap):
+    best, timings = calibrate_chunk_size(forcing_file, np.array([3, 4, 30]), candidates=(4, 16, 64, 512),
+                                         slab_gap=slab_gap, max_steps=32)
+    assert sorted(timings) == [4, 16, 32]
+    assert best in timings
@@ -0,0 +1,81 @@
+import os
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+import aoi_consolidate
+from aoi_consolidate import STREAMS_TXT, consolidate_archive, plan_groups
+
+NAME = 'TN_clmforc.Daymet4.1km.1d.{var}.{period}.nc'
+
+
+def write_period(path, year, month, n_time=3, n_cells=4):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', None)
+    ds.createDimension('ni', n_cells)
+    ds.createVariable('gridID', 'i4', ('ni',))[:] = np.arange(n_cells)
+    time = ds.createVariable('time', 'f8', ('time',))
+    time.units = 'days since 1980-01-01'
+    start = (year - 1980) * 12 + month - 1
+    time[:] = start * 100 + np.arange(n_time)
+    ds.createVariable('TBOT', 'f4', ('time', 'ni'))[:] = start * 10 + np.arange(n_time * n_cells).reshape(n_time, n_cells)
+    ds.close()
+
+
+def test_plan_groups_by_year():
+    keys = [f"1980/{NAME.format(var='TBOT', period=p)}" for p in ('1980-02', '1980-01')]
+    keys.append(f"1980/{NAME.format(var='FSDS', period='1980-01')}")
+    keys.append('1980/TN_domain.lnd.nc')
+    groups = plan_groups(keys, 'year')
+    assert groups == {
+        f"1980/{NAME.format(var='FSDS', period='1980')}": [f"1980/{NAME.format(var='FSDS', period='1980-01')}"],
+        f"1980/{NAME.format(var='TBOT', period='1980')}": [f"1980/{NAME.format(var='TBOT', period='1980-01')}",
+                                                            f"1980/{NAME.format(var='TBOT', period='1980-02')}"],
+    }
+
+
+def test_plan_groups_decade_spans_year_subdirectories():
+    keys = [f"{y}/{NAME.format(var='TBOT', period=f'{y}-{m:02d}')}" for y in (1981, 1980, 1990) for m in (1, 2)]
+    groups = plan_groups(keys, 'decade')
+    assert list(groups) == [f"1980/{NAME.format(var='TBOT', period='1980-1989')}",
+                            f"1990/{NAME.format(var='TBOT', period='1990-1999')}"]
+    assert groups[f"1980/{NAME.format(var='TBOT', period='1980-1989')}"] == [
+        '1980/' + NAME.format(var='TBOT', period='1980-01'), '1980/' + NAME.format(var='TBOT', period='1980-02'),
+        '1981/' + NAME.format(var='TBOT', period='1981-01'), '1981/' + NAME.format(var='TBOT', period='1981-02')]
+
+
+def test_plan_groups_rejects_duplicate_periods():
+    keys = [f"{d}/{NAME.format(var='TBOT', period='1980-01')}" for d in ('a', 'b')]
+    with pytest.raises(ValueError, match='1980-01'):
+        plan_groups(keys, 'year')
+
+
+def test_plan_groups_rejects_link_name_collisions():
+    # two AOIs in one tree are linked under the same clmforc.Daymet.km.1d.<VAR>.<label>.nc name
+    keys = [NAME.format(var='TBOT', period='1980-01'), NAME.format(var='TBOT', period='1980-01').replace('TN_', 'PT_')]
+    with pytest.raises(ValueError, match='both be linked'):
+        plan_groups(keys, 'year')
+
+
+def test_consolidate_decade_over_year_subdirectories(tmp_path):
+    forcing_dir, out_dir = tmp_path / 'forcing', tmp_path / 'forcing_consolidated'
+    for year in (1980, 1981):
+        for month in (1, 2):
+            write_period(str(forcing_dir / str(year) / NAME.format(var='TBOT', period=f'{year}-{month:02d}')), year, month)
+
+    consolidate_archive(str(forcing_dir), str(out_dir), by='decade', chunk_size=2)
+
+    outputs = aoi_consolidate.source_files(str(out_dir))
+    assert outputs == [f"1980/{NAME.format(var='TBOT', period='1980-1989')}"]
+    ds = nc.Dataset(str(out_dir / outputs[0]))
+    try:
+        starts = [(y - 1980) * 12 + m - 1 for y in (1980, 1981) for m in (1, 2)]
+        assert np.array_equal(ds['time'][:], np.concatenate([s * 100 + np.arange(3) for s in starts]))
+        assert ds['TBOT'].shape == (12, 4)
+        assert np.array_equal(ds['TBOT'][3:6], 10 + np.arange(12).reshape(3, 4))
+    finally:
+        ds.close()
+    streams = (out_dir / STREAMS_TXT).read_text()
+    assert streams.count('clmforc.Daymet.km.1d.TBOT.1980-1989.nc') == 1
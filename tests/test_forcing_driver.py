@@ -0,0 +1,162 @@
+import glob
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+import TES_AOI_forcingGEN_mpi as forcing
+from aoi_cellstore import build_store
+from aoi_failures import failed_keys
+from aoi_tiles import tile_archive
+
+NCELLS, NSTEPS = 60, 20
+GRID_IDS = 1000 + np.random.default_rng(1).permutation(NCELLS)
+AOI_IDS = {'AAA': GRID_IDS[[3, 17, 4, 40, 58, 22, 9]], 'BBB': np.append(GRID_IDS[[17, 30, 31, 2]], 99)}
+
+
+def _write_source(path, var_name, seed):
+    rng = np.random.default_rng(seed)
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', None)
+    ds.createDimension('nj', 1)
+    ds.createDimension('ni', NCELLS)
+    ds.createVariable('time', 'f8', ('time',))[:] = np.arange(NSTEPS)
+    ds.createVariable('gridID', 'i4', ('nj', 'ni'))[:] = GRID_IDS.reshape(1, NCELLS)
+    if var_name == 'FSDS':
+        # packed, as in the archive
+        variable = ds.createVariable(var_name, 'i2', ('time', 'nj', 'ni'), fill_value=np.int16(-32767))
+        variable.scale_factor = np.float32(0.25)
+        variable.add_offset = np.float32(100)
+    else:
+        variable = ds.createVariable(var_name, 'f4', ('time', 'nj', 'ni'), fill_value=np.float32(-9999))
+    variable.units = 'K' if var_name == 'TBOT' else 'W/m2'
+    values = np.ma.masked_array(rng.uniform(0, 300, (NSTEPS, 1, NCELLS)).astype(np.float32))
+    values[5, 0, GRID_IDS == AOI_IDS['AAA'][1]] = np.ma.masked
+    variable[:] = values
+    ds.close()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    input_path = tmp_path / 'forcing'
+    for seed, var_name in enumerate(('TBOT', 'FSDS')):
+        os.makedirs(input_path / var_name)
+        for period in ('1980-01', '1980-02'):
+            _write_source(str(input_path / var_name / f'clmforc.Daymet.1km.1d.{var_name}.{period}.nc'),
+                          var_name, seed * 10 + int(period[-1]))
+    aoi_path = tmp_path / 'aoi'
+    os.makedirs(aoi_path)
+    for AOI, ids in AOI_IDS.items():
+        with open(aoi_path / f'{AOI}_gridID.csv', 'w') as f:
+            f.write('gridID\n' + ''.join(f'{i}\n' for i in ids))
+    return tmp_path
+
+
+def _run(monkeypatch, archive, output, *options, AOI='AAA'):
+    monkeypatch.setenv('FORCING_SERIAL_WORKERS', '1')
+    monkeypatch.setattr(sys, 'argv', ['TES_AOI_forcingGEN_mpi.py', str(archive / 'forcing'), str(output),
+                                      str(archive / 'aoi'), f'{AOI}_gridID.csv', '--no-telemetry',
+                                      '--retries', '0'] + [str(o) for o in options])
+    forcing.main()
+
+
+def _outputs(output):
+    return sorted(os.path.relpath(p, output) for p in glob.glob(os.path.join(output, '*', '*.nc')))
+
+
+def _assert_same_outputs(a, b):
+    names = _outputs(a)
+    assert names and names == _outputs(b)
+    for name in names:
+        A, B = nc.Dataset(os.path.join(a, name)), nc.Dataset(os.path.join(b, name))
+        try:
+            A.set_auto_maskandscale(False)
+            B.set_auto_maskandscale(False)
+            assert {k: len(d) for k, d in A.dimensions.items()} == {k: len(d) for k, d in B.dimensions.items()}
+            assert set(A.variables) == set(B.variables)
+            for v in A.variables:
+                assert A[v].dtype == B[v].dtype
+                assert {k: A[v].getncattr(k) for k in A[v].ncattrs()} == \
+                    {k: B[v].getncattr(k) for k in B[v].ncattrs()}
+                assert np.array_equal(A[v][...], B[v][...]), (name, v)
+        finally:
+            A.close()
+            B.close()
+
+
+def test_output_holds_the_aoi_cells(monkeypatch, archive):
+    _run(monkeypatch, archive, archive / 'out')
+    out = nc.Dataset(str(archive / 'out' / 'TBOT' / 'AAA_clmforc.Daymet.1km.1d.TBOT.1980-01.nc'))
+    src = nc.Dataset(str(archive / 'forcing' / 'TBOT' / 'clmforc.Daymet.1km.1d.TBOT.1980-01.nc'))
+    try:
+        idx = [int(np.flatnonzero(GRID_IDS == i)[0]) for i in out['gridID'][...].ravel()]
+        assert sorted(out['gridID'][...].ravel()) == sorted(AOI_IDS['AAA'])
+        assert np.ma.allequal(out['TBOT'][:, 0, :], src['TBOT'][:, 0, idx])
+    finally:
+        out.close()
+        src.close()
+
+
+def test_stream_and_staged_outputs_are_identical(monkeypatch, archive):
+    _run(monkeypatch, archive, archive / 'stream')
+    _run(monkeypatch, archive, archive / 'staged', '--write-mode', 'staged')
+    _run(monkeypatch, archive, archive / 'stage_dir', '--stage-dir', archive / 'node_local')
+    _assert_same_outputs(archive / 'stream', archive / 'staged')
+    _assert_same_outputs(archive / 'stream', archive / 'stage_dir')
+
+
+def test_aoi_list_matches_single_aoi_runs(monkeypatch, archive):
+    _run(monkeypatch, archive, archive / 'AAA')
+    _run(monkeypatch, archive, archive / 'BBB', AOI='BBB')
+    with open(archive / 'aoi_list.txt', 'w') as f:
+        f.write(f"# extra AOIs\n{archive / 'aoi' / 'BBB_gridID.csv'} {archive / 'multi_BBB'}\n")
+    _run(monkeypatch, archive, archive / 'multi_AAA', '--aoi-list', archive / 'aoi_list.txt')
+    _assert_same_outputs(archive / 'AAA', archive / 'multi_AAA')
+    _assert_same_outputs(archive / 'BBB', archive / 'multi_BBB')
+    assert os.path.exists(archive / 'multi_BBB' / 'BBB_missing_gridIDs.csv')
+
+
+@pytest.mark.parametrize('source', ['tiles', 'cell_store', 'mmap'])
+def test_other_readers_match_a_direct_read(monkeypatch, archive, source):
+    _run(monkeypatch, archive, archive / 'direct', '--slab-gap', '0')
+    if source == 'tiles':
+        tile_archive(str(archive / 'forcing'), str(archive / 'tiles'), block_size=16)
+        options = ['--tile-dir', archive / 'tiles']
+    elif source == 'cell_store':
+        build_store(str(archive / 'forcing'), str(archive / 'store'), cells_per_chunk=4)
+        options = ['--cell-store', archive / 'store', '--chunk-size', '8']
+    else:
+        options = ['--reader', 'mmap']
+    _run(monkeypatch, archive, archive / 'out', '--slab-gap', '0', *options)
+    _assert_same_outputs(archive / 'direct', archive / 'out')
+
+
+def test_second_run_skips_finished_files(monkeypatch, archive, capsys):
+    _run(monkeypatch, archive, archive / 'out')
+    mtimes = {name: os.stat(archive / 'out' / name).st_mtime_ns for name in _outputs(archive / 'out')}
+    capsys.readouterr()
+    _run(monkeypatch, archive, archive / 'out')
+    assert 'Skipping 4 of 4 files already complete in the manifest' in capsys.readouterr().out
+    assert {name: os.stat(archive / 'out' / name).st_mtime_ns for name in _outputs(archive / 'out')} == mtimes
+
+
+def test_rerun_failed_reruns_only_the_reported_files(monkeypatch, archive):
+    bad = archive / 'forcing' / 'TBOT' / 'clmforc.Daymet.1km.1d.TBOT.1980-02.nc'
+    os.replace(bad, archive / 'good.nc')
+    bad.write_bytes(b'not a netCDF file')
+    with pytest.raises(SystemExit) as failed:
+        _run(monkeypatch, archive, archive / 'out')
+    assert failed.value.code == 1
+    report = archive / 'out' / '.forcing_failures.json'
+    assert failed_keys(str(report)) == {('TBOT', bad.name)}
+
+    os.replace(archive / 'good.nc', bad)
+    mtimes = {name: os.stat(archive / 'out' / name).st_mtime_ns for name in _outputs(archive / 'out')}
+    assert len(mtimes) == 3
+    _run(monkeypatch, archive, archive / 'out', '--rerun-failed', '--force')
+    assert failed_keys(str(report)) == set()
+    assert {name: os.stat(archive / 'out' / name).st_mtime_ns for name in _outputs(archive / 'out')
+            if name in mtimes} == mtimes
+    assert os.path.join('TBOT', 'AAA_' + bad.name) in _outputs(archive / 'out')
@@ -0,0 +1,62 @@
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from aoi_cdf import MappedVariable, open_mapped
+from aoi_gather import gather_chunk, plan_slabs, read_slabs, slab_positions
+
+
+def test_plan_slabs_merges_small_gaps():
+    AOI_idx = np.array([2, 3, 5, 40, 41, 100])
+    # gaps of 1 cell (4 bytes) are read through, gaps of 34 and 58 cells are not
+    slabs = plan_slabs(AOI_idx, itemsize=4, gap_bytes=8)
+    assert slabs.tolist() == [[2, 6], [40, 42], [100, 101]]
+
+
+def test_plan_slabs_caps_the_number_of_slabs():
+    AOI_idx = np.array([0, 10, 12, 50, 52, 200])
+    slabs = plan_slabs(AOI_idx, itemsize=4, gap_bytes=0, max_slabs=3)
+    # only the two largest gaps (147 and 37 cells) stay breaks
+    assert slabs.tolist() == [[0, 13], [50, 53], [200, 201]]
+
+
+def test_plan_slabs_empty():
+    assert plan_slabs(np.array([], dtype=np.int64), 4, 0).shape == (0, 2)
+
+
+def test_slab_positions_index_the_concatenated_slabs():
+    AOI_idx = np.array([2, 3, 5, 40, 41, 100])
+    slabs = plan_slabs(AOI_idx, 4, 8)
+    full = np.arange(120) * 10
+    concatenated = np.concatenate([full[lo:hi] for lo, hi in slabs])
+    assert np.array_equal(concatenated[slab_positions(AOI_idx, slabs)], full[AOI_idx])
+
+
+@pytest.fixture
+def forcing_file(tmp_path):
+    path = str(tmp_path / 'forcing.nc')
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', None)
+    ds.createDimension('nj', 1)
+    ds.createDimension('ni', 64)
+    ds.createVariable('TBOT', 'f4', ('time', 'nj', 'ni'))[:] = np.arange(7 * 64, dtype=np.float32).reshape(7, 1, 64)
+    ds.close()
+    return path
+
+
+@pytest.mark.parametrize('gap_bytes', [0, 16, 1 << 20])
+def test_read_slabs_matches_a_full_width_gather(forcing_file, gap_bytes):
+    AOI_idx = np.array([1, 2, 9, 30, 31, 32, 63])
+    slabs = plan_slabs(AOI_idx, 4, gap_bytes)
+    positions = slab_positions(AOI_idx, slabs)
+    src = nc.Dataset(forcing_file)
+    mapped = open_mapped(forcing_file)
+    try:
+        expected = gather_chunk(src['TBOT'][2:6], AOI_idx)
+        for variable in (src['TBOT'], MappedVariable(mapped, src['TBOT'])):
+            data = read_slabs(variable, 2, 6, slabs)
+            assert data.shape == (4, 1, int((slabs[:, 1] - slabs[:, 0]).sum()))
+            assert np.array_equal(gather_chunk(data, positions), expected)
+    finally:
+        mapped.close()
+        src.close()
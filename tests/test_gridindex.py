@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+import aoi_gridindex
+from aoi_gridindex import GridIndex, gridid_fingerprint, load_grid_index, sidecar_path
+
+
+def reference_rows(grid_ids, AOI_points):
+    return np.where(np.isin(np.ravel(grid_ids), AOI_points))[0]
+
+
+@pytest.mark.parametrize('grid_ids', [
+    np.arange(1000) * 3 + 7,                      # sparse: sorted-array search
+    np.random.default_rng(0).permutation(1000),   # dense raster indices: direct-address table
+    np.array([5, 9, 5, 2, 9, 9, 11]),             # duplicated gridIDs
+])
+def test_rows_match_isin(grid_ids):
+    index = GridIndex.from_grid_ids(grid_ids.reshape(1, -1))
+    rng = np.random.default_rng(1)
+    AOI_points = np.concatenate([rng.choice(grid_ids, 20), [-4, 10 ** 9]])
+    assert np.array_equal(index.rows(AOI_points), reference_rows(grid_ids, AOI_points))
+
+
+def test_dense_table_is_used_for_raster_indices():
+    assert GridIndex.from_grid_ids(np.arange(100)[::-1])._table is not None
+    assert GridIndex.from_grid_ids(np.arange(100) * 10)._table is None
+
+
+@pytest.mark.parametrize('grid_ids', [np.arange(50) * 3, np.arange(50)])
+def test_missing(grid_ids):
+    index = GridIndex.from_grid_ids(grid_ids)
+    AOI_points = np.array([3, 4, 4, -1, 60, 147, 200])
+    expected = np.setdiff1d(AOI_points, grid_ids)
+    assert np.array_equal(index.missing(AOI_points), expected)
+
+
+def test_empty_index():
+    index = GridIndex.from_grid_ids(np.array([], dtype=np.int64))
+    assert index.rows([1, 2]).size == 0
+    assert index.missing([1, 2]).tolist() == [1, 2]
+
+
+def test_sidecar_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(aoi_gridindex, '_LOADED', {})
+    grid_ids = np.arange(200) * 5 + 1
+    base = str(tmp_path / 'domain.nc')
+    first = load_grid_index(grid_ids, base)
+    sidecar = sidecar_path(base, gridid_fingerprint(grid_ids))
+    assert os.path.exists(sidecar)
+
+    monkeypatch.setattr(aoi_gridindex, '_LOADED', {})
+    reloaded = load_grid_index(grid_ids, base)
+    assert reloaded is not first
+    assert np.array_equal(reloaded.rows([6, 11, 12]), [1, 2])
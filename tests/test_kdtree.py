@@ -0,0 +1,61 @@
+import os
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from aoi_kdtree import PointIndex, cache_path, load_point_index
+
+# cell centres on a 10 x 5 grid of unit spacing: x in [0, 9], y in [0, 4]
+CENTRES = np.stack(np.meshgrid(np.arange(10.0), np.arange(5.0)), axis=-1).reshape(-1, 2)
+
+
+def test_filter_outside_domain_and_nan():
+    index = PointIndex(cKDTree(CENTRES))
+    points = [(1.2, 2.9), (-0.5, 1.0), (3.0, 4.5), (np.nan, 1.0), (9.0, 0.0)]
+    kept, reasons, dist, rows = index.filter(points)
+    assert kept.tolist() == [True, False, False, False, True]
+    assert reasons.tolist() == ['', 'outside_domain', 'outside_domain', 'outside_domain', '']
+    assert rows.tolist() == [31, -1, -1, -1, 9]
+    assert np.isnan(dist[1:4]).all()
+    assert dist[4] == 0.0
+
+
+def test_filter_tolerance():
+    index = PointIndex(cKDTree(CENTRES))
+    kept, reasons, dist, rows = index.filter([(1.0, 1.1), (1.5, 1.5), (4.0, 2.0)], tolerance=0.2)
+    assert kept.tolist() == [True, False, True]
+    assert reasons.tolist() == ['', 'beyond_tolerance', '']
+    assert rows[1] >= 0 and dist[1] == pytest.approx(np.sqrt(0.5))
+
+
+def test_query_in_batches_matches_one_query():
+    index = PointIndex(cKDTree(CENTRES))
+    points = np.random.default_rng(0).random((37, 2)) * [9, 4]
+    dist, rows = index.query(points, batch=5)
+    expected_dist, expected_rows = cKDTree(CENTRES).query(points, k=1)
+    assert np.array_equal(rows, expected_rows)
+    assert np.allclose(dist, expected_dist)
+
+
+def test_cache_round_trip_and_rebuild(tmp_path, capsys):
+    domain = str(tmp_path / 'domain.nc')
+    ds = nc.Dataset(domain, 'w')
+    ds.createDimension('nj', 1)
+    ds.createDimension('ni', len(CENTRES))
+    ds.createVariable('xc', 'f8', ('nj', 'ni'))[:] = CENTRES[:, 0]
+    ds.createVariable('yc', 'f8', ('nj', 'ni'))[:] = CENTRES[:, 1]
+    ds.close()
+
+    built = load_point_index(domain)
+    assert os.path.exists(cache_path(domain, 'xc', 'yc'))
+    loaded = load_point_index(domain)
+    assert 'Loaded' in capsys.readouterr().out
+    assert loaded.bounds == built.bounds == ((0.0, 0.0), (9.0, 4.0))
+
+    with open(cache_path(domain, 'xc', 'yc'), 'wb') as f:
+        f.write(b'not a pickle')
+    rebuilt = load_point_index(domain)
+    assert 'rebuilding' in capsys.readouterr().out
+    assert np.array_equal(rebuilt.query([(2.2, 3.1)])[1], [32])
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from aoi_manifest import ForcingManifest
+
+
+@pytest.fixture
+def files(tmp_path):
+    source = tmp_path / 'clmforc.TBOT.1980-01.nc'
+    source.write_bytes(b'source')
+    output = tmp_path / 'out' / 'TN_clmforc.TBOT.1980-01.nc'
+    output.parent.mkdir()
+    output.write_bytes(b'output')
+    return str(source), str(output), str(tmp_path / 'out' / '.forcing_manifest')
+
+
+def test_resume_from_a_new_manifest(files):
+    source, output, manifest_dir = files
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1').record(source, output, 'layout-1')
+    # a later run reads the records back
+    assert ForcingManifest(manifest_dir, 'TN', 'aoi-1').is_current(source, output)
+
+
+def test_changed_source_is_not_current(files):
+    source, output, manifest_dir = files
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1').record(source, output)
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert not ForcingManifest(manifest_dir, 'TN', 'aoi-1').is_current(source, output)
+
+
+def test_other_aoi_or_missing_output_is_not_current(files):
+    source, output, manifest_dir = files
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1').record(source, output)
+    assert not ForcingManifest(manifest_dir, 'TN', 'aoi-2').is_current(source, output)
+    assert not ForcingManifest(manifest_dir, 'PT', 'aoi-1').is_current(source, output)
+    os.remove(output)
+    assert not ForcingManifest(manifest_dir, 'TN', 'aoi-1').is_current(source, output)
+
+
+def test_cataloged_stat_is_used_for_record_and_check(files):
+    source, output, manifest_dir = files
+    catalog_stat = {'size': 123, 'mtime_ns': 456}
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1').record(source, output, source_stat=catalog_stat)
+    manifest = ForcingManifest(manifest_dir, 'TN', 'aoi-1')
+    assert manifest.is_current(source, output, catalog_stat)
+    assert not manifest.is_current(source, output)  # the real stat differs from the catalog's
+
+
+def test_torn_line_is_ignored(files):
+    source, output, manifest_dir = files
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1').record(source, output)
+    with open(os.path.join(manifest_dir, 'TN.host.1.jsonl'), 'a') as f:
+        f.write('{"output": "trunc')
+    assert ForcingManifest(manifest_dir, 'TN', 'aoi-1').is_current(source, output)
+
+
+def test_other_output_options_are_not_current(files):
+    source, output, manifest_dir = files
+    options = {'raw': False, 'output_format': 'NETCDF3_64BIT', 'reader': 'netcdf4'}
+    ForcingManifest(manifest_dir, 'TN', 'aoi-1', options).record(source, output)
+    assert ForcingManifest(manifest_dir, 'TN', 'aoi-1', dict(options)).is_current(source, output)
+    assert not ForcingManifest(manifest_dir, 'TN', 'aoi-1', dict(options, raw=True)).is_current(source, output)
+    assert not ForcingManifest(manifest_dir, 'TN', 'aoi-1',
+                               dict(options, output_format='CDF5')).is_current(source, output)
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from aoi_catalog import walk_archive
+from TES_AOI_forcingGEN_mpi import _discover_tasks, _parse_years, _select_tasks, _split_list
+
+FILES = ['clmforc.Daymet4.1km.1d.{}.{}.nc'.format(var, period)
+         for var in ('TBOT', 'FSDS') for period in ('1980-01', '1980-07', '1981-01', '1999-12')]
+# a file without the var/period fields is dropped by every selector
+TASKS = [('in', f, 'out') for f in FILES + ['clmforc.extra.nc']]
+
+
+def selected(**selectors):
+    return [(t[1].split('.')[4], t[1].split('.')[5]) for t in _select_tasks(TASKS, **selectors)]
+
+
+def test_parse_years():
+    assert _parse_years('1980-1982, 1999') == {1980, 1981, 1982, 1999}
+    assert _split_list(' TBOT,,FSDS ') == ['TBOT', 'FSDS']
+
+
+def test_no_selector_keeps_every_task():
+    assert _select_tasks(TASKS) is TASKS
+
+
+def test_years():
+    assert selected(years={1980}) == [('TBOT', '1980-01'), ('TBOT', '1980-07'),
+                                      ('FSDS', '1980-01'), ('FSDS', '1980-07')]
+
+
+def test_periods_are_globs():
+    assert selected(periods=['*-01']) == [('TBOT', '1980-01'), ('TBOT', '1981-01'),
+                                          ('FSDS', '1980-01'), ('FSDS', '1981-01')]
+
+
+@pytest.mark.parametrize('selectors, expected', [
+    ({'variables': ['FSDS']}, [('FSDS', p) for p in ('1980-01', '1980-07', '1981-01', '1999-12')]),
+    ({'variables': ['TBOT'], 'years': {1981, 1999}, 'periods': ['*-12']}, [('TBOT', '1999-12')]),
+    ({'years': {2020}}, []),
+])
+def test_combined_selectors(selectors, expected):
+    assert selected(**selectors) == expected
+
+
+def test_discovery_skips_hidden_files_like_the_catalog(tmp_path):
+    for name in ('TBOT/' + FILES[0], 'TBOT/.' + FILES[1], '.cache/' + FILES[2], 'TBOT/notes.txt'):
+        path = tmp_path / 'in' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+    tasks = _discover_tasks(str(tmp_path / 'in'), str(tmp_path / 'out'))
+    assert [(os.path.basename(root), file) for root, file, _ in tasks] == [('TBOT', FILES[0])]
+    assert list(walk_archive(str(tmp_path / 'in'))) == [os.path.join('TBOT', FILES[0])]
@@ -0,0 +1,91 @@
+import os
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+from aoi_gather import create_variable_like
+from aoi_surfdata import copy_slabs, layer_slabs, subset_to_part, subset_variable
+
+DOMAIN_IDX = np.array([1, 4, 5, 11, 18])
+
+
+@pytest.fixture
+def surfdata(tmp_path):
+    path = str(tmp_path / 'surfdata.nc')
+    rng = np.random.default_rng(0)
+    ds = nc.Dataset(path, 'w', format='NETCDF3_64BIT')
+    ds.createDimension('time', 12)
+    ds.createDimension('lsmpft', 3)
+    ds.createDimension('gridcell', 20)
+    lai = ds.createVariable('MONTHLY_LAI', 'f4', ('time', 'lsmpft', 'gridcell'), fill_value=np.float32(-999))
+    values = rng.random((12, 3, 20), dtype=np.float32)
+    values[3, 1, 4] = -999  # masked on read
+    lai[:] = values
+    ds.createVariable('AREA', 'f8', ('gridcell',))[:] = rng.random(20)
+    ds.close()
+    return path
+
+
+def test_layer_slabs_cover_every_layer_once():
+    shape = (12, 3, 20)
+    for slab_bytes in (1, 3 * 80, 5 * 3 * 80, 1 << 30):
+        seen = np.zeros(shape[:-1], dtype=int)
+        for key in layer_slabs(shape, 80, slab_bytes):
+            seen[key] += 1
+        assert (seen == 1).all()
+    assert list(layer_slabs((20,), 80)) == [()]
+
+
+@pytest.mark.parametrize('slab_bytes', [1, 3 * 4 * 18, 1 << 30])
+def test_subset_variable_matches_the_per_layer_copy(surfdata, tmp_path, slab_bytes):
+    src = nc.Dataset(surfdata)
+    dst = nc.Dataset(str(tmp_path / 'aoi.nc'), 'w', format='NETCDF3_64BIT')
+    try:
+        dst.createDimension('time', 12)
+        dst.createDimension('lsmpft', 3)
+        dst.createDimension('gridcell', DOMAIN_IDX.size)
+        for name in ('MONTHLY_LAI', 'AREA'):
+            variable = src[name]
+            dst.createVariable(name, variable.dtype, variable.dimensions, fill_value=np.float32(-999))
+            subset_variable(variable, dst[name], DOMAIN_IDX, slab_bytes)
+        expected = src['MONTHLY_LAI'][..., DOMAIN_IDX]
+        assert np.ma.allequal(dst['MONTHLY_LAI'][...], expected)
+        assert np.array_equal(np.ma.getmaskarray(dst['MONTHLY_LAI'][...]), np.ma.getmaskarray(expected))
+        assert np.array_equal(dst['AREA'][...], src['AREA'][DOMAIN_IDX])
+    finally:
+        dst.close()
+        src.close()
+
+
+def _assemble(tmp_path, label, variable, raw, fill):
+    dst = nc.Dataset(str(tmp_path / (label + '.nc')), 'w', format='NETCDF3_64BIT')
+    dst.createDimension('time', 12)
+    dst.createDimension('lsmpft', 3)
+    dst.createDimension('gridcell', DOMAIN_IDX.size)
+    fill(create_variable_like(dst, 'MONTHLY_LAI', variable, raw=raw))
+    dst.set_auto_maskandscale(False)  # compare the bytes written
+    return dst
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_part_file_gives_the_serial_bytes(surfdata, tmp_path, raw):
+    parts_dir = str(tmp_path / 'parts')
+    os.makedirs(parts_dir)
+    name, part_file, _ = subset_to_part(surfdata, 'MONTHLY_LAI', DOMAIN_IDX, parts_dir, raw=raw, slab_bytes=100)
+    src = nc.Dataset(surfdata)
+    if raw:
+        src.set_auto_maskandscale(False)
+    part = nc.Dataset(part_file)
+    part.set_auto_maskandscale(False)
+    # serial: subset straight into the AOI file; parallel: copy the part raw
+    serial = _assemble(tmp_path, 'serial', src[name], raw,
+                       lambda v: subset_variable(src[name], v, DOMAIN_IDX, slab_bytes=100))
+    parallel = _assemble(tmp_path, 'parallel', src[name], raw, lambda v: copy_slabs(part[name], v, slab_bytes=100))
+    try:
+        assert np.array_equal(parallel[name][...], serial[name][...])
+    finally:
+        parallel.close()
+        serial.close()
+        part.close()
+        src.close()